@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Python interface to hdtv, bypassing the command line
+
+An Analysis works on the Session, Spectrum and Fit objects directly. Its
+methods take positions (calibrated, like the markers) instead of command
+strings, print nothing and return the results as dicts of ufloats:
+
+    from hdtv.api import Analysis
+
+    ana = Analysis()
+    sid = ana.LoadSpectrum("run001.spc")
+    ana.Calibrate(sid, [0.0, 0.5])
+    result = ana.Fit(sid, region=(1160.0, 1185.0), peaks=[1173.2])
+    vol = result["peaks"][0]["vol"]
+"""
+
+import ROOT
+
+import hdtv.cal
+import hdtv.cmdline
+import hdtv.color
+import hdtv.session
+import hdtv.util
+
+from hdtv.cut import Cut
+from hdtv.fit import Fit
+from hdtv.fitter import Fitter
+from hdtv.histogram import FileHistogram, MHisto2D
+from hdtv.integral import Integrate
+from hdtv.matrix import Matrix
+from hdtv.spectrum import Spectrum
+
+
+class Analysis(object):
+    """
+    Load, calibrate, fit, integrate and gate spectra of a session without
+    display. If no session is given, a new headless session is created.
+    """
+
+    def __init__(self, spectra=None):
+        if spectra is None:
+            ROOT.gROOT.SetBatch(True)
+            hdtv.util.use_dummy_display()
+            spectra = hdtv.session.Session(headless=True)
+        self.spectra = spectra
+
+    def _GetSpectrum(self, sid):
+        if not isinstance(sid, hdtv.util.ID):
+            sid = hdtv.util.ID(sid)
+        try:
+            return self.spectra.dict[sid]
+        except KeyError:
+            raise hdtv.cmdline.HDTVCommandError("There is no spectrum with id %s" % sid)
+
+    def _Insert(self, spec, ID=None):
+        sid = self.spectra.Insert(spec, ID)
+        spec.color = hdtv.color.ColorForID(sid.major)
+        return sid
+
+    def LoadSpectrum(self, fname, fmt=None, ID=None):
+        """
+        Load a spectrum from fname and return its ID. A calibration
+        of a spectrum with the same name is applied.
+        """
+        spec = Spectrum(FileHistogram(fname, fmt))
+        sid = self._Insert(spec, ID)
+        if spec.name in self.spectra.caldict:
+            spec.cal = self.spectra.caldict[spec.name]
+        return sid
+
+    def LoadMatrix(self, fname, sym=True):
+        """
+        Load a matrix and return the IDs of its projections (only the x
+        projection for symmetric matrices), which can be gated with Gate
+        """
+        matrix = Matrix(MHisto2D(fname, sym), sym, self.spectra.viewport)
+        matrix.ID = self.spectra.GetFreeID()
+        matrix.color = hdtv.color.ColorForID(matrix.ID.major)
+        ids = [self.spectra.Insert(matrix.xproj, hdtv.util.ID(matrix.ID.major, 1000))]
+        if not sym:
+            ids.append(
+                self.spectra.Insert(matrix.yproj, hdtv.util.ID(matrix.ID.major, 1001))
+            )
+        return ids
+
+    def Calibrate(self, sid, cal):
+        """
+        Apply the calibration cal (a list of polynomial coefficients or a
+        calibration object) to spectrum sid
+        """
+        spec = self._GetSpectrum(sid)
+        cal = hdtv.cal.MakeCalibration(cal)
+        self.spectra.caldict[spec.name] = cal
+        spec.cal = cal
+
+    def CalibrateFromPairs(self, sid, pairs, degree=1, ignore_errors=False):
+        """
+        Fit a calibration polynomial of degree to (channel, energy) pairs,
+        apply it to spectrum sid and return its coefficients and chi²
+        """
+        fitter = hdtv.cal.CalibrationFitter()
+        for (channel, energy) in pairs:
+            fitter.AddPair(channel, energy)
+        fitter.FitCal(degree, ignore_errors=ignore_errors)
+        self.Calibrate(sid, fitter.calib)
+        return {"coeffs": hdtv.cal.GetCoeffs(fitter.calib), "chi2": fitter.chi2}
+
+    def _MakeFit(self, spec, region, peaks=(), bg=(), fitter=None):
+        if fitter is None:
+            fitter = Fitter(peakModel="theuerkauf", backgroundModel="polynomial")
+        fit = Fit(fitter, cal=spec.cal)
+        for pos in region:
+            fit.ChangeMarker("region", pos, "set")
+        for pos in peaks:
+            fit.ChangeMarker("peak", pos, "set")
+        for (p1, p2) in bg:
+            fit.ChangeMarker("bg", p1, "set")
+            fit.ChangeMarker("bg", p2, "set")
+        fit.spec = spec
+        return fit
+
+    def Fit(
+        self,
+        sid,
+        region,
+        peaks,
+        bg=(),
+        peakModel="theuerkauf",
+        backgroundModel="polynomial",
+        store=False,
+        **params,
+    ):
+        """
+        Fit peaks at positions peaks in region (a pair of positions) of
+        spectrum sid. bg is a list of background regions, and params sets
+        the status of fit parameters (e.g. width="equal", background=2).
+
+        Returns a dict with the ID of the fit (if it is stored in the
+        spectrum), chi² and background parameters of the fit, the fitted
+        parameters of each peak and the integrals of the region.
+        """
+        spec = self._GetSpectrum(sid)
+        fitter = Fitter(peakModel, backgroundModel)
+        for (name, status) in params.items():
+            fitter.SetParameter(name, status)
+        fit = self._MakeFit(spec, region, peaks, bg, fitter)
+        fit.FitPeakFunc(spec)
+        fit.integral = Integrate(spec, fitter.bgFitter, self._Region(fit))
+        ID = None
+        if store:
+            ID = spec.Insert(fit)
+        return {
+            "id": ID,
+            "chi": fit.chi,
+            "bgchi": fit.bgChi,
+            "bg": list(fit.bgParams),
+            "peaks": [self._PeakResult(fit, peak) for peak in fit.peaks],
+            "integrals": fit.integral,
+        }
+
+    @staticmethod
+    def _Region(fit):
+        return [fit.regionMarkers[0].p1.pos_uncal, fit.regionMarkers[0].p2.pos_uncal]
+
+    @staticmethod
+    def _PeakResult(fit, peak):
+        """
+        Parameters of a fitted peak, calibrated where possible (see
+        Fit.ExtractParams)
+        """
+        result = {"channel": peak.pos}
+        for p in fit.fitter.peakModel.fValidParStatus.keys():
+            result[p] = getattr(peak, p + "_cal", getattr(peak, p, None))
+        result.update(peak.extras)
+        return result
+
+    def Integrate(self, sid, region, bg=(), backgroundModel="polynomial", **params):
+        """
+        Integrate region of spectrum sid, subtracting a background fitted
+        to the background regions bg (if any). params sets the status of
+        the background parameters (e.g. background=1).
+
+        Returns the "tot", "bg" and "sub" integrals (see
+        hdtv.integral.Integrate).
+        """
+        spec = self._GetSpectrum(sid)
+        fitter = Fitter("theuerkauf", backgroundModel)
+        for (name, status) in params.items():
+            fitter.SetParameter(name, status)
+        fit = self._MakeFit(spec, region, bg=bg, fitter=fitter)
+        if fit.HasExternalBackground():
+            fit.FitBgFunc(spec)
+        return Integrate(spec, fitter.bgFitter, self._Region(fit))
+
+    def Gate(self, sid, region, bg=()):
+        """
+        Gate on region (a pair of positions) of the matrix projection sid,
+        subtracting the background regions bg, and return the ID of the
+        resulting spectrum
+        """
+        proj = self._GetSpectrum(sid)
+        if getattr(proj, "matrix", None) is None:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Spectrum %s does not belong to a matrix" % sid
+            )
+        cut = Cut(cal=proj.cal)
+        for pos in region:
+            cut.SetMarker("region", pos)
+        for (p1, p2) in bg:
+            cut.SetMarker("bg", p1)
+            cut.SetMarker("bg", p2)
+        spec = cut.ExecuteCut(proj.matrix, proj.axis)
+        if spec is None:
+            raise hdtv.cmdline.HDTVCommandError("Invalid gate region %s" % (region,))
+        return self._Insert(spec)
@@ -27,6 +27,9 @@ This is the main HDTV application.
 import sys
 import os
 import glob
+import importlib
+import time
+from contextlib import contextmanager
 from pathlib import Path
 import argparse
 
@@ -53,8 +56,56 @@ def check_root_version():
         exit(1)
 
 
+class StartupProfile(object):
+    """
+    Wall-clock time of the steps of the startup (see --profile-startup)
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = list()
+
+    @contextmanager
+    def __call__(self, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((step, time.perf_counter() - start))
+
+    def Report(self):
+        import hdtv.ui
+        import hdtv.util
+
+        total = time.perf_counter() - self.start
+        rows = [
+            {
+                "step": step,
+                "time": "%.1f" % (1e3 * t),
+                "share": "%.1f" % (100 * t / total),
+            }
+            for (step, t) in self.steps
+        ]
+        rows.append(
+            {
+                "step": "other",
+                "time": "%.1f" % (1e3 * (total - sum(t for (_, t) in self.steps))),
+                "share": "",
+            }
+        )
+        table = hdtv.util.Table(
+            rows,
+            ["step", "time", "share"],
+            header=["step", "time [ms]", "share [%]"],
+        )
+        hdtv.ui.msg(html=str(table), end="")
+        hdtv.ui.msg("Startup took %.1f ms" % (1e3 * total))
+
+
 class App:
     def __init__(self):
+        profile = StartupProfile()
+
         # Reset command line arguments so that ROOT does not stumble about them
         hdtv_args = sys.argv[1:]
         sys.argv = [sys.argv[0]]
@@ -102,7 +153,8 @@ class App:
         sys.path.append(str(self.configpath))
         sys.path.append(str(self.configpath / "plugins"))
 
-        args = self.parse_args(hdtv_args)
+        with profile("parse arguments"):
+            args = self.parse_args(hdtv_args)
 
         if args.rebuildusr is not None:
             import hdtv.rootext.dlmgr
@@ -120,63 +172,77 @@ class App:
         if args.rebuildusr or args.rebuildsys:
             sys.exit(0)
 
-        check_root_version()
+        with profile("import ROOT"):
+            check_root_version()
+
+        if args.headless:
+            import hdtv.util
+
+            # Nothing is drawn, so the display library is not even loaded
+            hdtv.util.use_dummy_display()
 
         # Import core modules
-        import hdtv.cmdline
-        import hdtv.session
-        import hdtv.ui
+        with profile("import core modules"):
+            import hdtv.cmdline
+            import hdtv.session
+            import hdtv.ui
 
         hdtv.cmdline.SetHistory(self.datapath / "hdtv_history")
         hdtv.cmdline.SetInteractiveDict(locals())
-        spectra = hdtv.session.Session()
+
+        # startup.hdtv and startup.hdtv.d/*.hdtv for user configuration
+        # in "hdtv" language
+        startup_d_hdtv = [self.configpath / "startup.hdtv"] + list(
+            (self.configpath / "startup.hdtv.d").glob("*.hdtv")
+        )
+
+        if args.headless:
+            self.run_headless(args, profile, startup_d_hdtv)
+            return
+
+        with profile("create session"):
+            spectra = hdtv.session.Session()
         import __main__
 
         __main__.spectra = spectra
 
-        # Import core plugins
-        import hdtv.plugins.textInterface
-        import hdtv.plugins.ls
-        import hdtv.plugins.run
-        import hdtv.plugins.specInterface
-        import hdtv.plugins.fitInterface
-        import hdtv.plugins.calInterface
-        import hdtv.plugins.matInterface
-        import hdtv.plugins.rootInterface
-        import hdtv.plugins.config
-        import hdtv.plugins.fitlist
-        import hdtv.plugins.fittex
-        import hdtv.plugins.fitmap
-        import hdtv.plugins.dblookup
-        import hdtv.plugins.peakfinder
-        import hdtv.plugins.printing
+        # Import core plugins; the others are imported when one of their
+        # commands is used for the first time
+        import hdtv.plugins
+
+        for module in hdtv.plugins.EagerPlugins():
+            with profile("import " + module):
+                importlib.import_module(module)
+        with profile("declare lazy commands"):
+            hdtv.plugins.DeclareLazyCommands()
 
         hdtv.ui.msg("HDTV - Nuclear Spectrum Analysis Tool")
 
         # Execute startup.py for user configuration in python
         try:
-            import startup
+            with profile("startup.py"):
+                import startup
         except ImportError:
             hdtv.ui.debug("No startup.py file")
 
         # Execute startup.hdtv and startup.hdtv.d/*.hdtv
-        # for user configuration in "hdtv" language
-        startup_d_hdtv = [self.configpath / "startup.hdtv"] + list(
-            (self.configpath / "startup.hdtv.d").glob("*.hdtv")
-        )
-
         for startup_hdtv in startup_d_hdtv:
             try:
                 if os.path.exists(startup_hdtv):
-                    hdtv.cmdline.command_line.ExecCmdfile(startup_hdtv)
+                    with profile(startup_hdtv.name):
+                        hdtv.cmdline.command_line.ExecCmdfile(startup_hdtv)
             except IOError as msg:
                 hdtv.ui.error("Error reading %s: %s" % (startup_hdtv, msg))
 
+        if args.profile_startup:
+            profile.Report()
+
         self.run_batchfile(args)
         self.run_commands(args)
 
         hdtv.cmdline.MainLoop()
-        hdtv.plugins.rootInterface.r.rootfile = None
+        if "hdtv.plugins.rootInterface" in sys.modules:
+            hdtv.plugins.rootInterface.r.rootfile = None
         hdtv.cmdline.command_tree.SetDefaultLevel(1)
 
     def parse_args(self, args):
@@ -210,8 +276,68 @@ class App:
             dest="rebuildsys",
             help="Rebuild ROOT-loadable libraries for all users",
         )
+        parser.add_argument(
+            "--headless",
+            action="store_true",
+            help="Execute the batchfile and commands without graphical "
+            "user interface and exit",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Run independent per-spectrum blocks of the batchfile in "
+            "JOBS worker processes (headless mode only, 0: one per CPU)",
+        )
+        parser.add_argument(
+            "--shard",
+            metavar="K/N",
+            help="Run only the K-th of N parts of the per-spectrum blocks of "
+            "the batchfile (headless mode only)",
+        )
+        parser.add_argument(
+            "--profile-startup",
+            action="store_true",
+            dest="profile_startup",
+            help="Show the time taken by the steps of the startup",
+        )
         return parser.parse_args(args)
 
+    def run_headless(self, args, profile, startup):
+        """
+        Execute batchfile and commands in a headless session, without
+        any graphical user interface and interactive prompt
+        """
+        import hdtv.batch
+        import hdtv.cmdline
+        import hdtv.ui
+
+        hdtv.ui.SetUI(hdtv.ui.BatchUI())
+        try:
+            shard = hdtv.batch.ParseShard(args.shard) if args.shard else None
+        except ValueError as msg:
+            hdtv.ui.error(str(msg))
+            sys.exit(1)
+
+        startup = [fname for fname in startup if os.path.exists(fname)]
+        with profile("create headless session"):
+            hdtv.batch.InitSession(startup)
+        if args.profile_startup:
+            profile.Report()
+
+        try:
+            if args.batchfile is not None:
+                hdtv.batch.RunBatchfile(
+                    args.batchfile, nprocs=args.jobs, shard=shard, startup=startup
+                )
+        except IOError as msg:
+            hdtv.ui.error("Error reading %s: %s" % (args.batchfile, msg))
+        except hdtv.cmdline.HDTVCommandError as msg:
+            hdtv.ui.error(str(msg))
+            sys.exit(1)
+        self.run_commands(args)
+
     def run_commands(self, args):
         """Execute commands given on command line"""
         import hdtv.cmdline
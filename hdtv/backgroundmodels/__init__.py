@@ -1,9 +1,11 @@
 from .exponential import BackgroundModelExponential
 from .polynomial import BackgroundModelPolynomial
 from .interpolation import BackgroundModelInterpolation
+from .snip import BackgroundModelSNIP
 
 # dictionary of available background models
 BackgroundModels = dict()
 BackgroundModels["exponential"] = BackgroundModelExponential
 BackgroundModels["polynomial"] = BackgroundModelPolynomial
 BackgroundModels["interpolation"] = BackgroundModelInterpolation
+BackgroundModels["snip"] = BackgroundModelSNIP
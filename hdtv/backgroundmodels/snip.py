@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+
+import ROOT
+from .background import BackgroundModel
+
+
+class BackgroundModelSNIP(BackgroundModel):
+    """
+    SNIP background model
+
+    Uses the continuum of the whole spectrum, as estimated by the SNIP
+    algorithm, as external background. No background regions are needed.
+    """
+
+    def __init__(self):
+        super(BackgroundModelSNIP, self).__init__()
+        self.fParStatus = {"nparams": 0}
+        self.fValidParStatus = {"nparams": [int]}
+
+        self.ResetParamStatus()
+        self.name = "snip"
+        self.requiredBgRegions = 0
+
+    def ResetParamStatus(self):
+        """
+        Reset parameter status to defaults
+        """
+        self.fParStatus["nparams"] = 0
+
+    def GetFitter(self, integrate, likelihood, nparams=None, nbg=None):
+        """
+        Creates a C++ Fitter object, which can then do the real work
+        integrate, likelihood and nparams are ignored (the continuum has
+        no free parameters)
+        """
+        self.fFitter = ROOT.HDTV.Fit.SnipBg()
+        self.ResetGlobalParams()
+        return self.fFitter
+
+    def GetContinuum(self, spec):
+        """
+        Return the continuum of spec, estimating it with default settings
+        if this has not been done before for its current calibration
+        """
+        return spec.hist.GetContinuum()
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Headless processing of batch files
+
+A batch file is split into a preamble and blocks, each of which starts with
+a "spectrum get" command. If the blocks only work on the spectra they load,
+consecutive blocks can be run in parallel worker processes, each of which
+executes the preamble and its blocks in a fresh headless session.
+"""
+
+import importlib
+import io
+import multiprocessing
+import os
+from functools import partial
+
+import ROOT
+
+import hdtv.cmdline
+import hdtv.plugins
+import hdtv.session
+import hdtv.ui
+import hdtv.util
+
+BLOCK_START = "spectrum get"
+
+# Commands (and their subcommands) that only work on the active spectrum
+# or on files, if no other spectrum is selected
+BLOCK_COMMANDS = [
+    "spectrum get",
+    "fit marker",
+    "fit execute",
+    "fit store",
+    "fit clear",
+    "fit activate",
+    "fit delete",
+    "fit show",
+    "fit hide",
+    "fit list",
+    "fit integral",
+    "fit peakfind",
+    "fit position",
+    "fit read",
+    "fit write",
+    "fit tex",
+    "calibration position set",
+    "calibration position unset",
+    "calibration position assign",
+    "calibration position recalibrate",
+    "ls",
+    "pwd",
+]
+
+
+def InitSession(cmdfiles=()):
+    """
+    Create a headless session with all core plugins, and run startup.py
+    and the startup command files cmdfiles
+    """
+    ROOT.gROOT.SetBatch(True)
+    hdtv.util.use_dummy_display()
+
+    import __main__
+
+    __main__.spectra = hdtv.session.Session(headless=True)
+    for module in hdtv.plugins.EagerPlugins(headless=True):
+        importlib.import_module(module)
+    hdtv.plugins.DeclareLazyCommands()
+
+    try:
+        import startup
+    except ImportError:
+        hdtv.ui.debug("No startup.py file")
+    for fname in cmdfiles:
+        hdtv.cmdline.command_line.ExecCmdfile(fname)
+    return __main__.spectra
+
+
+def _Commands(line):
+    """
+    Returns the full titles and arguments of the commands in line, or None
+    if line is no hdtv command line
+    """
+    (cmd_type, cmd) = hdtv.cmdline.command_line.Unescape(line)
+    if cmd_type != hdtv.cmdline.CMDType.hdtv:
+        return None
+    commands = list()
+    for path in hdtv.util.SplitCmdlines(cmd)[0]:
+        if not path:
+            continue
+        try:
+            (node, args) = hdtv.cmdline.command_tree.ResolveCommand(list(path))
+        except hdtv.cmdline.HDTVCommandError:
+            node = None
+        if node is None or node is hdtv.cmdline.command_tree:
+            commands.append((None, path, None))
+        else:
+            commands.append((node.FullTitle(), args, node))
+    return commands
+
+
+def _SelectsSpectra(node, args):
+    """
+    Check if a command works on other spectra than the active one
+    """
+    if node.module is not None:
+        hdtv.cmdline.command_tree.LoadCommand(node)
+    parser = node.options.get("parser")
+    if parser is None:
+        return False
+    dests = [
+        action.dest
+        for action in parser._actions
+        if "--spectrum" in action.option_strings
+    ]
+    if not dests:
+        return False
+    try:
+        args = parser.parse_args(args)
+    except (hdtv.cmdline.HDTVCommandError, hdtv.cmdline.HDTVCommandAbort):
+        return True
+    return getattr(args, dests[0]) != "active"
+
+
+def _Dependency(commands):
+    """
+    Returns why the commands of a block line may depend on other blocks,
+    or None
+    """
+    if commands is None:
+        return "it is no hdtv command"
+    for (title, args, node) in commands:
+        if title is None:
+            return "%s is no known command" % " ".join(args)
+        if title == "spectrum delete" and args == ["all"]:
+            continue
+        if not any(title == c or title.startswith(c + " ") for c in BLOCK_COMMANDS):
+            return "%s may depend on or change other spectra" % title
+        if title != BLOCK_START and _SelectsSpectra(node, list(args)):
+            return "%s selects other spectra" % title
+    return None
+
+
+# Commands that reset the session to its state after the preamble
+RESET_COMMANDS = [("fit clear", []), ("spectrum delete", ["all"])]
+
+
+def SplitBlocks(lines):
+    """
+    Split the lines of a batch file into a preamble and blocks, each of
+    which starts with "spectrum get". Returns (preamble, blocks, reason),
+    where reason tells why the blocks cannot be run independently of each
+    other, or is None if they can.
+
+    Blocks are independent if they only use the commands in BLOCK_COMMANDS
+    without selecting other spectra, and if each block but the last ends
+    with "fit clear" and "spectrum delete all" (the markers of the work fit
+    are kept after storing it), so that the next one starts like the first.
+    """
+    preamble = list()
+    blocks = list()
+    reason = None
+    resets = list()
+    for line in lines:
+        commands = _Commands(line)
+        if commands and commands[0][0] == BLOCK_START:
+            if blocks and reason is None and len(resets) < len(RESET_COMMANDS):
+                reason = 'block %d does not end with "%s"' % (
+                    len(blocks),
+                    "; ".join(
+                        " ".join([title] + args) for (title, args) in RESET_COMMANDS
+                    ),
+                )
+            resets = list()
+            blocks.append(list())
+        if not blocks:
+            preamble.append(line)
+            if commands and any(title == "python" for (title, _, _) in commands):
+                reason = "the preamble switches to Python mode"
+            continue
+        blocks[-1].append(line)
+        if reason is None:
+            dependency = _Dependency(commands)
+            if dependency:
+                reason = "%s: %s" % (line.strip(), dependency)
+        for (title, args, _) in commands or [(None, None, None)]:
+            if (title, args) not in RESET_COMMANDS:
+                resets = list()
+            elif (title, args) not in resets:
+                resets.append((title, args))
+    return (preamble, blocks, reason)
+
+
+def ParseShard(shard):
+    """
+    Parse a shard given as "K/N" (the K-th of N parts, counting from 1)
+    """
+    try:
+        (k, n) = [int(part) for part in shard.split("/")]
+    except ValueError:
+        raise ValueError("Invalid shard %s, expected K/N" % shard)
+    if not 1 <= k <= n:
+        raise ValueError("Invalid shard %s, expected 1 <= K <= N" % shard)
+    return (k, n)
+
+
+def _Split(items, n):
+    """
+    Split items into n parts of consecutive items with nearly equal length
+    """
+    (size, rest) = divmod(len(items), n)
+    parts = list()
+    start = 0
+    for i in range(n):
+        stop = start + size + (1 if i < rest else 0)
+        parts.append(items[start:stop])
+        start = stop
+    return parts
+
+
+def _RunLines(job, startup=()):
+    """
+    Worker: run the lines of job = (preamble, lines, quiet) in a new
+    headless session and return the output (without that of the preamble
+    if quiet)
+    """
+    (preamble, lines, quiet) = job
+    out = io.StringIO()
+    hdtv.ui.SetUI(hdtv.ui.BatchUI(out, out))
+    InitSession(startup)
+    hdtv.cmdline.command_line.ExecLines(preamble)
+    if quiet:
+        out.seek(0)
+        out.truncate()
+    hdtv.cmdline.command_line.ExecLines(lines)
+    return out.getvalue()
+
+
+def RunBatchfile(fname, nprocs=1, shard=None, startup=()):
+    """
+    Run a batch file in the current (headless) session. With nprocs > 1,
+    independent blocks are run in nprocs worker processes, which repeat
+    startup. With shard = (K, N), only the K-th of N parts of the blocks is
+    run, so that large batch files can be distributed over several nodes.
+    """
+    hdtv.ui.msg("Execute file: %s" % fname)
+    file = hdtv.util.TxtFile(fname)
+    file.read()
+    (preamble, blocks, reason) = SplitBlocks(file.lines)
+
+    if shard is not None:
+        if reason is not None:
+            raise hdtv.cmdline.HDTVCommandError("Cannot split %s: %s" % (fname, reason))
+        (k, n) = shard
+        blocks = _Split(blocks, n)[k - 1]
+    nprocs = min(nprocs or os.cpu_count() or 1, len(blocks))
+    if nprocs > 1 and reason is not None:
+        hdtv.ui.info("Running %s serially, since %s" % (fname, reason))
+        nprocs = 1
+
+    if nprocs <= 1:
+        hdtv.cmdline.command_line.ExecLines(
+            preamble + [line for block in blocks for line in block]
+        )
+        return
+
+    # The output of the preamble is only shown once
+    jobs = [
+        (preamble, [line for block in part for line in block], i > 0)
+        for (i, part) in enumerate(_Split(blocks, nprocs))
+    ]
+    # Each part needs a fresh session, thus a fresh process
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        nprocs, initializer=hdtv.util.use_dummy_display, maxtasksperchild=1
+    ) as pool:
+        for out in pool.imap(partial(_RunLines, startup=list(startup)), jobs):
+            hdtv.ui.ui.stdout.write(out)
@@ -22,6 +22,8 @@
 from array import array
 from html import escape
 
+import numpy as np
+
 import ROOT
 import hdtv.util
 
@@ -50,6 +52,28 @@ def GetCoeffs(cal):
     return list(cal.GetCoeffs())
 
 
+def Ch2EArray(cal, channels):
+    """
+    Convert an array of channels to energies (vectorized version of Ch2E)
+    """
+    channels = np.asarray(channels, dtype=float)
+    if cal is None or cal.IsTrivial():
+        return channels
+    return np.polynomial.polynomial.polyval(channels, GetCoeffs(cal))
+
+
+def dEdChArray(cal, channels):
+    """
+    Derivative of the calibration for an array of channels (vectorized
+    version of dEdCh)
+    """
+    channels = np.asarray(channels, dtype=float)
+    if cal is None or cal.IsTrivial():
+        return np.ones_like(channels)
+    deriv = np.polynomial.polynomial.polyder(GetCoeffs(cal))
+    return np.polynomial.polynomial.polyval(channels, deriv)
+
+
 def PrintCal(cal):
     """
     Get the calibration as string
@@ -57,6 +81,41 @@ def PrintCal(cal):
     return "   ".join([str(c) for c in GetCoeffs(cal)])
 
 
+def FitPolynomial(channels, energies, degree, errors=None):
+    """
+    Fit a calibration polynomial to channels and energies by (weighted)
+    linear least squares with numpy. If degree == 0, the linear coefficient
+    is fixed at 1 (as in CalibrationFitter.FitCal). Without errors of the
+    energies, all weights are 1.
+
+    Returns the coefficients (starting with p0) and chi^2.
+    """
+    if degree < 0:
+        raise ValueError("Degree cannot be negative")
+    channels = np.asarray(channels, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    if len(channels) < degree + 1:
+        raise RuntimeError(
+            "You must specify at least as many channel/energy pairs as there are free parameters"
+        )
+
+    if degree == 0:
+        A = np.ones((len(channels), 1))
+        y = energies - channels
+    else:
+        A = np.polynomial.polynomial.polyvander(channels, degree)
+        y = energies
+    if errors is not None:
+        weights = 1.0 / np.asarray(errors, dtype=float)
+        A = A * weights[:, np.newaxis]
+        y = y * weights
+    coeffs = np.linalg.lstsq(A, y, rcond=None)[0]
+    chi2 = float(np.sum((A @ coeffs - y) ** 2))
+    if degree == 0:
+        coeffs = np.append(coeffs, 1.0)
+    return (list(coeffs), chi2)
+
+
 class CalibrationFitter:
     """
     Fit a calibration polynom to a list of channel/energy pairs.
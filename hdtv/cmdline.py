@@ -39,6 +39,7 @@ from enum import Enum, auto
 import re
 import glob
 import asyncio
+import importlib
 
 from prompt_toolkit.shortcuts import PromptSession, CompleteStyle, clear
 from prompt_toolkit.completion import Completer, Completion
@@ -100,6 +101,8 @@ class HDTVCommandTreeNode(object):
         self.level = level
         self.command = None
         self.params = None
+        # Plugin module to import, for commands declared by AddLazyCommand
+        self.module = None
         self.childs = []
         self.parent.childs.append(self)
 
@@ -174,6 +177,7 @@ class HDTVCommandTree(HDTVCommandTreeNode):
         self.parent = None
         self.command = None
         self.options = None
+        self.module = None
         self.default_level = 1
 
     def SetDefaultLevel(self, level):
@@ -183,6 +187,50 @@ class HDTVCommandTree(HDTVCommandTreeNode):
         """
         Adds a command, specified by title, to the command tree.
         """
+        node = self._AddNode(title, overwrite, level)
+        node.command = command
+        node.options = opt
+        node.module = None
+
+    def AddLazyCommand(self, title, module, level=None, **opt):
+        """
+        Declares a command of the plugin module, which is imported (and
+        registers the actual command) when the command is used for the
+        first time. opt may contain the options needed for completion
+        (fileargs, dirargs).
+        """
+        node = self._AddNode(title, False, level)
+        node.options = opt
+        node.module = module
+
+    def LoadCommand(self, node):
+        """
+        Import the plugin module of a lazily declared command
+        """
+        module = node.module
+        hdtv.ui.debug("Loading plugin %s" % module)
+        importlib.import_module(module)
+        if node.module is not None:
+            node.module = None
+            raise HDTVCommandError(
+                "Plugin %s did not register command %s" % (module, node.FullTitle())
+            )
+
+    def LoadLazyCommands(self):
+        """
+        Import the plugin modules of all lazily declared commands
+        """
+        modules = set()
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if node.module is not None:
+                modules.add(node.module)
+            nodes.extend(node.childs)
+        for module in sorted(modules):
+            importlib.import_module(module)
+
+    def _AddNode(self, title, overwrite, level):
         if level is None:
             level = self.default_level
 
@@ -206,14 +254,17 @@ class HDTVCommandTree(HDTVCommandTreeNode):
 
         # Check to see if the node we are trying to add already exists; if it
         # does and we are not allowed to overwrite it, raise an error
+        for child in node.childs:
+            if child.title == path[-1] and child.module is not None:
+                # Declared by AddLazyCommand
+                child.level = level
+                return child
         if not overwrite:
             if path[-1] in [n.title for n in node.childs]:
                 raise RuntimeError("Refusing to overwrite already existing command")
 
         # Create the last node
-        node = HDTVCommandTreeNode(node, path[-1], level)
-        node.command = command
-        node.options = opt
+        return HDTVCommandTreeNode(node, path[-1], level)
 
     def FindNode(self, path, use_levels=True):
         """
@@ -238,11 +289,22 @@ class HDTVCommandTree(HDTVCommandTreeNode):
 
         return (node, path)
 
+    def ResolveCommand(self, path):
+        """
+        Find the node of the command that a command line fragment (a list of
+        words) executes, descending to primary childs. Lazy commands are not
+        loaded. Returns (node, args); node is None for unknown commands.
+        """
+        (node, args) = self.FindNode(path)
+        while node and not node.command and node.module is None:
+            node = node.PrimaryChild()
+        return (node, args)
+
     def ExecCommand(self, cmdline):
         viewport_locked = False
         try:
             fragments, _ = hdtv.util.SplitCmdlines(cmdline)
-            if len(fragments) > 1:
+            if len(fragments) > 1 and __main__.spectra.viewport:
                 viewport_locked = True
                 __main__.spectra.viewport.LockUpdate()
             for path in fragments:
@@ -250,10 +312,9 @@ class HDTVCommandTree(HDTVCommandTreeNode):
                     break
                 parser = None
                 try:
-                    (node, args) = self.FindNode(path)
-                    while node and not node.command:
-                        node = node.PrimaryChild()
-
+                    (node, args) = self.ResolveCommand(path)
+                    if node and node.module is not None:
+                        self.LoadCommand(node)
                     if not node or not node.command:
                         raise HDTVCommandError("Command not recognized")
 
@@ -347,6 +408,13 @@ class HDTVCommandTree(HDTVCommandTreeNode):
             # Command is ambiguous
             yield from []
             return
+        if node.module is not None and (args or not node.childs):
+            try:
+                self.LoadCommand(node)
+            except Exception as msg:
+                hdtv.ui.debug(str(msg))
+                yield from []
+                return
         options = []
 
         default_style = "fg:#000000"
@@ -518,7 +586,8 @@ class CommandLine(object):
 
         # Dirty hack to prevent segfaults because of root garbage collection
         # trying to free the same memory from two threads (asyncio related)
-        __main__.spectra.viewport.LockUpdate()
+        if __main__.spectra.viewport:
+            __main__.spectra.viewport.LockUpdate()
         __main__.spectra.Clear()
 
     def AsyncExit(self):
@@ -571,7 +640,13 @@ class CommandLine(object):
             file.read()
         except IOError as msg:
             hdtv.ui.error("%s" % msg)
-        for line in file.lines:
+        self.ExecLines(file.lines)
+
+    def ExecLines(self, lines):
+        """
+        Execute lines of a command file
+        """
+        for line in lines:
             hdtv.ui.msg("file> " + line)
             self.DoLine(line)
             # TODO: HACK: How should I teach this micky mouse language that a
@@ -752,6 +827,8 @@ def SetInteractiveDict(d):
 
 RegisterInteractive = command_line.RegisterInteractive
 AddCommand = command_tree.AddCommand
+AddLazyCommand = command_tree.AddLazyCommand
+LoadLazyCommands = command_tree.LoadLazyCommands
 ExecCommand = command_tree.ExecCommand
 RemoveCommand = command_tree.RemoveCommand
 SetHistory = command_line.SetHistory
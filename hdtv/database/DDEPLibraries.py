@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
 # DDEP database, Decay Data Evaluation Project
+#
+# The nuclide tables (.lara.txt) are downloaded from nucleide.org and kept in
+# a local SQLite database, so that later lookups work offline. The database
+# can also be filled in advance, either from a directory of .lara.txt files
+# (e.g. on computers without network access) or by prefetching a list of
+# nuclides.
+
+import glob
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import json
 import hdtv.util
 
 try:
@@ -9,56 +21,351 @@ try:
     import urllib.error
 except ImportError:
     import urllib
+import hdtv.cmdline
+import hdtv.options
 import hdtv.ui
 from uncertainties import ufloat
 from hdtv.database.common import *
+from hdtv.rootext.dlmgr import cachedir
 
+URL = "http://www.nucleide.org/DDEP_WG/Nuclides/%s.lara.txt"
+SUFFIX = ".lara.txt"
+# Names of the tables of some nuclides
+ALIASES = {"Ra-226": "Ra-226D"}
 
-def SearchNuclide(nuclide):
+
+def Download(nuclide, timeout=30):
     """
-    Opens table of nuclides with peak energies, gives back the peak energies of the nuclide and its intensities.
+    Download the table of nuclide from nucleide.org
+    """
+    with urllib.request.urlopen(URL % nuclide, timeout=timeout) as resource:
+        return resource.read().decode("utf-8")
+
+
+class DDEPCache(object):
     """
+    Local store of DDEP nuclide tables
+
+    The tables are kept unparsed in an SQLite database, keyed by the
+    nuclide name, together with the time they were fetched. The database is
+    opened once, and each table is only parsed once per session (see
+    Lookup). After a failed download, expired tables are not updated again
+    for database.ddep.retry hours.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cachedir, "ddep.sqlite")
+        self._db = None
+        self._lock = threading.Lock()
+        # nuclide -> (fetched, parsed table)
+        self._tables = dict()
+
+    def _Connect(self):
+        with self._lock:
+            if self._db is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                with db:
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS nuclides "
+                        "(nuclide TEXT PRIMARY KEY, fetched REAL, data TEXT)"
+                    )
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS state "
+                        "(key TEXT PRIMARY KEY, value REAL)"
+                    )
+                self._db = db
+            return self._db
+
+    def Close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def Get(self, nuclide):
+        """
+        Return (data, fetched) of nuclide, or None if it is not in the cache
+        """
+        try:
+            with self._Connect() as db:
+                return db.execute(
+                    "SELECT data, fetched FROM nuclides WHERE nuclide = ?",
+                    (nuclide,),
+                ).fetchone()
+        except (OSError, sqlite3.Error) as msg:
+            hdtv.ui.debug("Could not read DDEP cache %s: %s" % (self.path, msg))
+            return None
+
+    def Put(self, entries):
+        """
+        Store (nuclide, data, fetched) entries (fetched = None: now)
+        """
+        now = time.time()
+        entries = [
+            (nuclide, now if fetched is None else fetched, data)
+            for (nuclide, data, fetched) in entries
+        ]
+        for entry in entries:
+            self._tables.pop(entry[0], None)
+        try:
+            with self._Connect() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO nuclides VALUES (?, ?, ?)", entries
+                )
+        except (OSError, sqlite3.Error) as msg:
+            hdtv.ui.warning("Could not write DDEP cache %s: %s" % (self.path, msg))
+
+    def List(self):
+        """
+        Return a list of (nuclide, fetched) of all cached nuclides
+        """
+        try:
+            with self._Connect() as db:
+                return db.execute(
+                    "SELECT nuclide, fetched FROM nuclides ORDER BY nuclide"
+                ).fetchall()
+        except (OSError, sqlite3.Error):
+            return list()
+
+    def Clear(self):
+        """
+        Remove all cached nuclides
+        """
+        self._tables.clear()
+        with self._Connect() as db:
+            db.execute("DELETE FROM nuclides")
+
+    def Import(self, paths):
+        """
+        Import .lara.txt files (or all .lara.txt files in directories) into
+        the cache. The entries count as fetched now, not at the modification
+        time of the files, which may be long expired. Returns the list of
+        imported nuclides.
+        """
+        fnames = list()
+        for path in paths:
+            if os.path.isdir(path):
+                fnames += sorted(glob.glob(os.path.join(path, "*" + SUFFIX)))
+            else:
+                fnames.append(path)
+        entries = list()
+        for fname in fnames:
+            nuclide = os.path.basename(fname)
+            if nuclide.endswith(SUFFIX):
+                nuclide = nuclide[: -len(SUFFIX)]
+            with open(fname, "r", encoding="utf-8", errors="replace") as f:
+                entries.append((nuclide, f.read(), None))
+        self.Put(entries)
+        return [entry[0] for entry in entries]
+
+    def IsExpired(self, fetched):
+        ttl = hdtv.options.Get("database.ddep.ttl")
+        return ttl > 0 and time.time() - fetched > ttl * 86400.0
+
+    def _GetFailed(self):
+        """
+        Time of the last failed download, or None
+        """
+        try:
+            with self._Connect() as db:
+                row = db.execute(
+                    "SELECT value FROM state WHERE key = 'failed'"
+                ).fetchone()
+        except (OSError, sqlite3.Error):
+            return None
+        return row and row[0]
+
+    def _SetFailed(self, failed):
+        """
+        Record the time of a failed download (None: clear it)
+        """
+        try:
+            with self._Connect() as db:
+                if failed is None:
+                    db.execute("DELETE FROM state WHERE key = 'failed'")
+                else:
+                    db.execute(
+                        "INSERT OR REPLACE INTO state VALUES ('failed', ?)", (failed,)
+                    )
+        except (OSError, sqlite3.Error) as msg:
+            hdtv.ui.debug("Could not write DDEP cache %s: %s" % (self.path, msg))
+
+    def _MayUpdate(self):
+        """
+        Check if expired tables may be updated, i.e. if the last failed
+        download is at least database.ddep.retry hours ago
+        """
+        failed = self._GetFailed()
+        retry = hdtv.options.Get("database.ddep.retry")
+        return failed is None or time.time() - failed >= retry * 3600.0
+
+    def Fetch(self, nuclide, refresh=False):
+        """
+        Return the table of nuclide, from the cache if possible. Missing or
+        expired entries (and all entries, if refresh is set) are downloaded,
+        unless the database.ddep.offline option is set. Expired entries are
+        used as they are for database.ddep.retry hours after a failed
+        download.
+        """
+        return self._Fetch(nuclide, refresh)[0]
 
-    out = {"nuclide": nuclide, "transitions": []}
+    def _Fetch(self, nuclide, refresh=False):
+        """
+        Return (data, fetched) of nuclide (see Fetch)
+        """
+        nuclide = ALIASES.get(nuclide, nuclide)
+        entry = self.Get(nuclide)
+        if entry is not None:
+            (data, fetched) = entry
+            if hdtv.options.Get("database.ddep.offline") or not (
+                refresh or (self.IsExpired(fetched) and self._MayUpdate())
+            ):
+                return entry
+        elif hdtv.options.Get("database.ddep.offline"):
+            raise hdtv.cmdline.HDTVCommandError(
+                "Nuclide {} is not in the DDEP cache (offline mode)".format(nuclide)
+            )
 
-    if nuclide == "Ra-226":
-        nuclide = "Ra-226D"
+        try:
+            data = Download(nuclide)
+        except (OSError, ValueError) as msg:
+            if entry is not None:
+                self._SetFailed(time.time())
+                hdtv.ui.warning(
+                    "Could not update nuclide {} ({}), using cached data".format(
+                        nuclide, msg
+                    )
+                )
+                return entry
+            raise hdtv.cmdline.HDTVCommandError(
+                "Error looking up nuclide {}".format(nuclide)
+            )
+        if entry is not None:
+            self._SetFailed(None)
+        fetched = time.time()
+        self.Put([(nuclide, data, fetched)])
+        return (data, fetched)
+
+    def Lookup(self, nuclide):
+        """
+        Return the parsed table of nuclide (see ParseTable). Each table is
+        only parsed once, and the cache is only queried again when it
+        expires.
+        """
+        nuclide = ALIASES.get(nuclide, nuclide)
+        memo = self._tables.get(nuclide)
+        if memo is not None and (
+            hdtv.options.Get("database.ddep.offline")
+            or not (self.IsExpired(memo[0]) and self._MayUpdate())
+        ):
+            return memo[1]
+        (data, fetched) = self._Fetch(nuclide)
+        table = ParseTable(data)
+        self._tables[nuclide] = (fetched, table)
+        return table
+
+    def Prefetch(self, nuclides, nthreads=None, refresh=False):
+        """
+        Download the tables of several nuclides in parallel, skipping those
+        already cached (unless refresh is set or they are expired).
+        Returns a dict with the error message for each failed nuclide.
+        """
+        todo = list()
+        for nuclide in dict.fromkeys(ALIASES.get(n, n) for n in nuclides):
+            entry = self.Get(nuclide)
+            if refresh or entry is None or self.IsExpired(entry[1]):
+                todo.append(nuclide)
+
+        def download(nuclide):
+            try:
+                return (nuclide, Download(nuclide), None)
+            except (OSError, ValueError) as msg:
+                return (nuclide, None, str(msg))
+
+        if not todo:
+            return dict()
+        with ThreadPoolExecutor(max_workers=nthreads or min(len(todo), 8)) as pool:
+            results = list(pool.map(download, todo))
+        self.Put([(n, data, None) for (n, data, err) in results if err is None])
+        return {n: err for (n, data, err) in results if err is not None}
+
+
+cache = DDEPCache()
 
-    try:
-        with urllib.request.urlopen(
-            "http://www.nucleide.org/DDEP_WG/Nuclides/" + str(nuclide) + ".lara.txt"
-        ) as resource:
-            data = resource.read().decode("utf-8")
-    except:
-        raise hdtv.cmdline.HDTVCommandError(
-            "Error looking up nuclide {}".format(nuclide)
-        )
 
-    for line in data.split("\r\n"):
+def ParseTable(data):
+    """
+    Parse a DDEP nuclide table into plain (value, uncertainty) pairs
+    """
+    out = {"transitions": []}
+
+    for line in data.splitlines():
         sep = line.split(" ; ")
 
         if str(sep[0]) == "Half-life (s)":
-            out["halflife"] = ufloat(float(sep[1]), float(sep[2]))
+            out["halflife"] = (float(sep[1]), float(sep[2]))
 
         if str(sep[0]) == "Reference":
             out["reference"] = str(sep[1])
 
         try:
             if str(sep[4]) == "g":
-                energy = ufloat(float(sep[0]), 0)
+                energy = (float(sep[0]), 0.0)
                 try:
-                    energy.std_dev = float(sep[1])
+                    energy = (energy[0], float(sep[1]))
                 except BaseException:
                     pass
 
-                intensity = ufloat(float(sep[2]) / 100, 0)
+                intensity = (float(sep[2]) / 100, 0.0)
                 try:
-                    intensity.std_dev = float(sep[3]) / 100
+                    intensity = (intensity[0], float(sep[3]) / 100)
                 except BaseException:
                     pass
 
-                out["transitions"].append({"energy": energy, "intensity": intensity})
+                out["transitions"].append((energy, intensity))
         except:
             pass
 
     return out
+
+
+def _Convert(nuclide, table):
+    """
+    Use ufloat to represent values with uncertainties
+    """
+    out = {
+        "nuclide": nuclide,
+        "transitions": [
+            {"energy": ufloat(*energy), "intensity": ufloat(*intensity)}
+            for (energy, intensity) in table["transitions"]
+        ],
+    }
+    if "halflife" in table:
+        out["halflife"] = ufloat(*table["halflife"])
+    if "reference" in table:
+        out["reference"] = table["reference"]
+    return out
+
+
+def Parse(nuclide, data):
+    """
+    Parse a DDEP nuclide table
+    """
+    return _Convert(nuclide, ParseTable(data))
+
+
+def SearchNuclide(nuclide):
+    """
+    Opens table of nuclides with peak energies, gives back the peak energies of the nuclide and its intensities.
+    """
+    # Fresh ufloats for every lookup, as for the IAEA table
+    return _Convert(nuclide, cache.Lookup(nuclide))
+
+
+opt = hdtv.options.Option(default=30.0, parse=lambda x: float(x))
+hdtv.options.RegisterOption("database.ddep.ttl", opt)  # in days, 0: never expire
+opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("database.ddep.offline", opt)
+opt = hdtv.options.Option(default=24.0, parse=lambda x: float(x))
+hdtv.options.RegisterOption("database.ddep.retry", opt)  # in hours
@@ -9,27 +9,54 @@ from hdtv.database.common import *
 
 # TODO: integrate this in a class?
 
+# Nuclide name -> data (as in the IAEA table), built on first use
+_index = None
 
-def SearchNuclide(nuclide):
-    # Get all data as dict from json file
-    alldata = json.loads(open(os.path.join(hdtv.datadir, "IAEA.json")).read())
-
-    # Select nuclide
-    data = next(x for x in alldata if x["nuclide"] == nuclide)
-    if not data:
-        errorText = "There is no nuclide called " + nuclide + " in the table."
-        raise hdtv.cmdline.HDTVCommandError(errorText)
 
-    # Use ufloat to represent values with uncertainties
-    transitions = [
+def _Convert(data):
+    """
+    Use ufloat to represent values with uncertainties
+    """
+    data = dict(data)
+    data["transitions"] = [
         {
             "energy": ufloat(t["energy"], t["energy_uncertainty"]),
             "intensity": ufloat(t["intensity"], t["intensity_uncertainty"]),
         }
         for t in data["transitions"]
     ]
-    data["transitions"] = transitions
     data["halflife"] = ufloat(data["halflife"], data["halflife_uncertainty"])
     del data["halflife_uncertainty"]
-
     return data
+
+
+def BuildIndex(fname):
+    """
+    Read the IAEA table and index it by nuclide
+    """
+    with open(fname) as f:
+        alldata = json.load(f)
+    index = dict()
+    for data in alldata:
+        if data["nuclide"] not in index:
+            index[data["nuclide"]] = data
+    return index
+
+
+def GetIndex():
+    global _index
+    if _index is None:
+        _index = BuildIndex(os.path.join(hdtv.datadir, "IAEA.json"))
+    return _index
+
+
+def SearchNuclide(nuclide):
+    try:
+        data = GetIndex()[nuclide]
+    except KeyError:
+        errorText = "There is no nuclide called " + nuclide + " in the table."
+        raise hdtv.cmdline.HDTVCommandError(errorText)
+
+    # Fresh ufloats for every lookup, so that the values of repeated
+    # lookups are not correlated (and callers can modify the result)
+    return _Convert(data)
@@ -2,8 +2,6 @@
 # PGAA database from Institute of Isotopes, Hungarian Academey of Science,
 # Budapest
 
-from uncertainties import ufloat, ufloat_fromstr
-
 from hdtv.database.common import *
 import hdtv.cmdline
 import hdtv.ui
@@ -62,11 +60,42 @@ class PGAAGamma(Gamma):
         return text
 
 
-class PGAAlib_IKI2000(GammaLib):
+class _PGAALib(GammaLib):
+    """
+    Common base of the PGAA libraries
+    """
+
+    def open(self):
+
+        if self.opened:
+            return True
+
+        super(_PGAALib, self).open()
+        # The k0 values are normalized to the first gamma of the comparator
+        # nuclide, so create it before all others
+        table = self._table
+        ref = np.flatnonzero(
+            (table["z"] == self.k0_comp[0]) & (table["a"] == self.k0_comp[1])
+        )
+        if len(ref) > 0:
+            self[ref[0]]
+
+
+class PGAAlib_IKI2000(_PGAALib):
     """
     PGAA library of the Institute of Isotopes, Hungarian Academy of Sciences, Budapest
     """
 
+    # Layout of the compiled table (see hdtv.database.compiled)
+    columns = [
+        ("z", "int", 0),
+        ("a", "int", 1),
+        ("energy", "ufloat", (2, 3)),
+        ("sigma", "ufloat", (4, 5)),
+        ("intensity", "float", 6),
+        ("halflife", "float", 7),
+    ]
+
     def __init__(
         self,
         csvfile=os.path.join(hdtv.datadir, "PGAAlib-IKI2000.dat"),
@@ -106,56 +135,31 @@ class PGAAlib_IKI2000(GammaLib):
         self._has_header = has_header
         self.k0_comp = k0_comp
 
-    def open(self):
-
-        if self.opened:
-            return True
-
-        try:
-            datfile = open(self.csvfile, "r", encoding="utf-8")
-        except TypeError:
-            datfile = open(self.csvfile, "rb")
-
-        reader = csv.reader(datfile)
-
-        if self._has_header:
-            next(reader)
-
-        try:
-            for line in reader:
-                Z = int(line[0])
-                A = int(line[1])
-                energy = ufloat(float(line[2]), float(line[3]))
-                sigma = ufloat(float(line[4]), float(line[5]))
-                intensity = ufloat(float(line[6]), 0) / 100.0
-                try:
-                    halflife = ufloat(float(line[7]), 0)
-                except ValueError:
-                    halflife = None
-                gamma = PGAAGamma(
-                    Nuclides(Z, A)[0],
-                    energy,
-                    sigma=sigma,
-                    intensity=intensity,
-                    halflife=halflife,
-                    k0_comp=self.k0_comp,
-                )
-                self.append(gamma)
-        except csv.Error as e:
-            raise HDTVCommandAbort(
-                "file %s, line %d: %s" % (self.csvfile, reader.line_num, e)
-            )
-        else:
-            self.opened = True
-        finally:
-            datfile.close()
+    def _MakeGamma(self, row):
+        return PGAAGamma(
+            Nuclides(int(row["z"]), int(row["a"]))[0],
+            Value(row, "energy"),
+            sigma=Value(row, "sigma"),
+            intensity=Value(row, "intensity", 100.0),
+            halflife=Value(row, "halflife"),
+            k0_comp=self.k0_comp,
+        )
 
 
-class PromptGammas(GammaLib):
+class PromptGammas(_PGAALib):
     """
     Extensive IAEA Prompt-Gamma library
     """
 
+    # Layout of the compiled table (see hdtv.database.compiled)
+    columns = [
+        ("a", "int", 0),
+        ("z", "int", 1),
+        ("energy", "ufloat", 2),
+        ("sigma", "ufloat", 3),
+        ("k0", "ufloat", 4),
+    ]
+
     def __init__(
         self,
         csvfile=os.path.join(hdtv.datadir, "PromptGammas.dat"),
@@ -182,35 +186,11 @@ class PromptGammas(GammaLib):
         self._has_header = has_header
         self.k0_comp = k0_comp
 
-    def open(self):
-
-        if self.opened:
-            return True
-
-        try:
-            datfile = open(self.csvfile, "r", encoding="utf-8")
-        except TypeError:
-            datfile = open(self.csvfile, "rb")
-
-        reader = csv.reader(datfile)
-
-        if self._has_header:
-            next(reader)
-
-        try:
-            for line in reader:
-                A = int(line[0])
-                Z = int(line[1])
-                energy = ufloat_fromstr(line[2])
-                sigma = ufloat_fromstr(line[3])
-                k0 = ufloat_fromstr(line[4])
-                gamma = PGAAGamma(
-                    Nuclides(Z, A)[0], energy, sigma=sigma, k0=k0, k0_comp=self.k0_comp
-                )
-                self.append(gamma)
-        except csv.Error as e:
-            hdtv.ui.error("file %s, line %d: %s" % (self.csvfile, reader.line_num, e))
-        else:
-            self.opened = True
-        finally:
-            datfile.close()
+    def _MakeGamma(self, row):
+        return PGAAGamma(
+            Nuclides(int(row["z"]), int(row["a"]))[0],
+            Value(row, "energy"),
+            sigma=Value(row, "sigma"),
+            k0=Value(row, "k0"),
+            k0_comp=self.k0_comp,
+        )
@@ -1,3 +1,13 @@
 from .PGAALibraries import PromptGammas, PGAAlib_IKI2000, Elements
+from .common import Nuclides
 
 databases = {"promptgammas": PromptGammas, "pgaalib_iki2000": PGAAlib_IKI2000}
+
+
+def CompileAll(path=None):
+    """
+    Compile all shipped database tables (see hdtv.database.compiled) and write
+    them to directory path (default: the cache directory)
+    """
+    for table in [Elements, Nuclides] + [db() for db in databases.values()]:
+        table.Compile(path)
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
-import csv
 import os
-from uncertainties import ufloat_fromstr
+from collections import defaultdict
+
+import numpy as np
 import hdtv.cmdline
+import hdtv.database.compiled
 import hdtv.ui
+from hdtv.database.compiled import Value
 
 
 class _Element(object):
@@ -44,87 +47,107 @@ class _Element(object):
 
 class _Elements(list):
     """
-    Read and hold complete elements list
+    Complete elements list, indexed by Z
+
+    The list is only filled from the compiled table on first use.
     """
 
-    def __init__(self, csvfile=os.path.join(hdtv.datadir, "elements.dat")):
+    columns = [
+        ("z", "int", 0),
+        ("symbol", "str", 1),
+        ("name", "str", 2),
+        ("m", "ufloat", 3),
+    ]
 
+    def __init__(self, csvfile=os.path.join(hdtv.datadir, "elements.dat")):
         super(_Elements, self).__init__()
+        self.csvfile = csvfile
+        self._table = None
+
+    def _GetTable(self):
+        if self._table is None:
+            table = hdtv.database.compiled.Load(self.csvfile, self.columns)
+            elements = [None] * int(table["z"].max())
+            for row in table:
+                Z = int(row["z"])
+                elements[Z - 1] = _Element(
+                    Z, str(row["symbol"]), str(row["name"]), Value(row, "m")
+                )
+            list.extend(self, elements)
+            self._table = table
+        return self._table
 
-        tmp = list()
+    def Compile(self, path=None):
+        """
+        Write compiled table to directory path
+        """
+        hdtv.database.compiled.Compile(self.csvfile, self.columns, path=path)
 
-        try:
-            try:
-                datfile = open(csvfile, "r", encoding="utf-8")
-            except TypeError:
-                datfile = open(csvfile, "rb")
-            reader = csv.reader(datfile)
-            next(reader)  # Skip header
-
-            for line in reader:
-                Z = int(line[0])
-                Symbol = line[1].strip()
-                Name = line[2].strip()
-                try:
-                    Mass = ufloat_fromstr(line[3].strip())
-                except ValueError:
-                    Mass = None
-                element = _Element(Z, Symbol, Name, Mass)
-                tmp.append(element)
-        except csv.Error as err:
-            hdtv.ui.error("file %s, line %d: %s" % (csvfile, reader.line_num, err))
-        finally:
-            datfile.close()
-
-        # Now store elements finally
-        maxZ = max(tmp, key=lambda x: x.z)  # Get highest Z
-        for i in range(maxZ.z):
-            self.append(None)
-
-        for e in tmp:
-            self[e.z] = e
+    def Symbols(self, Z):
+        """
+        Return the symbols of the elements with atomic numbers Z (array)
+        """
+        table = self._GetTable()
+        symbols = np.full(len(self) + 1, "", dtype=table["symbol"].dtype)
+        symbols[table["z"]] = table["symbol"]
+        return symbols[np.asarray(Z, dtype=int)]
+
+    def _Find(self, key, value):
+        table = self._GetTable()
+        found = np.flatnonzero(np.char.lower(table[key]) == value.lower())
+        if len(found) == 0:
+            raise ValueError
+        return self[int(table["z"][found[0]])]
 
     def __call__(self, Z=None, symbol=None, name=None):
 
         if symbol:
-            for z in self:
-                try:
-                    if z.symbol.lower() == symbol.lower():
-                        return z
-                except AttributeError:
-                    pass
-            raise ValueError  # If we reach this point there is no element with this symbol
+            return self._Find("symbol", symbol)
         if name:
-            for z in self:
-                try:
-                    if z.name.lower() == name.lower():
-                        return z
-                except AttributeError:
-                    pass
-            raise ValueError  # If we reach this point there is no element with this name
+            return self._Find("name", name)
 
         if Z:
             return self[Z]
 
         return self
 
-    def __setitem__(self, index, value):
-        if index == 0:
-            return None
+    def __len__(self):
+        self._GetTable()
+        return list.__len__(self)
 
-        if index > 0:
-            index = index - 1
+    def __iter__(self):
+        self._GetTable()
+        return list.__iter__(self)
+
+    def __reversed__(self):
+        self._GetTable()
+        return list.__reversed__(self)
+
+    def __contains__(self, element):
+        self._GetTable()
+        return list.__contains__(self, element)
+
+    def __repr__(self):
+        self._GetTable()
+        return list.__repr__(self)
+
+    def index(self, element, *args):
+        self._GetTable()
+        return list.index(self, element, *args)
 
-        return super(_Elements, self).__setitem__(index, value)
+    def count(self, element):
+        self._GetTable()
+        return list.count(self, element)
 
     def __getitem__(self, index):
         if index == 0:
             return None
 
+        self._GetTable()
         if index > 0:
             index = index - 1
 
-        return super(_Elements, self).__getitem__(index)
+        return list.__getitem__(self, index)
 
 
 class _Nuclide(_Element):
@@ -171,43 +194,48 @@ class _Nuclide(_Element):
 
 
 class _Nuclides(object):
+    """
+    Complete nuclides list
+
+    The table is read on first use, and nuclide objects are only created
+    for the nuclides actually requested.
+    """
+
+    columns = [
+        ("z", "int", 0),
+        ("a", "int", 1),
+        ("abundance", "ufloat", 2),
+        ("m", "ufloat", 3),
+        ("sigma", "ufloat", 4),
+    ]
+
     def __init__(self, csvfile=os.path.join(hdtv.datadir, "nuclides.dat")):
+        self.csvfile = csvfile
+        self._table = None
+        self._nuclides = dict()
 
-        self._storage = dict()
-        try:
-            try:
-                datfile = open(csvfile, "r", encoding="utf-8")
-            except TypeError:
-                datfile = open(csvfile, "rb")
-            reader = csv.reader(datfile)
-            next(reader)  # Skip header
-
-            for line in reader:
-                Z = int(line[0].strip())
-                element = Elements(Z)
-                A = int(line[1].strip())
-                if line[2].strip():
-                    abd = ufloat_fromstr(line[2].strip()) / 100.0
-                else:
-                    abd = None
-                if line[3].strip():
-                    M = ufloat_fromstr(line[3].strip())
-                else:
-                    M = None
-                if line[4].strip():
-                    sigma = ufloat_fromstr(line[4].strip())
-                else:
-                    sigma = None
-
-                if Z not in self._storage:
-                    self._storage[Z] = dict()
-                self._storage[Z][A] = _Nuclide(
-                    element, A, abundance=abd, sigma=sigma, M=M
-                )
-        except csv.Error as e:
-            hdtv.ui.error("file %s, line %d: %s" % (csvfile, reader.line_num, e))
-        finally:
-            datfile.close()
+    def _GetTable(self):
+        if self._table is None:
+            self._table = hdtv.database.compiled.Load(self.csvfile, self.columns)
+        return self._table
+
+    def Compile(self, path=None):
+        """
+        Write compiled table to directory path
+        """
+        hdtv.database.compiled.Compile(self.csvfile, self.columns, path=path)
+
+    def _Get(self, i):
+        if i not in self._nuclides:
+            row = self._GetTable()[i]
+            self._nuclides[i] = _Nuclide(
+                Elements(int(row["z"])),
+                int(row["a"]),
+                abundance=Value(row, "abundance", 100.0),
+                sigma=Value(row, "sigma"),
+                M=Value(row, "m"),
+            )
+        return self._nuclides[i]
 
     def __call__(self, Z=None, A=None, symbol=None, name=None):
         """
@@ -217,51 +245,21 @@ class _Nuclides(object):
               Nuclides(symbol="Au") or Nuclides(name="gold") or Nuclides(Z=79) return list of all gold nuclides
         """
 
-        ret = list()
-
-        if (
-            Z is not None
-        ):  # Z is given, so it is faster if we start with nuclides of this Z
-            if A is not None:  # Nuclide uniquely defined
-                ret.append(self._storage[Z][A])
-            else:  # All nuclides with given Z
-                for n in self._storage[Z].values():
-                    ret.append(n)
-
-        if len(ret) == 0:  # Z was not given, so we have to cycle through all nuclides
-            for n in self._storage.values():
-                for e in n.values():
-                    ret.append(e)
-
-        tmp = list()
-
-        # Select by A
+        table = self._GetTable()
+        select = np.ones(len(table), dtype=bool)
+        try:
+            if symbol is not None:
+                select &= table["z"] == Elements(symbol=symbol).z
+            if name is not None:
+                select &= table["z"] == Elements(name=name).z
+        except ValueError:  # No such element
+            return list()
+        if Z is not None:
+            select &= table["z"] == Z
         if A is not None:
-            for n in ret:
-                if n.a == A:
-                    tmp.append(n)
-
-            ret = tmp
-            tmp = list()
-
-        # Select by symbol
-        if symbol is not None:
-            for n in ret:
-                if n.symbol.lower() == symbol.lower():
-                    tmp.append(n)
+            select &= table["a"] == A
 
-            ret = tmp
-            tmp = list()
-
-        # Select by name
-        if name is not None:
-            for n in ret:
-                if n.name.lower() == name.lower():
-                    tmp.append(n)
-
-            ret = tmp
-
-        return ret
+        return [self._Get(i) for i in np.flatnonzero(select)]
 
 
 class Gamma(object):
@@ -356,12 +354,74 @@ class Gamma(object):
             return self.energy <= other.energy
 
 
+def _Nominal(value):
+    """
+    Nominal value of a ufloat (or of a plain number)
+    """
+    return getattr(value, "nominal_value", value)
+
+
+class _GammaLibIndex(object):
+    """
+    Lookup indexes of a gamma library: a sorted array of energies for range
+    queries and hash indexes for Z, A and symbol
+    """
+
+    hashed = ("z", "a", "symbol")
+
+    def __init__(self, columns):
+        """
+        columns: dict with the energies and the values of the hashed fields
+                 of all gammas (in library order)
+        """
+        energies = np.asarray(columns["energy"], dtype=float)
+        self.size = len(energies)
+        # Positions of the gammas in the library, sorted by energy
+        self.order = np.argsort(energies, kind="stable")
+        self.energies = energies[self.order]
+        self.fields = dict()
+        for key in self.hashed:
+            field = defaultdict(list)
+            for (i, value) in enumerate(columns[key]):
+                if isinstance(value, str):
+                    value = value.lower()
+                field[value].append(i)
+            self.fields[key] = {
+                value: np.array(idx, dtype=int) for (value, idx) in field.items()
+            }
+
+    def EnergyRange(self, energies, fuzziness):
+        """
+        Return the (lower, upper) bounds of the slices of self.order that
+        hold the gammas within fuzziness of energies (scalar or array)
+        """
+        lower = np.searchsorted(self.energies, np.subtract(energies, fuzziness), "left")
+        upper = np.searchsorted(self.energies, np.add(energies, fuzziness), "right")
+        return lower, upper
+
+    def Candidates(self, key, value, fuzziness):
+        """
+        Return the positions of the gammas that may match key=value, or
+        None, if there is no index for key
+        """
+        if key == "energy":
+            lower, upper = self.EnergyRange(value, fuzziness)
+            return self.order[lower:upper]
+        if key in self.fields:
+            if isinstance(value, str):
+                value = value.lower()
+            return self.fields[key].get(value, np.array([], dtype=int))
+        return None
+
+
 # TODO: this should be an abstract baseclass!
 class GammaLib(list):
     """
     Class for storing a gamma library
 
-    The real libs should be derived from this
+    The real libs should be derived from this. They provide csvfile and
+    columns (and _MakeGamma for other than plain gammas), and the gammas
+    are created from the compiled table when they are accessed.
     """
 
     __slots__ = ("nuclide", "energy", "sigma", "intensity", "E_fuzziness")
@@ -370,6 +430,93 @@ class GammaLib(list):
         list.__init__(self)
         self.fuzziness = fuzziness  # Fuzzyness for energy identification
         self.opened = False
+        self._index = None
+        # Compiled table (see hdtv.database.compiled) and the gammas already
+        # created from it
+        self._table = None
+        self._rows = dict()
+
+    def open(self):
+        """
+        Open the compiled table of the library (csvfile, with layout columns)
+        """
+        if self.opened:
+            return True
+        self._table = hdtv.database.compiled.Load(
+            self.csvfile, self.columns, self._has_header
+        )
+        self._rows = dict()
+        self._index = None
+        self.opened = True
+
+    def Compile(self, path=None):
+        """
+        Write compiled table to directory path
+        """
+        hdtv.database.compiled.Compile(
+            self.csvfile, self.columns, self._has_header, path=path
+        )
+
+    def _MakeGamma(self, row):
+        """
+        Create a gamma from a row of the compiled table, with columns z, a,
+        energy and optionally sigma and intensity (in %)
+        """
+        names = row.dtype.names
+        return Gamma(
+            Nuclides(int(row["z"]), int(row["a"]))[0],
+            Value(row, "energy"),
+            sigma=Value(row, "sigma") if "sigma" in names else None,
+            intensity=Value(row, "intensity", 100.0) if "intensity" in names else None,
+        )
+
+    def _Row(self, i):
+        if i not in self._rows:
+            self._rows[i] = self._MakeGamma(self._table[i])
+        return self._rows[i]
+
+    def __len__(self):
+        if self._table is None:
+            return list.__len__(self)
+        return len(self._table)
+
+    def __iter__(self):
+        if self._table is None:
+            return list.__iter__(self)
+        return (self._Row(i) for i in range(len(self._table)))
+
+    def __getitem__(self, index):
+        if self._table is None:
+            return list.__getitem__(self, index)
+        if isinstance(index, slice):
+            return [self._Row(i) for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("gamma library index out of range")
+        return self._Row(index)
+
+    def _GetIndex(self):
+        """
+        Return the lookup index, (re)building it if the library has changed
+        """
+        if self._index is None or self._index.size != len(self):
+            if self._table is None:
+                columns = {
+                    key: [getattr(g, key) for g in self]
+                    for key in _GammaLibIndex.hashed
+                }
+                columns["energy"] = [_Nominal(g.energy) for g in self]
+            else:
+                columns = {
+                    "energy": self._table["energy"],
+                    "z": self._table["z"].tolist(),
+                    "a": self._table["a"].tolist(),
+                    "symbol": Elements.Symbols(self._table["z"]).tolist(),
+                }
+            self._index = _GammaLibIndex(columns)
+        return self._index
 
     def find(self, fuzziness=None, sort_key=None, sort_reverse=False, **args):
         """
@@ -411,15 +558,29 @@ class GammaLib(list):
             except KeyError:
                 pass
 
-        # Do the search
-        results = self[:]
-
-        if fuzziness is None:
-            fuzziness = self.fuzziness
-
         if not fargs:
             return []
 
+        # Use the indexes to preselect candidates
+        index = self._GetIndex()
+        candidates = None
+        for (key, value) in list(fargs.items()):
+            if value is None:
+                continue
+            found = index.Candidates(key, value, fuzziness)
+            if found is None:
+                continue
+            if candidates is None:
+                candidates = np.unique(found)
+            else:
+                candidates = np.intersect1d(candidates, found)
+
+        if candidates is None:
+            results = self[:]
+        else:
+            results = [self[i] for i in candidates]
+
+        # Check all conditions on the remaining candidates
         for (key, value) in list(fargs.items()):
             if value is None:
                 continue
@@ -431,10 +592,38 @@ class GammaLib(list):
                 ]
             else:  # Do fuzzy compare
                 results = [
-                    x for x in results if abs(getattr(x, key) - value) <= fuzziness
+                    x
+                    for x in results
+                    if abs(_Nominal(getattr(x, key)) - value) <= fuzziness
                 ]
 
-        # Sort
+        self._Sort(results, sort_key, sort_reverse)
+        return results
+
+    def find_batch(self, energies, fuzziness=None, sort_key=None, sort_reverse=False):
+        """
+        Find the gammas matching each of a list of energies (e.g. of all
+        peaks of a fit) at once
+
+        Returns a list with a list of matching gammas for each energy
+        """
+        if not self.opened:
+            self.open()
+
+        if fuzziness is None:
+            fuzziness = self.fuzziness
+
+        index = self._GetIndex()
+        lower, upper = index.EnergyRange(np.asarray(energies, dtype=float), fuzziness)
+        results = list()
+        for (l, u) in zip(lower, upper):
+            found = [self[i] for i in np.sort(index.order[l:u])]
+            self._Sort(found, sort_key, sort_reverse)
+            results.append(found)
+        return results
+
+    @staticmethod
+    def _Sort(results, sort_key=None, sort_reverse=False):
         try:
             if sort_key is not None:
                 results.sort(key=lambda x: getattr(x, sort_key), reverse=sort_reverse)
@@ -442,8 +631,6 @@ class GammaLib(list):
             hdtv.ui.warning("Could not sort by '" + str(sort_key) + "': No such key")
             raise AttributeError
 
-        return results
-
 
 Elements = _Elements()
 Nuclides = _Nuclides()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Compiled (binary) versions of the CSV database tables
+
+Parsing the CSV tables in hdtv/share, and especially the conversion of
+strings like "1.0078250321(4)" to ufloats, is slow. Each table is therefore
+compiled once into a numpy record array (.npy), which is memory mapped when
+the table is opened. Values with uncertainties are stored as two columns,
+"<name>" (nominal value) and "<name>_err" (standard deviation), missing
+values as NaN.
+
+Compiled tables are named after the CSV file and a hash of its contents, so
+they never go stale. They are looked up next to the CSV file first (for
+tables compiled at installation time) and in the user's cache directory.
+A stamp file in the cache directory records the size and modification time
+of the CSV file together with the name of its compiled table, so that the
+CSV file is only hashed again when it has changed.
+"""
+
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+from uncertainties import ufloat, ufloat_fromstr
+
+import hdtv.ui
+from hdtv.cmdline import HDTVCommandAbort
+from hdtv.rootext.dlmgr import cachedir
+
+VERSION = 1
+
+tabledir = os.path.join(cachedir, "database")
+
+# Column kinds: "int", "str", "float" (plain number) and "ufloat" (number
+# with uncertainty, either as "1.23(4)" or from two CSV columns)
+_dtypes = {"int": "<i4", "float": "<f8", "ufloat": "<f8"}
+
+
+def _Name(csvfile, columns, header):
+    """
+    File name of the compiled table: name of the CSV file and a hash of its
+    contents and of the table layout
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((VERSION, columns, header)).encode("utf-8"))
+    with open(csvfile, "rb") as datfile:
+        digest.update(datfile.read())
+    name = os.path.splitext(os.path.basename(csvfile))[0]
+    return "%s.%s.npy" % (name, digest.hexdigest()[:16])
+
+
+def _Stampfile(csvfile, columns, header):
+    """
+    Name of the stamp file of csvfile (and the table layout)
+    """
+    key = repr((os.path.abspath(csvfile), columns, header))
+    digest = hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+    name = os.path.splitext(os.path.basename(csvfile))[0]
+    return os.path.join(tabledir, "%s.%s.stamp" % (name, digest[:16]))
+
+
+def _StampedName(csvfile, columns, header):
+    """
+    Return the name of the compiled table of csvfile, hashing csvfile only
+    if its size or modification time differ from those in its stamp file
+    """
+    stat = os.stat(csvfile)
+    stamp = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    stampfile = _Stampfile(csvfile, columns, header)
+    try:
+        with open(stampfile, "r") as f:
+            saved = json.load(f)
+        if saved["size"] == stamp["size"] and saved["mtime"] == stamp["mtime"]:
+            return saved["name"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    stamp["name"] = _Name(csvfile, columns, header)
+    tmpname = "%s.%d.tmp" % (stampfile, os.getpid())
+    try:
+        os.makedirs(tabledir, exist_ok=True)
+        with open(tmpname, "w") as f:
+            json.dump(stamp, f)
+        os.replace(tmpname, stampfile)
+    except OSError as msg:
+        hdtv.ui.debug("Failed to write stamp file: %s" % msg)
+    return stamp["name"]
+
+
+def Filename(csvfile, columns, header=True, path=None):
+    """
+    Return the name of the compiled version of csvfile (in directory path,
+    default: the cache directory)
+    """
+    if path is None:
+        path = tabledir
+    return os.path.join(path, _Name(csvfile, columns, header))
+
+
+def _Float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _UFloat(text):
+    try:
+        value = ufloat_fromstr(text.strip())
+    except ValueError:
+        return (np.nan, np.nan)
+    return (value.nominal_value, value.std_dev)
+
+
+def Parse(csvfile, columns, header=True):
+    """
+    Parse a CSV table into a record array
+
+    columns is a list of (name, kind, index) tuples, where index is the
+    number of the CSV column. For kind "ufloat", index may also be a
+    (value, error) tuple of CSV columns.
+    """
+    values = list()
+    with open(csvfile, "r", encoding="utf-8", newline="") as datfile:
+        reader = csv.reader(datfile)
+        try:
+            if header:
+                next(reader)
+            for line in reader:
+                if not line:
+                    continue
+                row = list()
+                for (name, kind, index) in columns:
+                    if kind == "int":
+                        row.append(int(line[index]))
+                    elif kind == "str":
+                        row.append(line[index].strip())
+                    elif kind == "float":
+                        row.append(_Float(line[index]))
+                    elif isinstance(index, tuple):
+                        row.extend((_Float(line[index[0]]), _Float(line[index[1]])))
+                    else:
+                        row.extend(_UFloat(line[index]))
+                values.append(tuple(row))
+        except (csv.Error, ValueError, IndexError) as err:
+            raise HDTVCommandAbort(
+                "file %s, line %d: %s" % (csvfile, reader.line_num, err)
+            )
+
+    dtype = list()
+    pos = 0
+    for (name, kind, index) in columns:
+        if kind == "str":
+            length = max([len(row[pos]) for row in values] or [1])
+            dtype.append((name, "<U%d" % max(length, 1)))
+        else:
+            dtype.append((name, _dtypes[kind]))
+        pos += 1
+        if kind == "ufloat":
+            dtype.append((name + "_err", _dtypes[kind]))
+            pos += 1
+    return np.array(values, dtype=dtype)
+
+
+def Compile(csvfile, columns, header=True, path=None):
+    """
+    Compile csvfile and write the compiled table to directory path (default:
+    the cache directory). Returns the table.
+    """
+    table = Parse(csvfile, columns, header)
+    fname = Filename(csvfile, columns, header, path)
+    # Write to a temporary file first, so that other processes never see
+    # incomplete tables
+    tmpname = "%s.%d.tmp" % (fname, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(tmpname, "wb") as f:
+            np.save(f, table)
+        os.replace(tmpname, fname)
+    except OSError:
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        raise
+    hdtv.ui.debug("Compiled %s to %s" % (csvfile, fname), level=2)
+    return table
+
+
+def Load(csvfile, columns, header=True):
+    """
+    Return the table of csvfile as (memory mapped) record array, compiling
+    it first if there is no up to date compiled version
+    """
+    name = _StampedName(csvfile, columns, header)
+    for path in (os.path.dirname(os.path.abspath(csvfile)), tabledir):
+        try:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+    try:
+        return Compile(csvfile, columns, header)
+    except OSError as msg:
+        hdtv.ui.debug("Failed to write compiled table: %s" % msg)
+        return Parse(csvfile, columns, header)
+
+
+def Value(row, name, scale=1.0):
+    """
+    Return column name of row as ufloat, or None if it is missing
+    """
+    value = row[name]
+    if np.isnan(value):
+        return None
+    error = row[name + "_err"] if name + "_err" in row.dtype.names else 0.0
+    if np.isnan(error):
+        error = 0.0
+    value = ufloat(float(value), float(error))
+    return value / scale if scale != 1.0 else value
@@ -156,8 +156,13 @@ class DrawableManager(object):
 
     def __init__(self, viewport=None):
         self.viewport = viewport
+        # without viewport, headless managers still keep track of the
+        # visible objects (see hdtv.session.Session)
+        self.headless = False
         # dictionary to store the drawable objects
         self.dict = dict()
+        # sorted index of the keys of dict, created when needed
+        self._index = None
         self.visible = set()
         self.activeID = None
         # This should keep track of ID for nextID, prevID
@@ -167,11 +172,20 @@ class DrawableManager(object):
     def __len__(self):
         return len(self.dict)
 
+    @property
+    def index(self):
+        """
+        Sorted index of the ids, which is renewed after inserting or
+        removing objects
+        """
+        if self._index is None:
+            self._index = hdtv.util.IDIndex(self.dict.keys())
+        return self._index
+
     @property
     def ids(self):
         # return sorted list of ids
-        ids = sorted(self.dict.keys())
-        return ids
+        return list(self.index.ids)
 
     # active property
     def _set_active(self, state):
@@ -189,7 +203,7 @@ class DrawableManager(object):
         """
         Activates the object with ID
         """
-        if ID is not None and ID not in self.ids:
+        if ID is not None and ID not in self.dict:
             raise KeyError
         with LockViewport(self.viewport):
             # change state of former active object
@@ -240,11 +254,17 @@ class DrawableManager(object):
         if ID is None:
             ID = self.GetFreeID()
         self._iteratorID = ID
+        if ID not in self.dict:
+            self._index = None
         self.dict[ID] = obj
         obj.ID = ID
         if self.viewport:
             obj.Draw(self.viewport)
             self.visible.add(ID)
+        elif self.headless:
+            if isinstance(obj, DrawableManager):
+                obj.headless = True
+            self.visible.add(ID)
         return ID
 
     def Pop(self, ID):
@@ -259,6 +279,7 @@ class DrawableManager(object):
         self.visible.discard(ID)
         try:
             obj = self.dict.pop(ID)
+            self._index = None
             obj.ID = None
             return obj
         except KeyError:
@@ -272,14 +293,15 @@ class DrawableManager(object):
         self._iterator = self.activeID
         self.visible.clear()
         self.dict.clear()
+        self._index = None
 
     def GetFreeID(self):
         """
         Finds the first free index
         """
-        ids = [i.major for i in self.ids]
+        majors = {i.major for i in self.dict}
         ID = 0
-        while ID in ids:
+        while ID in majors:
             ID += 1
         return hdtv.util.ID(major=ID)
 
@@ -352,7 +374,7 @@ class DrawableManager(object):
         """
         Hide objects
         """
-        if self.viewport is None:
+        if self.viewport is None and not self.headless:
             return
         with LockViewport(self.viewport):
             # check if just single id
@@ -389,9 +411,10 @@ class DrawableManager(object):
 
         If the clear parameter is True, the display is cleared first.
         Otherwise the objects are shown in addition to the ones, that
-        are already visible.
+        are already visible. In headless mode, only the visibility
+        is recorded.
         """
-        if self.viewport is None:
+        if self.viewport is None and not self.headless:
             return
         with LockViewport(self.viewport):
             # check if just single id
@@ -448,10 +471,9 @@ class DrawableManager(object):
 
     def _firstID(self, onlyVisible=False):
         if onlyVisible:
-            ids = list(self.visible)
+            ids = sorted(self.visible)
         else:
-            ids = list(self.dict.keys())
-        ids.sort()
+            ids = self.index.ids
 
         try:
             firstID = min(ids)
@@ -464,10 +486,9 @@ class DrawableManager(object):
 
     def _lastID(self, onlyVisible=False):
         if onlyVisible:
-            ids = list(self.visible)
+            ids = sorted(self.visible)
         else:
-            ids = list(self.dict.keys())
-        ids.sort()
+            ids = self.index.ids
 
         try:
             lastID = max(ids)
@@ -484,11 +505,9 @@ class DrawableManager(object):
         """
         try:
             if onlyVisible:
-                ids = list(self.visible)
+                ids = sorted(self.visible)
             else:
-                ids = list(self.dict.keys())
-
-            ids.sort()
+                ids = self.index.ids
             nextIndex = (ids.index(self._iteratorID) + 1) % len(ids)
             nextID = ids[nextIndex]
 
@@ -505,11 +524,9 @@ class DrawableManager(object):
         """
         try:
             if onlyVisible:
-                ids = list(self.visible)
+                ids = sorted(self.visible)
             else:
-                ids = list(self.dict.keys())
-
-            ids.sort()
+                ids = self.index.ids
             prevIndex = (ids.index(self._iteratorID) - 1) % len(ids)
             prevID = ids[prevIndex]
         except ValueError:
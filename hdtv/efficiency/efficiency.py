@@ -21,15 +21,57 @@
 
 import array
 import string
-from math import sqrt
-from uncertainties import ufloat
+
+import numpy as np
+from uncertainties import ufloat, correlated_values
 
 from hdtv.util import TxtFile, Pairs
 import hdtv.ui
 from ROOT import TF1, TF2, TGraphErrors, TVirtualFitter
 
 
+def _Energies(E):
+    """
+    Return the nominal values of E (number, ufloat or a sequence of them) as
+    array, and whether E is a scalar
+    """
+    if np.ndim(E) == 0:
+        return np.array([getattr(E, "nominal_value", E)], dtype=float), True
+    E = np.asarray(E)
+    if E.dtype == object:
+        E = np.array([getattr(e, "nominal_value", e) for e in E.ravel()])
+    return E.astype(float).ravel(), False
+
+
+def LinearLeastSquares(A, y, sigma=None):
+    """
+    Solve the linear least squares problem A x = y, weighted with the errors
+    sigma of y. Returns the parameters x, their covariance matrix and chi^2.
+    Without errors, the covariance matrix is scaled with chi^2 / ndf.
+    """
+    if sigma is not None:
+        A = A / sigma[:, np.newaxis]
+        y = y / sigma
+    pars = np.linalg.lstsq(A, y, rcond=None)[0]
+    cov = np.linalg.pinv(A.T @ A)
+    chi2 = float(np.sum((A @ pars - y) ** 2))
+    ndf = len(y) - A.shape[1]
+    if sigma is None and ndf > 0:
+        cov *= chi2 / ndf
+    return (pars, cov, chi2)
+
+
 class _Efficiency(object):
+    """
+    Base class of efficiency functions
+
+    value, error and __call__ accept single energies as well as arrays of
+    energies, which are evaluated in one go. Subclasses define the function
+    in _Eval and its derivatives with respect to the parameters in
+    _dEff_dP (both working on numpy arrays). Models that are linear in their
+    parameters implement _LinearFit and are fitted without MINUIT.
+    """
+
     def __init__(self, num_pars=0, pars=None, norm=True):
         pars = pars or []
 
@@ -84,12 +126,14 @@ class _Efficiency(object):
     parameter = property(_getParameter, _setParameter)
 
     def __call__(self, E):
+        """
+        Efficiency at E as ufloat, or a list of correlated ufloats if E is
+        an array
+        """
         value = self.value(E)
-        try:
-            error = self.error(E)
-        except TypeError:
-            error = None
-        return ufloat(value, error)
+        if np.ndim(value) == 0:
+            return ufloat(value, self.error(E))
+        return correlated_values(value, self.covariance(E))
 
     def _set_fitInput(self, fitPairs):
 
@@ -166,8 +210,6 @@ class _Efficiency(object):
         # self.TGraphWithoutErrors = TGraphErrors(len(E), E, eff, EN, effN)
         # fitWithoutErrors = self.TGraphWithoutErrors.Fit(self.id, "SF")
 
-        hdtv.ui.msg("Fit parameter with errors included:")
-
         # Preliminary normalization
         #        if self._doNorm:
         #            self.norm = 1 / max(efficiencies)
@@ -180,7 +222,19 @@ class _Efficiency(object):
 
         self.TGraph = TGraphErrors(len(E), E, eff, delta_E, delta_eff)
 
+        # Models that are linear in their parameters are fitted in closed form
+        result = self._LinearFit(
+            np.array(E), np.array(delta_E), np.array(eff), np.array(delta_eff)
+        )
+        if result is not None:
+            hdtv.ui.msg("Linear least squares fit with errors included:")
+            (chi2, ndf) = result
+            if not quiet:
+                self._PrintFit(chi2, ndf)
+            return self.parameter
+
         # Do the fit
+        hdtv.ui.msg("Fit parameter with errors included:")
         fitopts = "0"  # Do not plot
 
         if hasXerrors:
@@ -218,15 +272,38 @@ class _Efficiency(object):
             self.parameter[i] = self.TF1.GetParameter(i)
 
         # Get covariance matrix
-        tvf = TVirtualFitter.GetFitter()
-        ##        cov = tvf.GetCovarianceMatrix()
+        try:
+            result = fitreturn.Get()
+            cov = result.CovMatrix
+        except AttributeError:  # ROOT <= 5.24
+            cov = TVirtualFitter.GetFitter().GetCovarianceMatrixElement
         for i in range(0, self._numPars):
             for j in range(0, self._numPars):
-                self.fCov[i][j] = tvf.GetCovarianceMatrixElement(i, j)
-        ##                 self.fCov[i][j] = cov[i * self._numPars + j]
+                self.fCov[i][j] = cov(i, j)
 
         return self.parameter
 
+    def _LinearFit(self, E, delta_E, eff, delta_eff):
+        """
+        Fit models that are linear in their parameters (possibly after a
+        transformation of E and eff) without MINUIT. Sets the parameters and
+        the covariance matrix and returns (chi^2, ndf), or returns None if
+        the model has to be fitted by MINUIT.
+        """
+        return None
+
+    def _PrintFit(self, chi2, ndf):
+        hdtv.ui.msg("Chi2 / NDF = %g / %d" % (chi2, ndf))
+        for i in range(self.TF1.GetNpar()):
+            hdtv.ui.msg(
+                "%4s = %g +/- %g"
+                % (
+                    self.TF1.GetParName(i),
+                    self.TF1.GetParameter(i),
+                    self.TF1.GetParError(i),
+                )
+            )
+
     def normalize(self):
         # Normalize the efficiency funtion
         try:
@@ -239,40 +316,75 @@ class _Efficiency(object):
         normfunc.SetParameter(0, self.norm)
         self.TGraph.Apply(normfunc)
 
-    def value(self, E):
-        try:
-            value = E.nominal_value
-        except AttributeError:
-            value = E
-
-        return self.TF1.Eval(value)
-
-    def error(self, E):
+    def _Eval(self, E, pars):
         """
-        Calculate error using the covariance matrix via:
+        Evaluate the efficiency function at the energies E (array), with the
+        parameters pars of the TF1
+        """
+        return np.array([self.TF1.Eval(e) for e in E])
 
-          delta_Eff = sqrt((dEff_dP[0], dEff_dP[1], ... dEff_dP[num_pars]) x cov x (dEff_dP[0], dEff_dP[1], ... dEff_dP[num_pars]))
+    def _Pars(self):
+        return np.array([self.TF1.GetParameter(i) for i in range(self.TF1.GetNpar())])
 
+    def value(self, E):
+        E, scalar = _Energies(E)
+        with np.errstate(all="ignore"):
+            value = self._Eval(E, self._Pars())
+        return float(value[0]) if scalar else value
+
+    def _ParErrors(self):
         """
-        try:
-            value = E.nominal_value
-        except AttributeError:
-            value = E
+        Errors of the parameters that dEff_dP refer to
+        """
+        return np.array([self.TF1.GetParError(i) for i in range(self._numPars)])
 
+    def _Cov(self):
         if not self.fCov or (len(self.fCov) != self._numPars):
             raise ValueError("Incorrect size of covariance matrix")
+        if any(c is None for row in self.fCov for c in row):
+            # No covariance matrix: use the errors of the parameters,
+            # neglecting their correlations
+            return np.diag(self._ParErrors() ** 2)
+        return np.array(self.fCov, dtype=float)
 
-        res = 0.0
+    def _Jacobian(self, E):
+        """
+        Derivatives dEff_dP at the energies E (array), as matrix of shape
+        (len(E), number of parameters)
+        """
+        pars = self.parameter
+        with np.errstate(all="ignore"):
+            return np.column_stack(
+                [
+                    np.broadcast_to(self._dEff_dP[i](E, pars), E.shape)
+                    for i in range(self._numPars)
+                ]
+            )
 
-        # Do matrix multiplication
-        for i in range(0, self._numPars):
-            tmp = 0.0
-            for j in range(0, self._numPars):
-                tmp += self._dEff_dP[j](value, self.parameter) * self.fCov[i][j]
+    def covariance(self, E):
+        """
+        Covariance matrix of the efficiencies at the energies E (array):
+
+          cov = J x fCov x J^T, with J[i][j] = dEff_dP[j](E[i])
 
-            res += self._dEff_dP[i](value, self.parameter) * tmp
+        """
+        E, _ = _Energies(E)
+        cov = self._Cov()
+        J = self._Jacobian(E)
+        return J @ cov @ J.T
 
-        return sqrt(res)
+    def error(self, E):
+        """
+        Calculate error using the covariance matrix via:
+
+          delta_Eff = sqrt((dEff_dP[0], dEff_dP[1], ... dEff_dP[num_pars]) x cov x (dEff_dP[0], dEff_dP[1], ... dEff_dP[num_pars]))
+
+        """
+        E, scalar = _Energies(E)
+        cov = self._Cov()
+        J = self._Jacobian(E)
+        error = np.sqrt(np.einsum("ij,jk,ik->i", J, cov, J))
+        return float(error[0]) if scalar else error
 
     def loadPar(self, parfile):
         """
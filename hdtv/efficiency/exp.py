@@ -21,7 +21,7 @@
 
 from .efficiency import _Efficiency
 from ROOT import TF1
-import math
+import numpy as np
 
 
 class ExpEff(_Efficiency):
@@ -43,11 +43,11 @@ class ExpEff(_Efficiency):
         # List of derivatives
         self._dEff_dP = [None, None, None, None, None]
         self._dEff_dP[0] = lambda E, fPars: self.norm * (
-            fPars[1] * math.exp((-1.0) * fPars[2] * E)
-            + fPars[3] * math.exp((-1.0) * fPars[4] * E)
+            fPars[1] * np.exp((-1.0) * fPars[2] * E)
+            + fPars[3] * np.exp((-1.0) * fPars[4] * E)
         )  # dEff/dN
         self._dEff_dP[1] = (
-            lambda E, fPars: self.norm * fPars[0] * math.exp((-1.0) * fPars[2] * E)
+            lambda E, fPars: self.norm * fPars[0] * np.exp((-1.0) * fPars[2] * E)
         )  # dEff/da
         self._dEff_dP[2] = (
             lambda E, fPars: self.norm
@@ -55,10 +55,10 @@ class ExpEff(_Efficiency):
             * fPars[0]
             * fPars[1]
             * E
-            * math.exp((-1.0) * fPars[2] * E)
+            * np.exp((-1.0) * fPars[2] * E)
         )  # dEff/db
         self._dEff_dP[3] = (
-            lambda E, fPars: self.norm * fPars[0] * math.exp((-1.0) * fPars[4] * E)
+            lambda E, fPars: self.norm * fPars[0] * np.exp((-1.0) * fPars[4] * E)
         )  # dEff/dc
         self._dEff_dP[4] = (
             lambda E, fPars: self.norm
@@ -66,5 +66,10 @@ class ExpEff(_Efficiency):
             * fPars[0]
             * fPars[3]
             * E
-            * math.exp((-1.0) * fPars[4] * E)
+            * np.exp((-1.0) * fPars[4] * E)
         )  # dEff/dd
+
+    def _Eval(self, E, pars):
+        return pars[0] * (
+            pars[1] * np.exp(-pars[2] * E) + pars[3] * np.exp(-pars[4] * E)
+        )
@@ -19,13 +19,18 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
-from math import pow
+import numpy as np
+from numpy.polynomial import polynomial
 from uncertainties.umath import log, exp
-from .efficiency import _Efficiency
+from .efficiency import _Efficiency, _Energies, LinearLeastSquares
 from ROOT import TF1, TF2
 from hdtv.util import Pairs
 
 
+# Number of fits for the effective variance method
+EFFECTIVE_VARIANCE_ITERATIONS = 4
+
+
 class PolyEff(_Efficiency):
     """
     'Polynom' efficiency
@@ -58,7 +63,7 @@ class PolyEff(_Efficiency):
         # http://code.activestate.com/recipes/502271/
         # for this strange constructor
         def dEff_dP(i):
-            return lambda logE, fPars: self.norm * pow(logE, i)
+            return lambda logE, fPars: self.norm * np.power(logE, i)
 
         for i in range(0, degree + 1):
             self._dEff_dP[i] = dEff_dP(i)
@@ -83,6 +88,44 @@ class PolyEff(_Efficiency):
 
     fitInput = property(_get_fitInput, _set_fitInput)
 
+    def _LinearFit(self, E, delta_E, eff, delta_eff):
+        """
+        Fit the polynomial to log(eff) vs. log(E) by linear least squares.
+        Errors of E are taken into account as effective variance
+        (delta_eff^2 + (deff/dE * delta_E)^2), iterating the fit a few times.
+        """
+        if not ((E > 0).all() and (eff > 0).all()):
+            return None
+        pars = self._Pars()
+        x = np.log(E)
+        y = np.log(eff / self.norm) / pars[0]
+        dx = delta_E / E
+        dy = delta_eff / eff / pars[0]
+        A = polynomial.polyvander(x, self._degree)
+
+        coeffs = None
+        for i in range(EFFECTIVE_VARIANCE_ITERATIONS if dx.any() else 1):
+            variance = dy**2
+            if coeffs is not None:
+                variance = (
+                    variance
+                    + (polynomial.polyval(x, polynomial.polyder(coeffs)) * dx) ** 2
+                )
+            sigma = np.sqrt(variance) if (variance > 0).all() else None
+            (coeffs, cov, chi2) = LinearLeastSquares(A, y, sigma)
+
+        for (i, coeff) in enumerate(coeffs):
+            self.TF1.SetParameter(i + 1, coeff)
+            self.TF1.SetParError(i + 1, np.sqrt(cov[i][i]))
+        ndf = len(x) - len(coeffs)
+        self.TF1.SetChisquare(chi2)
+        self.TF1.SetNDF(ndf)
+
+        # The derivatives dEff_dP are those with respect to the coefficients
+        # of the polynomial
+        self.fCov = cov.tolist()
+        return (chi2, ndf)
+
     def normalize(self):
         # Normalize the efficiency function
 
@@ -101,27 +144,43 @@ class PolyEff(_Efficiency):
         normfunc.SetParameter(0, self.norm)
         self.TGraph.Apply(normfunc)
 
-    def value(self, E):
-        try:
-            value = E.value
-        except AttributeError:
-            value = E
+    def _EvalLog(self, logE, pars):
+        """
+        Evaluate the polynomial at log(E)
+        """
+        return pars[0] * polynomial.polyval(logE, pars[1:])
 
-        return self.norm * exp(self.TF1.Eval(log(value), 0.0, 0.0, 0.0))
-
-    def error(self, E):
+    def _Eval(self, E, pars):
+        return self.norm * np.exp(self._EvalLog(np.log(E), pars))
 
+    def _Error(self, E, ln_err):
+        """
+        Convert the error of the logarithmic efficiency at E to the error of
+        the efficiency
+        """
         # TODO: this need checking
-        try:
-            value = E.value
-        except AttributeError:
-            value = E
+        ln_eff = self._EvalLog(np.log(E), self._Pars())
+        tmp1 = self.norm * np.exp(ln_eff + ln_err)
+        tmp2 = self.norm * np.exp(ln_eff - ln_err)
+
+        return np.abs(tmp1 - tmp2) / 2.0
+
+    def _ParErrors(self):
+        # The derivatives dEff_dP are those with respect to the coefficients
+        # of the polynomial (TF1 parameters 1 to degree + 1)
+        return np.array([self.TF1.GetParError(i + 1) for i in range(self._degree + 1)])
+
+    def covariance(self, E):
+        E, _ = _Energies(E)
+        ln_cov = _Efficiency.covariance(self, np.log(E))
+        ln_err = np.sqrt(np.diag(ln_cov))
+        # Scale the covariance matrix to the errors of the efficiencies
+        with np.errstate(all="ignore"):
+            scale = np.where(ln_err > 0, self._Error(E, ln_err) / ln_err, 0.0)
+        return ln_cov * scale * scale[:, np.newaxis]
 
-        ln_err = _Efficiency.error(self, log(value))
-        ln_eff = self.TF1.Eval(log(value), 0.0, 0.0, 0.0)
-        tmp1 = self.norm * exp(ln_eff + ln_err)
-        tmp2 = self.norm * exp(ln_eff - ln_err)
-
-        error = abs(tmp1 - tmp2) / 2.0
-
-        return self.norm * error
+    def error(self, E):
+        E, scalar = _Energies(E)
+        ln_err = _Efficiency.error(self, np.log(E))
+        error = self._Error(E, ln_err)
+        return float(error[0]) if scalar else error
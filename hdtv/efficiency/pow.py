@@ -21,7 +21,7 @@
 
 from .efficiency import _Efficiency
 from ROOT import TF1
-import math
+import numpy as np
 
 
 class PowEff(_Efficiency):
@@ -42,17 +42,20 @@ class PowEff(_Efficiency):
 
         # List of derivatives
         self._dEff_dP = [None, None, None, None, None]
-        self._dEff_dP[0] = lambda E, fPars: self.norm * fPars[1] + fPars[2] * pow(
+        self._dEff_dP[0] = lambda E, fPars: self.norm * fPars[1] + fPars[2] * np.power(
             E, -fPars[3]
         )  # dEff/dN
         self._dEff_dP[1] = lambda E, fPars: self.norm * fPars[0]  # dEff/da
         self._dEff_dP[2] = (
-            lambda E, fPars: self.norm * fPars[0] * pow(E, -fPars[3])
+            lambda E, fPars: self.norm * fPars[0] * np.power(E, -fPars[3])
         )  # dEff/db
         self._dEff_dP[3] = (
             lambda E, fPars: self.norm
             * fPars[0]
             * fPars[2]
             * (-fPars[3])
-            * pow(E, (-fPars[3] - 1))
+            * np.power(E, (-fPars[3] - 1))
         )  # dEff/dc
+
+    def _Eval(self, E, pars):
+        return pars[0] * (pars[1] + pars[2] * np.power(E, -pars[3]))
@@ -21,7 +21,7 @@
 
 from .efficiency import _Efficiency
 from ROOT import TF1
-import math
+import numpy as np
 
 
 class WiedenhoeverEff(_Efficiency):
@@ -50,20 +50,20 @@ class WiedenhoeverEff(_Efficiency):
         self._dEff_dP[1] = (
             lambda E, fPars: self.norm
             * (-self.value(E))
-            * math.log(E - fPars[2] + fPars[3] * math.exp(-fPars[4] * E))
+            * np.log(E - fPars[2] + fPars[3] * np.exp(-fPars[4] * E))
         )  # dEff/db
         self._dEff_dP[2] = (
             lambda E, fPars: self.norm
             * self.value(E)
             * fPars[1]
-            / (E - fPars[2] + fPars[3] * math.exp(-fPars[4] * E))
+            / (E - fPars[2] + fPars[3] * np.exp(-fPars[4] * E))
         )  # dEff/dc
         self._dEff_dP[3] = (
             lambda E, fPars: self.norm
             * (-self.value(E))
             * fPars[1]
-            / (E - fPars[2] + fPars[3] * math.exp(-fPars[4] * E))
-            * math.exp(-fPars[4] * E)
+            / (E - fPars[2] + fPars[3] * np.exp(-fPars[4] * E))
+            * np.exp(-fPars[4] * E)
         )  # dEff/dd
         self._dEff_dP[4] = (
             lambda E, fPars: self.norm
@@ -71,9 +71,16 @@ class WiedenhoeverEff(_Efficiency):
             * (
                 1 / fPars[4]
                 + fPars[1]
-                / (E - fPars[2] + fPars[3] * math.exp(-fPars[4] * E))
+                / (E - fPars[2] + fPars[3] * np.exp(-fPars[4] * E))
                 * fPars[3]
-                * math.exp(-fPars[4] * E)
+                * np.exp(-fPars[4] * E)
                 * E
             )
         )  # dEff/de
+
+    def _Eval(self, E, pars):
+        return (
+            pars[0]
+            * pars[4]
+            * np.power(E - pars[2] + pars[3] * np.exp(-pars[4] * E), -pars[1])
+        )
@@ -21,7 +21,7 @@
 
 from .efficiency import _Efficiency
 from ROOT import TF1
-import math
+import numpy as np
 
 
 class WunderEff(_Efficiency):
@@ -46,27 +46,27 @@ class WunderEff(_Efficiency):
         self._dEff_dP[0] = (
             lambda E, fPars: self.norm
             * (fPars[1] * E + fPars[2] / E)
-            * math.exp(fPars[3] * E + fPars[4] / E)
+            * np.exp(fPars[3] * E + fPars[4] / E)
         )  # dEff/dN
         self._dEff_dP[0] = (
             lambda E, fPars: self.norm
             * fPars[0]
             * E
-            * math.exp(fPars[3] * E + fPars[4] / E)
+            * np.exp(fPars[3] * E + fPars[4] / E)
         )  # dEff/da
         self._dEff_dP[1] = (
             lambda E, fPars: self.norm
             * fPars[0]
             * 1.0
             / E
-            * math.exp(fPars[3] * E + fPars[4] / E)
+            * np.exp(fPars[3] * E + fPars[4] / E)
         )  # dEff/db
         self._dEff_dP[2] = (
             lambda E, fPars: self.norm
             * fPars[0]
             * (fPars[1] * E + fPars[2] / E)
             * E
-            * math.exp(fPars[3] * E + fPars[4] / E)
+            * np.exp(fPars[3] * E + fPars[4] / E)
         )  # dEff/dc
         self._dEff_dP[3] = (
             lambda E, fPars: self.norm
@@ -74,5 +74,8 @@ class WunderEff(_Efficiency):
             * (fPars[1] * E + fPars[1] / E)
             * 1.0
             / E
-            * math.exp(fPars[3] * E + fPars[4] / E)
+            * np.exp(fPars[3] * E + fPars[4] / E)
         )  # dEff/dd
+
+    def _Eval(self, E, pars):
+        return pars[0] * (pars[1] * E + pars[2] / E) * np.exp(pars[3] * E + pars[4] / E)
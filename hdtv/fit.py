@@ -69,6 +69,10 @@ class Fit(Drawable):
         self.bgChi = None
         self.bgParams = []
         self._showDecomp = Fit.showDecomp
+        # Display functions and integral of restored fits are only created
+        # when they are needed (see Restore)
+        self._pendingDisplay = False
+        self._pendingIntegral = None
         self.dispPeakFunc = None
         self.dispBgFunc = None
         Drawable.__init__(self, color, cal)
@@ -96,10 +100,10 @@ class Fit(Drawable):
             self.peakMarkers.cal = self._cal
             self.regionMarkers.cal = self._cal
             self.bgMarkers.cal = self._cal
-            if self.dispPeakFunc:
-                self.dispPeakFunc.SetCal(self._cal)
-            if self.dispBgFunc:
-                self.dispBgFunc.SetCal(self._cal)
+            if self._dispPeakFunc:
+                self._dispPeakFunc.SetCal(self._cal)
+            if self._dispBgFunc:
+                self._dispBgFunc.SetCal(self._cal)
             for peak in self.peaks:
                 peak.cal = self._cal
 
@@ -162,6 +166,44 @@ class Fit(Drawable):
 
     spec = property(_get_spec, _set_spec)
 
+    # display function properties
+    @property
+    def dispPeakFunc(self):
+        self._CreateDisplayFuncs()
+        return self._dispPeakFunc
+
+    @dispPeakFunc.setter
+    def dispPeakFunc(self, func):
+        self._pendingDisplay = False
+        self._dispPeakFunc = func
+
+    @property
+    def dispBgFunc(self):
+        self._CreateDisplayFuncs()
+        return self._dispBgFunc
+
+    @dispBgFunc.setter
+    def dispBgFunc(self, func):
+        self._pendingDisplay = False
+        self._dispBgFunc = func
+
+    # integral property
+    @property
+    def integral(self):
+        if self._pendingIntegral is not None:
+            region = self._pendingIntegral
+            self._pendingIntegral = None
+            if self.spec is not None:
+                self._integral = hdtv.integral.Integrate(
+                    self.spec, self.fitter.bgFitter, region
+                )
+        return self._integral
+
+    @integral.setter
+    def integral(self, integral):
+        self._pendingIntegral = None
+        self._integral = integral
+
     # ids property to get the ids of the peaks
     @property
     def ids(self):
@@ -384,6 +426,16 @@ class Fit(Drawable):
                 )
         return backgrounds
 
+    def HasExternalBackground(self):
+        """
+        Check if the background is fitted separately from the peaks, either
+        in the background regions or as continuum of the whole spectrum
+        """
+        return (
+            len(self.bgMarkers) > 0
+            or self.fitter.backgroundModel.requiredBgRegions == 0
+        )
+
     def FitBgFunc(self, spec=None):
         """
         Do the background fit and extract the function for display
@@ -394,7 +446,7 @@ class Fit(Drawable):
         self.Erase()
         hdtv.ui.debug("Fitting background")
         # fit background
-        if len(self.bgMarkers) > 0:
+        if self.HasExternalBackground():
             backgrounds = self._get_background_pairs()
 
             try:
@@ -402,7 +454,7 @@ class Fit(Drawable):
                 func = self.fitter.bgFitter.GetFunc()
                 self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(func, hdtv.color.bg)
                 self.dispBgFunc.SetCal(self.cal)
-                self.bgChi = self.fitter.bgFitter.GetChisquare()
+                self.bgChi = self._GetBgChisquare()
                 self.bgParams = []
                 nparams = self.fitter.bgFitter.GetNparams()
                 for i in range(0, nparams):
@@ -415,9 +467,19 @@ class Fit(Drawable):
             except ValueError:
                 raise hdtv.cmdline.HDTVCommandAbort("Background fit failed.")
 
-    def FitPeakFunc(self, spec=None):
+    def _GetBgChisquare(self):
+        """
+        Chi square of the background fit (None for the continuum, which
+        is estimated instead of fitted)
+        """
+        if self.fitter.backgroundModel.requiredBgRegions == 0:
+            return None
+        return self.fitter.bgFitter.GetChisquare()
+
+    def FitPeakFunc(self, spec=None, hist=None):
         """
         Do the actual peak fit and extract the functions for display
+        (fitting hist instead of the histogram of the spectrum, if given)
         Note: You still need to call Draw afterwards.
         """
         # Call pre hooks
@@ -428,10 +490,12 @@ class Fit(Drawable):
             self.spec = spec
         self.Erase()
         # fit background
-        if len(self.bgMarkers) > 0:
+        if self.HasExternalBackground():
             backgrounds = self._get_background_pairs()
             try:
-                self.fitter.FitBackground(spec=self.spec, backgrounds=backgrounds)
+                self.fitter.FitBackground(
+                    spec=self.spec, backgrounds=backgrounds, hist=hist
+                )
             except ValueError:
                 raise hdtv.cmdline.HDTVCommandAbort("Background fit failed.")
         # fit peaks
@@ -446,7 +510,9 @@ class Fit(Drawable):
                 if m.p1.pos_uncal < region[0] or m.p1.pos_uncal > region[1]:
                     self.peakMarkers.remove(m)
             peaks = sorted([m.p1.pos_uncal for m in self.peakMarkers])
-            self.fitter.FitPeaks(spec=self.spec, region=region, peaklist=peaks)
+            self.fitter.FitPeaks(
+                spec=self.spec, region=region, peaklist=peaks, hist=hist
+            )
             # get background function
             self.bgParams = []
             nparams = self.fitter.backgroundModel.fParStatus["nparams"]
@@ -460,7 +526,7 @@ class Fit(Drawable):
                     )
             else:
                 # external background
-                self.bgChi = self.fitter.bgFitter.GetChisquare()
+                self.bgChi = self._GetBgChisquare()
                 for i in range(nparams):
                     self.bgParams.append(
                         ufloat(
@@ -499,7 +565,9 @@ class Fit(Drawable):
         self.cal = spec.cal
         self.color = spec.color
         self.FixMarkerInUncal()
-        if len(self.bgMarkers) > 0 and not self.bgMarkers.IsPending():
+        if self.fitter.backgroundModel.requiredBgRegions == 0:
+            self.fitter.FitBackground(spec)
+        elif len(self.bgMarkers) > 0 and not self.bgMarkers.IsPending():
             backgrounds = Pairs()
             for m in self.bgMarkers:
                 backgrounds.add(m.p1.pos_uncal, m.p2.pos_uncal)
@@ -509,7 +577,6 @@ class Fit(Drawable):
         region = sorted(
             [self.regionMarkers[0].p1.pos_uncal, self.regionMarkers[0].p2.pos_uncal]
         )
-        print(self.bgParams)
         if self.peaks:
             self.fitter.RestorePeaks(
                 cal=self.cal,
@@ -518,29 +585,33 @@ class Fit(Drawable):
                 chisquare=self.chi,
                 coeffs=self.bgParams,
             )
-            # get background function
-            func = self.fitter.peakFitter.GetBgFunc()
-            self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(func, self.color)
-            self.dispBgFunc.SetCal(self.cal)
-            # get peak function
-            func = self.fitter.peakFitter.GetSumFunc()
-            self.dispPeakFunc = ROOT.HDTV.Display.DisplayFunc(func, self.color)
-            self.dispPeakFunc.SetCal(self.cal)
-
-            # restore display functions of single peaks
-            for i in range(0, self.fitter.peakFitter.GetNumPeaks()):
-                cpeak = self.fitter.peakFitter.GetPeak(i)
-                func = cpeak.GetPeakFunc()
-                self.peaks[i].displayObj = ROOT.HDTV.Display.DisplayFunc(
-                    func, self.color
-                )
-                self.peaks[i].displayObj.SetCal(self.cal)
-
+            self._pendingDisplay = True
             # create non-existant integral
-            if not self.integral:
-                self.integral = hdtv.integral.Integrate(
-                    self.spec, self.fitter.bgFitter, region
-                )
+            if not self._integral:
+                self._pendingIntegral = region
+
+    def _CreateDisplayFuncs(self):
+        """
+        Create the display functions of a restored fit
+        """
+        if not self._pendingDisplay:
+            return
+        self._pendingDisplay = False
+        # get background function
+        func = self.fitter.peakFitter.GetBgFunc()
+        self._dispBgFunc = ROOT.HDTV.Display.DisplayFunc(func, self.color)
+        self._dispBgFunc.SetCal(self.cal)
+        # get peak function
+        func = self.fitter.peakFitter.GetSumFunc()
+        self._dispPeakFunc = ROOT.HDTV.Display.DisplayFunc(func, self.color)
+        self._dispPeakFunc.SetCal(self.cal)
+
+        # restore display functions of single peaks
+        for i in range(0, self.fitter.peakFitter.GetNumPeaks()):
+            cpeak = self.fitter.peakFitter.GetPeak(i)
+            func = cpeak.GetPeakFunc()
+            self.peaks[i].displayObj = ROOT.HDTV.Display.DisplayFunc(func, self.color)
+            self.peaks[i].displayObj.SetCal(self.cal)
 
     def Draw(self, viewport):
         """
@@ -551,6 +622,8 @@ class Fit(Drawable):
             # python objects can only be drawn on a single viewport
             raise RuntimeError("Object can only be drawn on a single viewport")
         self.viewport = viewport
+        if self.viewport is None:
+            return
         with LockViewport(self.viewport):
             # draw the markers (do this after the fit,
             # because the fit updates the position of the peak markers)
@@ -603,6 +676,8 @@ class Fit(Drawable):
         """
         Erase previous fit. NOTE: the fitter is *not* resetted
         """
+        # the integral of a restored fit needs the background fitter
+        self.integral
         # remove bg fit
         self.dispBgFunc = None
         self.fitter.bgFitter = None
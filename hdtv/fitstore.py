@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Columnar storage of fit results
+
+A fit store holds the same information as an xml fit list, but as tables
+of columns, so that e.g. the peak positions of thousands of fit lists can
+be scanned without restoring any fits:
+
+fits:       fit, spectrum, calibration, peakModel, backgroundModel,
+            integrate, likelihood, nParams, chi, bgChi
+markers:    fit, type (bg/region/peak), begin_cal, begin_uncal, end_cal,
+            end_uncal
+background: fit, npar, value, error
+peaks:      fit, peak, and for each parameter <par>, <par>_err,
+            <par>_cal, <par>_cal_err and <par>_status, as well as
+            extras.<name> (and extras.<name>_err)
+integrals:  fit, integraltype, caltype, and <name>, <name>_err for each
+            quantity of the integral
+
+Missing values are NaN (numbers) or "" (strings). Stores are written as
+NumPy .npz archives (one array per column), or as Parquet files if pyarrow
+is available (the peaks table as columns, the other tables in the
+metadata).
+"""
+
+import json
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from hdtv.cmdline import HDTVCommandError
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Increase if the layout of the tables changes
+SCHEMA_VERSION = 1
+
+FORMATS = ["xml", "npz", "parquet"]
+TABLES = ["fits", "markers", "background", "peaks", "integrals"]
+
+
+def Format(fname, fmt=None):
+    """
+    Return the format of the fit list fname: fmt, if given, otherwise
+    guessed from the file extension (default: xml)
+    """
+    if fmt is None:
+        if fname.endswith(".npz"):
+            fmt = "npz"
+        elif fname.endswith(".parquet"):
+            fmt = "parquet"
+        else:
+            fmt = "xml"
+    if fmt not in FORMATS:
+        raise HDTVCommandError("Unknown fit list format %s" % fmt)
+    if fmt == "parquet" and pyarrow is None:
+        raise HDTVCommandError("Parquet fit lists require pyarrow")
+    return fmt
+
+
+def _Column(values):
+    """
+    Convert a list of values (None: missing) to an array
+    """
+    kinds = {type(v) for v in values if v is not None}
+    if kinds <= {int} and None not in values:
+        return np.array(values, dtype=np.int64)
+    if all(isinstance(v, (int, float)) for v in values if v is not None):
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _Table(rows):
+    """
+    Convert a list of dicts to a table (dict of columns)
+    """
+    names = dict.fromkeys(name for row in rows for name in row)
+    return {name: _Column([row.get(name) for row in rows]) for name in names}
+
+
+def _Rows(table):
+    """
+    Convert a table to a list of dicts, leaving out missing values
+    """
+    rows = list()
+    names = list(table)
+    for values in zip(*[table[name].tolist() for name in names]):
+        rows.append(
+            {
+                name: value
+                for (name, value) in zip(names, values)
+                if value != "" and not (isinstance(value, float) and np.isnan(value))
+            }
+        )
+    return rows
+
+
+def Tables2Lists(tables):
+    """
+    Convert tables to dicts of lists (e.g. to store them as JSON)
+    """
+    return {
+        name: {col: values.tolist() for (col, values) in table.items()}
+        for (name, table) in tables.items()
+    }
+
+
+def Lists2Tables(lists):
+    """
+    Convert dicts of lists (see Tables2Lists) back to tables
+    """
+    return {
+        name: {col: _Column(values) for (col, values) in table.items()}
+        for (name, table) in lists.items()
+    }
+
+
+def _Value(value, row, name):
+    """
+    Store a ufloat (or None) as name and name_err in row
+    """
+    if value is None:
+        return
+    row[name] = value.nominal_value
+    row[name + "_err"] = value.std_dev
+
+
+def Fits2Tables(fits):
+    """
+    Create the tables of a dict of fits
+    """
+    rows = {name: list() for name in TABLES}
+    for (i, fit) in enumerate(sorted(fits.values(), key=lambda fit: fit.ID)):
+        fitter = fit.fitter
+        rows["fits"].append(
+            {
+                "fit": i,
+                "spectrum": str(fit.spec.name),
+                "calibration": " ".join([f"{c:e}" for c in fit.spec.cal.GetCoeffs()]),
+                "peakModel": fitter.peakModel.name,
+                "backgroundModel": fitter.backgroundModel.name,
+                "integrate": str(fitter.peakModel.fOptStatus["integrate"]),
+                "likelihood": fitter.peakModel.fOptStatus["likelihood"],
+                "nParams": fitter.backgroundModel.fParStatus["nparams"],
+                "chi": fit.chi,
+                "bgChi": fit.bgChi,
+            }
+        )
+        for (mtype, markers) in (
+            ("bg", fit.bgMarkers),
+            ("region", fit.regionMarkers),
+            ("peak", fit.peakMarkers),
+        ):
+            for marker in markers:
+                row = {
+                    "fit": i,
+                    "type": mtype,
+                    "begin_cal": marker.p1.pos_cal,
+                    "begin_uncal": marker.p1.pos_uncal,
+                }
+                if marker.p2 is not None:
+                    row["end_cal"] = marker.p2.pos_cal
+                    row["end_uncal"] = marker.p2.pos_uncal
+                rows["markers"].append(row)
+        for (npar, param) in enumerate(fit.bgParams):
+            rows["background"].append(
+                {
+                    "fit": i,
+                    "npar": npar,
+                    "value": param.nominal_value,
+                    "error": param.std_dev,
+                }
+            )
+        for (j, peak) in enumerate(fit.peaks):
+            row = {"fit": i, "peak": j}
+            for param in sorted(fitter.fParStatus.keys()):
+                status = fitter.fParStatus[param]
+                if isinstance(status, list):
+                    status = status[j]
+                row[param + "_status"] = str(status)
+                _Value(getattr(peak, param), row, param)
+                _Value(getattr(peak, "%s_cal" % param), row, param + "_cal")
+            for (name, value) in sorted(peak.extras.items()):
+                try:
+                    _Value(value, row, "extras." + name)
+                except AttributeError:
+                    row["extras." + name] = str(value)
+            rows["peaks"].append(row)
+        for (integral_type, integral) in (fit.integral or dict()).items():
+            if integral is None:
+                continue
+            for (cal_type, cal_integral) in integral.items():
+                row = {"fit": i, "integraltype": integral_type, "caltype": cal_type}
+                for (name, value) in cal_integral.items():
+                    if name not in ["id", "stat", "type"]:
+                        _Value(value, row, name)
+                rows["integrals"].append(row)
+    return {name: _Table(rows[name]) for name in TABLES}
+
+
+def _SubElement(parent, tag, text):
+    element = ET.SubElement(parent, tag)
+    element.text = str(text)
+    return element
+
+
+def _ValueElements(parent, row, name):
+    if name in row:
+        _SubElement(parent, "value", row[name])
+        _SubElement(parent, "error", row.get(name + "_err", 0.0))
+
+
+def _PositionElements(parent, row, name):
+    _SubElement(parent, "cal", row[name + "_cal"])
+    _SubElement(parent, "uncal", row[name + "_uncal"])
+
+
+def Tables2Xml(tables):
+    """
+    Yield a <fit> element (as in xml fit lists) for each fit of the tables
+    """
+    grouped = dict()
+    for name in TABLES[1:]:
+        grouped[name] = dict()
+        for row in _Rows(tables.get(name, dict())):
+            grouped[name].setdefault(row["fit"], list()).append(row)
+
+    for fit in _Rows(tables["fits"]):
+        i = fit["fit"]
+        fitElement = ET.Element("fit")
+        for name in ["peakModel", "integrate", "likelihood", "nParams"]:
+            fitElement.set(name, str(fit.get(name, "")))
+        fitElement.set("chi", str(fit.get("chi")))
+        specElement = ET.SubElement(fitElement, "spectrum")
+        specElement.set("name", fit.get("spectrum", ""))
+        specElement.set("calibration", fit.get("calibration", ""))
+        for marker in grouped["markers"].get(i, list()):
+            if marker["type"] == "peak":
+                markerElement = ET.SubElement(fitElement, "peakMarker")
+                positionElement = ET.SubElement(markerElement, "position")
+                _PositionElements(positionElement, marker, "begin")
+            else:
+                markerElement = ET.SubElement(fitElement, marker["type"] + "Marker")
+                _PositionElements(
+                    ET.SubElement(markerElement, "begin"), marker, "begin"
+                )
+                _PositionElements(ET.SubElement(markerElement, "end"), marker, "end")
+        bgElement = ET.SubElement(fitElement, "background")
+        params = grouped["background"].get(i, list())
+        bgElement.set("nparams", str(len(params)))
+        bgElement.set("chisquare", str(fit.get("bgChi")))
+        bgElement.set("backgroundModel", fit.get("backgroundModel", "polynomial"))
+        for param in params:
+            paramElement = ET.SubElement(bgElement, "param")
+            paramElement.set("npar", str(param["npar"]))
+            _SubElement(paramElement, "value", param.get("value", np.nan))
+            _SubElement(paramElement, "error", param.get("error", np.nan))
+        for peak in grouped["peaks"].get(i, list()):
+            peakElement = ET.SubElement(fitElement, "peak")
+            uncalElement = ET.SubElement(peakElement, "uncal")
+            for name in sorted(peak):
+                if name.endswith("_status"):
+                    param = name[: -len("_status")]
+                    paramElement = ET.SubElement(uncalElement, param)
+                    paramElement.set("status", peak[name])
+                    _ValueElements(paramElement, peak, param)
+            extraElement = ET.SubElement(peakElement, "extras")
+            for name in sorted(peak):
+                if name.startswith("extras.") and not name.endswith("_err"):
+                    paramElement = ET.SubElement(extraElement, name[len("extras.") :])
+                    if isinstance(peak[name], str):
+                        paramElement.text = peak[name]
+                    else:
+                        _ValueElements(paramElement, peak, name)
+        for integral in grouped["integrals"].get(i, list()):
+            integralElement = fitElement.find(
+                "integral[@integraltype='%s']" % integral["integraltype"]
+            )
+            if integralElement is None:
+                integralElement = ET.SubElement(fitElement, "integral")
+                integralElement.set("integraltype", integral["integraltype"])
+            calElement = ET.SubElement(integralElement, integral["caltype"])
+            for name in integral:
+                if name not in ["fit", "integraltype", "caltype"] and not (
+                    name.endswith("_err")
+                ):
+                    _ValueElements(ET.SubElement(calElement, name), integral, name)
+        yield fitElement
+
+
+def _CheckSchema(version, fname):
+    if version > SCHEMA_VERSION:
+        raise HDTVCommandError(
+            "Fit list %s was written by a newer version of hdtv (schema %d)"
+            % (fname, version)
+        )
+
+
+def Write(file_object, tables, fmt="npz"):
+    """
+    Write tables to a fit store (file name or binary file object)
+    """
+    if fmt == "parquet":
+        metadata = {
+            "hdtv.schema": str(SCHEMA_VERSION),
+            "hdtv.tables": json.dumps(
+                Tables2Lists(
+                    {name: table for (name, table) in tables.items() if name != "peaks"}
+                )
+            ),
+        }
+        table = pyarrow.table(tables["peaks"])
+        table = table.replace_schema_metadata(metadata)
+        pyarrow.parquet.write_table(table, file_object)
+    else:
+        arrays = {
+            "%s.%s" % (name, col): values
+            for (name, table) in tables.items()
+            for (col, values) in table.items()
+        }
+        arrays["schema"] = np.array(SCHEMA_VERSION)
+        np.savez_compressed(file_object, **arrays)
+
+
+def Read(fname, tables=None, columns=None, fmt=None):
+    """
+    Read tables (default: all) from a fit store. If columns is given, only
+    these columns of the peaks table are read.
+    """
+    fmt = Format(fname, fmt)
+    tables = tables or TABLES
+    result = dict()
+    if fmt == "parquet":
+        metadata = pyarrow.parquet.read_schema(fname).metadata or dict()
+        if b"hdtv.schema" not in metadata:
+            raise HDTVCommandError("%s is not a fit store" % fname)
+        _CheckSchema(int(metadata[b"hdtv.schema"]), fname)
+        other = Lists2Tables(json.loads(metadata[b"hdtv.tables"]))
+        for name in tables:
+            if name == "peaks":
+                if columns is not None:
+                    names = pyarrow.parquet.read_schema(fname).names
+                    columns = [col for col in columns if col in names]
+                table = pyarrow.parquet.read_table(fname, columns=columns)
+                result[name] = {
+                    col: table.column(col).to_numpy(zero_copy_only=False)
+                    for col in table.column_names
+                }
+            else:
+                result[name] = other.get(name, dict())
+        return result
+    elif fmt != "npz":
+        raise HDTVCommandError("%s is not a fit store" % fname)
+
+    try:
+        archive = np.load(fname, allow_pickle=False)
+    except (OSError, ValueError) as msg:
+        raise HDTVCommandError("Could not read fit store %s: %s" % (fname, msg))
+    with archive:
+        if "schema" not in archive.files:
+            raise HDTVCommandError("%s is not a fit store" % fname)
+        _CheckSchema(int(archive["schema"]), fname)
+        for name in tables:
+            result[name] = dict()
+        for key in archive.files:
+            (name, _, col) = key.partition(".")
+            if name not in result:
+                continue
+            if name == "peaks" and columns is not None and col not in columns:
+                continue
+            result[name][col] = archive[key]
+    return result
@@ -21,10 +21,36 @@
 
 import ROOT
 
+import hdtv.rootext.fit
+
 import hdtv.peakmodels
 import hdtv.backgroundmodels
 from hdtv.util import Pairs
 
+_threads_enabled = False
+
+
+def EnableThreads():
+    """
+    Prepare ROOT and the C++ fitters for fits running in several python
+    threads at once: enable ROOTs internal locking, give every minimizer
+    its own Minuit instance and release the GIL while the fitters run.
+    """
+    global _threads_enabled
+    if _threads_enabled:
+        return
+    ROOT.EnableThreadSafety()
+    ROOT.TMinuitMinimizer.UseStaticMinuit(False)
+    for cls in (
+        ROOT.HDTV.Fit.TheuerkaufFitter,
+        ROOT.HDTV.Fit.EEFitter,
+        ROOT.HDTV.Fit.PolyBg,
+        ROOT.HDTV.Fit.ExpBg,
+        ROOT.HDTV.Fit.InterpolationBg,
+    ):
+        cls.Fit.__release_gil__ = True
+    _threads_enabled = True
+
 
 class Fitter(object):
     """
@@ -52,10 +78,15 @@ class Fitter(object):
         # Look in peakModel for unknown attributes
         return getattr(self.peakModel, name)
 
-    def FitBackground(self, spec, backgrounds=Pairs()):
+    def FitBackground(self, spec, backgrounds=Pairs(), hist=None):
         """
         Create Background Fitter object and do the background fit
+        (on hist instead of the histogram of spec, if given)
         """
+        if self.backgroundModel.requiredBgRegions == 0:
+            # Continuum of the whole spectrum, which is estimated only once
+            self.bgFitter = self.backgroundModel.GetContinuum(spec)
+            return
         # create fitter
         self.bgFitter = self.backgroundModel.GetFitter(
             integrate=self.peakModel.GetOption("integrate"),
@@ -74,7 +105,7 @@ class Fitter(object):
             for bg in backgrounds:
                 self.bgFitter.AddRegion(bg[0], bg[1])
             # do the background fit
-            self.bgFitter.Fit(spec.hist.hist)
+            self.bgFitter.Fit(spec.hist.hist if hist is None else hist)
 
     def RestoreBackground(self, backgrounds=Pairs(), params=list(), chisquare=0.0):
         """
@@ -95,21 +126,22 @@ class Fitter(object):
             errorArray[i] = param.std_dev
         self.bgFitter.Restore(valueArray, errorArray, chisquare)
 
-    def FitPeaks(self, spec, region=Pairs(), peaklist=list()):
+    def FitPeaks(self, spec, region=Pairs(), peaklist=list(), hist=None):
         """
         Create the Peak Fitter object and do the peak fit
+        (on hist instead of the histogram of spec, if given)
         """
+        if hist is None:
+            hist = spec.hist.hist
         # create the fitter
         self.peakFitter = self.peakModel.GetFitter(region, peaklist, spec.cal)
         # Do the peak fit
         if self.bgFitter:
             # external background
-            self.peakFitter.Fit(spec.hist.hist, self.bgFitter)
+            self.peakFitter.Fit(hist, self.bgFitter)
         else:
             # internal background
-            self.peakFitter.Fit(
-                spec.hist.hist, self.backgroundModel.fParStatus["nparams"]
-            )
+            self.peakFitter.Fit(hist, self.backgroundModel.fParStatus["nparams"])
 
     def RestorePeaks(
         self, cal=None, region=Pairs(), peaks=list(), chisquare=0.0, coeffs=list()
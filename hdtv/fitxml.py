@@ -20,12 +20,18 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
 from uncertainties import ufloat
 
+import hdtv.cal
+import hdtv.fitstore
 import hdtv.ui
+import hdtv.util
 from hdtv.util import Position, LockViewport
 from hdtv.fitter import Fitter
 from hdtv.fit import Fit
+from hdtv.histogram import FileHistogram
+from hdtv.spectrum import Spectrum
 from hdtv.cmdline import HDTVCommandError
 
 # Increase the version number if you changed something related to the xml output.
@@ -38,6 +44,94 @@ from hdtv.cmdline import HDTVCommandError
 VERSION = "1.5"
 
 
+def _indent(elem, level=0):
+    """
+    This function formats the xml in-place for prettyprinting
+
+    Source: http://effbot.org/zone/element-lib.htm#prettyprint
+    """
+    i = "\n" + level * "  "
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + "  "
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+        for elem in elem:
+            _indent(elem, level + 1)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = i
+
+
+class FitlistWriter(object):
+    """
+    Incremental writer of fit lists
+
+    The <fit> elements are serialized one by one as they are passed to
+    write(), so that the complete tree never has to be built. The output
+    is the same as for an indented tree with all fits.
+    """
+
+    def __init__(self, file_object, version=VERSION):
+        self.file_object = file_object
+        self.version = version
+        self.count = 0
+
+    def __enter__(self):
+        self.file_object.write(
+            ("<hdtv version=%s" % quoteattr(self.version)).encode("ascii")
+        )
+        return self
+
+    def write(self, fitElement):
+        """
+        Write a <fit> element
+        """
+        _indent(fitElement, level=1)
+        fitElement.tail = None
+        if self.count == 0:
+            self.file_object.write(b">")
+        self.file_object.write(b"\n  " + ET.tostring(fitElement))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            return
+        if self.count == 0:
+            # Like ElementTree, write an empty list as a single empty element
+            self.file_object.write(b" />")
+        else:
+            self.file_object.write(b"\n</hdtv>\n")
+
+
+def RefitFitlist(xmlfile, specfile, specfmt=None, cal=None):
+    """
+    Read the xml fit list xmlfile, repeat its fits on the spectrum in
+    specfile (with calibration coefficients cal) and return them as fit
+    store tables (see hdtv.fitstore). This needs no session, so that it
+    can run in a worker process. Returns None for fit list versions that
+    cannot be refitted this way.
+    """
+    spec = Spectrum(FileHistogram(specfile, specfmt))
+    spec.cal = hdtv.cal.MakeCalibration(cal)
+    reader = FitXml(None)
+    fits = dict()
+    with hdtv.util.open_compressed(xmlfile, mode="rb") as f:
+        events = ET.iterparse(f, events=("start", "end"))
+        (_, root) = next(events)
+        version = root.get("version") or ""
+        if root.tag != "hdtv" or not version.startswith("1.") or version == "1.0":
+            return None
+        for (i, fitElement) in enumerate(reader._IterFitElements(events, root)):
+            (fit, success) = reader.Xml2Fit_v1(fitElement, calibration=spec.cal)
+            fit.FitPeakFunc(spec)
+            fit.ID = hdtv.util.ID(i)
+            fits[i] = fit
+    return hdtv.fitstore.Fits2Tables(fits)
+
+
 class FitXml(object):
     """
     Class to save and read fit lists to and from xml file
@@ -61,10 +155,21 @@ class FitXml(object):
             fits = self.spectra.dict[sid].dict
         except KeyError:
             raise HDTVCommandError("No spectrum with id %s loaded." % sid)
-        root = self.CreateXml(fits)
-        # save to file
-        tree = ET.ElementTree(root)
-        tree.write(file_object)
+        with FitlistWriter(file_object) as writer:
+            for fit in sorted(fits.values(), key=lambda fit: fit.ID):
+                writer.write(self.Fit2Xml(fit))
+
+    def WriteFitStore(self, file_object, sid=None, fmt="npz"):
+        """
+        Write Fitlist to a fit store (see hdtv.fitstore)
+        """
+        if sid is None:
+            sid = self.spectra.activeID
+        try:
+            fits = self.spectra.dict[sid].dict
+        except KeyError:
+            raise HDTVCommandError("No spectrum with id %s loaded." % sid)
+        hdtv.fitstore.Write(file_object, hdtv.fitstore.Fits2Tables(fits), fmt)
 
     def CreateXml(self, fits):
         """
@@ -239,22 +344,8 @@ class FitXml(object):
     def _indent(self, elem, level=0):
         """
         This function formats the xml in-place for prettyprinting
-
-        Source: http://effbot.org/zone/element-lib.htm#prettyprint
-        """
-        i = "\n" + level * "  "
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + "  "
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for elem in elem:
-                self._indent(elem, level + 1)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-        else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
+        """
+        _indent(elem, level)
 
     ##### Reading of xml #####################################################
 
@@ -319,15 +410,27 @@ class FitXml(object):
             except AttributeError:
                 fname = "fitlist"
             try:
-                tree = ET.parse(file_object)
-                root = tree.getroot()
+                events = ET.iterparse(file_object, events=("start", "end"))
+                (_, root) = next(events)
                 if not root.tag == "hdtv" or root.get("version") is None:
                     e = "this is not a valid hdtv file"
                     raise SyntaxError(e)
+                if (
+                    root.get("version").startswith("1.")
+                    and root.get("version") != "1.0"
+                ):
+                    # Fits are direct children of the root element and can be
+                    # restored one by one while reading the file
+                    elements = self._IterFitElements(events, root)
+                else:
+                    # Older versions need the complete tree
+                    for _ in events:
+                        pass
+                    elements = root
                 # current version
                 if root.get("version") == self.version:
                     count, fits = self.RestoreFromXml(
-                        root,
+                        elements,
                         sid,
                         calibrate=calibrate,
                         refit=refit,
@@ -344,28 +447,28 @@ class FitXml(object):
                             "But this version should be fully compatible with the new version."
                         )
                         count, fits = self.RestoreFromXml_v1_4(
-                            root, sid, calibrate=calibrate, refit=refit
+                            elements, sid, calibrate=calibrate, refit=refit
                         )
                     if oldversion == "1.3":
                         hdtv.ui.msg(
                             "But this version should be fully compatible with the new version."
                         )
                         count, fits = self.RestoreFromXml_v1_3(
-                            root, sid, calibrate=calibrate, refit=refit
+                            elements, sid, calibrate=calibrate, refit=refit
                         )
                     if oldversion == "1.2":
                         hdtv.ui.msg(
                             "But this version should be fully compatible with the new version."
                         )
                         count, fits = self.RestoreFromXml_v1_2(
-                            root, sid, calibrate=calibrate, refit=refit
+                            elements, sid, calibrate=calibrate, refit=refit
                         )
                     if oldversion == "1.1":
                         hdtv.ui.msg(
                             "But this version should be fully compatible with the new version."
                         )
                         count, fits = self.RestoreFromXml_v1_1(
-                            root, sid, calibrate=calibrate, refit=refit
+                            elements, sid, calibrate=calibrate, refit=refit
                         )
                     if oldversion == "1.0":
                         hdtv.ui.msg(
@@ -399,6 +502,67 @@ class FitXml(object):
                 hdtv.ui.msg(msg)
                 return count, fits
 
+    def _IterFitElements(self, events, root):
+        """
+        Yield the <fit> elements of an iterparse stream as soon as they are
+        complete, and remove them from the tree afterwards
+        """
+        depth = 1
+        for (event, elem) in events:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and elem.tag == "fit":
+                yield elem
+                del root[:]
+
+    def ReadFitStore(
+        self, fname, sid=None, calibrate=False, refit=False, interactive=True, fmt=None
+    ):
+        """
+        Reads fitlist from a fit store (see hdtv.fitstore)
+        """
+        tables = hdtv.fitstore.Read(fname, fmt=fmt)
+        return self.RestoreFromTables(
+            tables,
+            sid,
+            calibrate=calibrate,
+            refit=refit,
+            interactive=interactive,
+            fname=fname,
+        )
+
+    def RestoreFromTables(
+        self,
+        tables,
+        sid=None,
+        calibrate=False,
+        refit=False,
+        interactive=True,
+        fname="fitlist",
+    ):
+        """
+        Restores fits from fit store tables (see hdtv.fitstore)
+        """
+        with LockViewport(self.spectra.viewport):
+            if sid is None:
+                sid = self.spectra.activeID
+            if sid not in self.spectra.ids:
+                raise HDTVCommandError("No spectrum with id %s loaded." % sid)
+            count, fits = self.RestoreFromXml(
+                hdtv.fitstore.Tables2Xml(tables),
+                sid,
+                calibrate=calibrate,
+                refit=refit,
+                interactive=interactive,
+            )
+            if count == 1:
+                hdtv.ui.msg("'%s' loaded: 1 fit restored." % fname)
+            else:
+                hdtv.ui.msg("'%s' loaded: %d fits restored." % (fname, count))
+            return count, fits
+
     #### version 1* ###############################################################
     def RestoreFromXml_v1_5(
         self, root, sid, calibrate=False, refit=False, interactive=True
@@ -431,7 +595,9 @@ class FitXml(object):
         do_fit = ""
         fits = list()
         spec_name_last = ""
-        for fitElement in root.findall("fit"):
+        if ET.iselement(root):
+            root = root.findall("fit")
+        for fitElement in root:
             if calibrate:
                 spectrum = fitElement.find("spectrum")
                 spec_name = spectrum.get("name")
@@ -31,7 +31,10 @@ import hdtv.rootext.calibration
 import hdtv.rootext.display
 import hdtv.rootext.fit
 
+import hdtv.cal
+import hdtv.speccache
 from hdtv.drawable import Drawable
+from hdtv.peaksearch import WidthModel
 from hdtv.specreader import SpecReader, SpecReaderError
 from hdtv.cal import CalibrationFitter
 from hdtv.util import LockViewport
@@ -39,6 +42,11 @@ from hdtv.util import LockViewport
 # Don't add created spectra to the ROOT directory
 ROOT.TH1.AddDirectory(ROOT.kFALSE)
 
+# Default peak width (sigma) and clipping window (in units of sigma) for the
+# continuum estimation
+SNIP_SIGMA = 2.5
+SNIP_WINDOW = 4.0
+
 
 def HasPrimitiveBinning(hist):
     if hist.GetNbinsX() != (hist.GetXaxis().GetXmax() - hist.GetXaxis().GetXmin()):
@@ -49,6 +57,35 @@ def HasPrimitiveBinning(hist):
     return True
 
 
+def GetBinCenters(hist):
+    """
+    Return the bin centers of a ROOT histogram as numpy array
+    """
+    axis = hist.GetXaxis()
+    nbins = hist.GetNbinsX()
+    if axis.GetXbins().GetSize() > 0:
+        # Variable bin sizes
+        return np.array([axis.GetBinCenter(i) for i in range(1, nbins + 1)])
+    binwidth = (axis.GetXmax() - axis.GetXmin()) / nbins
+    return axis.GetXmin() + (np.arange(nbins) + 0.5) * binwidth
+
+
+def GetBinContents(hist):
+    """
+    Return the bin contents of a ROOT histogram (without under- and
+    overflow bin) as numpy array
+    """
+    nbins = hist.GetNbinsX()
+    try:
+        buf = hist.GetArray()
+        buf.reshape((nbins + 2,))
+        contents = np.frombuffer(buf, dtype=buf.typecode, count=nbins + 2)
+        return contents[1:-1].astype(np.float64)
+    except (AttributeError, TypeError, ValueError):
+        # Fallback for ROOT versions without buffer access
+        return np.array([hist.GetBinContent(i) for i in range(1, nbins + 1)])
+
+
 class Histogram(Drawable):
     """
     Histogram object
@@ -64,9 +101,12 @@ class Histogram(Drawable):
         self._ID = None
         self.effCal = None
         self.typeStr = "spectrum"
+        # Full-spectrum background estimate, see EstimateContinuum()
+        self.continuum = None
+        self._continuumKey = None
         self.cal = cal
 
-        if cal is None:
+        if cal is None and hist is not None:
             self.SetHistWithPrimitiveBinning(hist)
         else:
             self._hist = hist
@@ -80,9 +120,18 @@ class Histogram(Drawable):
         # create new spectrum object
         return Histogram(hist, color=self.color, cal=self.cal)
 
+    # cal property
+    def _set_cal(self, cal):
+        Drawable._set_cal(self, cal)
+        # The continuum depends on the peak width in channels
+        self.continuum = None
+
+    cal = property(Drawable._get_cal, _set_cal)
+
     # hist property
     def _set_hist(self, hist):
         self._hist = hist
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
 
@@ -167,6 +216,7 @@ class Histogram(Drawable):
                 )
 
         # update display
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
         self.typeStr = "spectrum, modified (sum)"
@@ -197,6 +247,7 @@ class Histogram(Drawable):
                 )
 
         # update display
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
         self.typeStr = "spectrum, modified (difference)"
@@ -207,6 +258,7 @@ class Histogram(Drawable):
         """
         self._hist.Scale(factor)
         # update display
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
         self.typeStr = "spectrum, modified (multiplied)"
@@ -219,6 +271,7 @@ class Histogram(Drawable):
         self._hist.RebinX(ngroup)
         self._hist.GetXaxis().SetLimits(0, bins / ngroup)
         # update display
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
         # update calibration
@@ -226,7 +279,8 @@ class Histogram(Drawable):
             if not self.cal:
                 self.cal.SetCal(0.0, 1.0)
             self.cal.Rebin(ngroup)
-            self.displayObj.SetCal(self.cal)
+            if self.displayObj:
+                self.displayObj.SetCal(self.cal)
             hdtv.ui.info("Calibration updated for rebinned spectrum")
         self.typeStr = f"spectrum, modified (rebinned, ngroup={ngroup})"
 
@@ -299,10 +353,12 @@ class Histogram(Drawable):
         else:
             self.cal.SetCal(binsize / 2, binsize)
         # update display
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
         # update calibration
-        self.displayObj.SetCal(self.cal)
+        if self.displayObj:
+            self.displayObj.SetCal(self.cal)
         hdtv.ui.info(f"Rebinned to calibration unit (binsize={binsize}).")
 
     def Poisson(self):
@@ -314,9 +370,56 @@ class Histogram(Drawable):
             # error = self._hist.GetBinError(i)
             varied = np.random.poisson(counts)
             self._hist.SetBinContent(i, varied)
+        self.continuum = None
         if self.displayObj:
             self.displayObj.SetHist(self._hist)
 
+    def EstimateContinuum(self, width=None, window=SNIP_WINDOW):
+        """
+        Estimate the continuum of the whole spectrum with the SNIP algorithm
+        and keep it as self.continuum (a ROOT.HDTV.Fit.SnipBg), so that it
+        can be used as background by fits, integrals and the peak search.
+
+        width:  energy dependent peak width (hdtv.peaksearch.WidthModel)
+        window: clipping window in units of the peak width (sigma)
+        """
+        if width is None:
+            width = WidthModel.Constant(SNIP_SIGMA)
+        axis = self._hist.GetXaxis()
+        channels = GetBinCenters(self._hist)
+        sigma = width(hdtv.cal.Ch2EArray(self.cal, channels)) / np.abs(
+            hdtv.cal.dEdChArray(self.cal, channels)
+        )
+        windows = np.ascontiguousarray(window * sigma / axis.GetBinWidth(1))
+        continuum = ROOT.HDTV.Fit.SnipBg()
+        continuum.SetWindows(ROOT.TArrayD(len(windows), windows))
+        continuum.Fit(self._hist)
+        self.continuum = continuum
+        self._continuumKey = (
+            tuple(width.coeffs),
+            window,
+            tuple(hdtv.cal.GetCoeffs(self.cal)),
+        )
+        return continuum
+
+    def GetContinuum(self, width=None, window=None):
+        """
+        Return the continuum of the whole spectrum, which is estimated
+        only if there is none yet for the current calibration and (if
+        given) the width model and window
+        """
+        if self.continuum is not None:
+            (cached_width, cached_window, cached_cal) = self._continuumKey
+            if (
+                cached_cal == tuple(hdtv.cal.GetCoeffs(self.cal))
+                and (width is None or tuple(width.coeffs) == cached_width)
+                and (window is None or window == cached_window)
+            ):
+                return self.continuum
+        if window is None:
+            window = SNIP_WINDOW
+        return self.EstimateContinuum(width, window)
+
     def Draw(self, viewport):
         """
         Draw this spectrum to the viewport
@@ -330,7 +433,11 @@ class Histogram(Drawable):
         # Lock updates
         with LockViewport(self.viewport):
             # Show spectrum
-            if self.displayObj is None and self._hist is not None:
+            if (
+                self.displayObj is None
+                and self._hist is not None
+                and self.viewport is not None
+            ):
                 if self.active:
                     color = self._activeColor
                 else:
@@ -408,10 +515,28 @@ class FileHistogram(Histogram):
     A spectrum that comes from a file in any of the formats supported by hdtv.
     """
 
-    def __init__(self, fname, fmt=None, color=hdtv.color.default, cal=None):
+    def __init__(
+        self,
+        fname,
+        fmt=None,
+        color=hdtv.color.default,
+        cal=None,
+        hist=None,
+        lazy=False,
+    ):
         """
         Read a spectrum from file
+
+        If hist is given, it is used instead of reading the file again (e.g.
+        if it was already read in a background thread). If lazy is True, only
+        the header of the file is read now, and the bins are read when they
+        are first needed (i.e. when the spectrum is shown, fitted, ...).
         """
+        self.fmt = fmt
+        self.filename = fname
+        self._filehist = None
+        self._name = os.path.basename(fname)
+        self.nbins = None
         # check if file exists
         try:
             os.path.exists(fname)
@@ -420,19 +545,82 @@ class FileHistogram(Histogram):
             raise
         # call to SpecReader to get the hist
         try:
-            hist = SpecReader.GetSpectrum(fname, fmt)
+            if hist is None and lazy:
+                self.nbins = hdtv.speccache.GetNbins(fname, fmt)
+            if hist is None and self.nbins is None:
+                hist = hdtv.speccache.GetSpectrum(fname, fmt)
         except SpecReaderError as msg:
             hdtv.ui.error(str(msg))
             raise
-        self.fmt = fmt
-        self.filename = fname
         Histogram.__init__(self, hist, color, cal)
         self.typeStr = "spectrum, read from file"
 
+    # The ROOT histogram is read from file on first access, if the spectrum
+    # was loaded lazily
+    def _get_filehist(self):
+        if self._filehist is None and self.nbins is not None:
+            self.Load()
+        return self._filehist
+
+    def _set_filehist(self, hist):
+        self._filehist = hist
+        if hist is not None:
+            self.nbins = hist.GetNbinsX()
+
+    _hist = property(_get_filehist, _set_filehist)
+
+    @property
+    def loaded(self):
+        """
+        True, if the bins have been read from file
+        """
+        return self._filehist is not None
+
+    # name property
+    def _get_name(self):
+        if self.loaded:
+            return self._filehist.GetName()
+        return self._name
+
+    def _set_name(self, name):
+        self._name = name
+        if self.loaded:
+            self._filehist.SetName(name)
+
+    name = property(_get_name, _set_name)
+
+    def Load(self):
+        """
+        Read the bins of a lazily loaded spectrum from disk
+        """
+        hdtv.ui.debug("Reading bins of %s" % self.filename)
+        hist = hdtv.speccache.GetSpectrum(self.filename, self.fmt, histname=self._name)
+        self.SetHistWithPrimitiveBinning(hist)
+
+    def Draw(self, viewport):
+        """
+        Draw this spectrum to the viewport. For lazily loaded spectra, the
+        file is not read before the spectrum is shown.
+        """
+        if not self.loaded:
+            self.viewport = viewport
+            return
+        super(FileHistogram, self).Draw(viewport)
+
+    def Show(self):
+        if not self.loaded and self.viewport is not None:
+            super(FileHistogram, self).Draw(self.viewport)
+        super(FileHistogram, self).Show()
+
     @property
     def info(self):
-        # get the info property of the baseclass
-        s = super(FileHistogram, self).info
+        if not self.loaded:
+            s = "Spectrum type: %s (not read yet)\n" % self.typeStr
+            s += "Name: %s\n" % str(self)
+            s += "Nbins: %d\n" % self.nbins
+        else:
+            # get the info property of the baseclass
+            s = super(FileHistogram, self).info
         s += "Filename: %s\n" % self.filename
         if self.fmt:
             s += "File format: %s\n" % self.fmt
@@ -444,6 +632,9 @@ class FileHistogram(Histogram):
         """
         Reload the spectrum from disk
         """
+        if not self.loaded:
+            # Will be read from disk on first use anyway
+            return
         try:
             os.path.exists(self.filename)
         except OSError:
@@ -451,7 +642,7 @@ class FileHistogram(Histogram):
             return
         # call to SpecReader to get the hist
         try:
-            hist = SpecReader.GetSpectrum(self.filename, self.fmt)
+            hist = hdtv.speccache.GetSpectrum(self.filename, self.fmt)
         except SpecReaderError as msg:
             hdtv.ui.warning(
                 "Failed to load spectrum: %s (file: %s), keeping previous data"
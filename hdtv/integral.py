@@ -25,8 +25,9 @@ import ROOT
 import hdtv.rootext.fit
 
 
-def Integrate(spec, bg, region):
-    hist = spec.hist.hist
+def Integrate(spec, bg, region, hist=None):
+    if hist is None:
+        hist = spec.hist.hist
     region.sort()
 
     int_tot = ROOT.HDTV.Fit.TH1Integral(hist, region[0], region[1])
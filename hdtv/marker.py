@@ -116,6 +116,8 @@ class Marker(Drawable):
             # Marker can only be drawn to a single viewport
             raise RuntimeError("Marker cannot be realized on multiple viewports")
         self.viewport = viewport
+        if self.viewport is None:
+            return
         # adjust the position values for the creation of the makers
         # on the C++ side all values must be uncalibrated
         p1 = self.p1.pos_uncal
@@ -120,6 +120,17 @@ class _OptionManager(dict):
         for key in self.__dict__.keys():
             self.__dict__[key].Reset()
 
+    def Changed(self):
+        """
+        Returns a dict of all variables that differ from their default value,
+        with the values as strings.
+        """
+        return {
+            k: str(v)
+            for (k, v) in sorted(self.__dict__.items())
+            if v.value != v.defaultValue
+        }
+
     def Show(self, varname):
         """
         Shows the value of the variable varname
@@ -167,5 +178,6 @@ Set = OptionManager.Set
 Get = OptionManager.Get
 Reset = OptionManager.Reset
 ResetAll = OptionManager.ResetAll
+Changed = OptionManager.Changed
 Show = OptionManager.Show
 Str = OptionManager.Str
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Native peak search for 1-d spectra
+
+The search convolves the spectrum with the negative second derivative of a
+Gaussian (a "Mexican hat" filter), whose width follows an energy-dependent
+width model. The filter suppresses constant and linear background, so peaks
+show up as local maxima of the filter response. Every candidate comes with
+a significance, i.e. the filter response in units of its Poisson uncertainty.
+
+Channels with similar peak widths are grouped into chunks that are filtered
+independently (and in parallel, as numpy releases the GIL in its inner loops).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+# Relative change of the peak width which starts a new filter chunk
+WIDTH_STEP = 0.1
+# Maximum number of channels filtered in one chunk
+CHUNK_SIZE = 8192
+# Half width of the filter kernel in units of sigma
+KERNEL_HALF_WIDTH = 4.0
+
+
+class WidthModel(object):
+    """
+    Energy-dependent peak width
+
+    The width (standard deviation) of the peaks is parametrized as
+
+        sigma(E)^2 = c0 + c1 * E + c2 * E^2
+
+    which covers the usual contributions of electronic noise, charge
+    statistics and charge collection in semiconductor detectors.
+    """
+
+    def __init__(self, coeffs):
+        coeffs = list(coeffs)
+        if not 1 <= len(coeffs) <= 3:
+            raise ValueError("Width model needs between one and three coefficients")
+        self.coeffs = coeffs + [0.0] * (3 - len(coeffs))
+
+    def __str__(self):
+        return "sigma(E)^2 = %g + %g*E + %g*E^2" % tuple(self.coeffs)
+
+    def __call__(self, energy):
+        """
+        Return sigma at energy (scalar or array)
+        """
+        energy = np.asarray(energy, dtype=float)
+        c0, c1, c2 = self.coeffs
+        sigma2 = c0 + energy * (c1 + energy * c2)
+        return np.sqrt(np.maximum(sigma2, 0.0))
+
+    @classmethod
+    def Parse(cls, text):
+        """
+        Create a width model from a string of comma separated coefficients
+        """
+        try:
+            return cls(float(c) for c in text.split(","))
+        except ValueError as msg:
+            raise ValueError("Invalid width model %r: %s" % (text, msg))
+
+    @classmethod
+    def Constant(cls, sigma):
+        """
+        Width model with the same width at all energies
+        """
+        if sigma <= 0:
+            raise ValueError("Sigma must be > 0")
+        return cls([sigma**2])
+
+    @classmethod
+    def FromPeaks(cls, energies, fwhms, degree=2):
+        """
+        Fit the width model to a list of peak energies and their FWHMs
+        """
+        energies = np.asarray(energies, dtype=float)
+        sigma2 = (
+            np.asarray(fwhms, dtype=float) / (2.0 * np.sqrt(2.0 * np.log(2.0)))
+        ) ** 2
+        degree = min(degree, len(energies) - 1)
+        if degree < 0:
+            raise ValueError("Need at least one peak to determine the width model")
+        matrix = np.vander(energies, degree + 1, increasing=True)
+        coeffs, *_ = np.linalg.lstsq(matrix, sigma2, rcond=None)
+        return cls(coeffs)
+
+
+class PeakCandidate(object):
+    """
+    Peak found by the peak search (all values in channels)
+    """
+
+    __slots__ = ("pos", "height", "sigma", "significance")
+
+    def __init__(self, pos, height, sigma, significance):
+        self.pos = pos
+        self.height = height
+        self.sigma = sigma
+        self.significance = significance
+
+    def __repr__(self):
+        return "PeakCandidate(pos=%.2f, height=%.1f, sigma=%.2f, significance=%.1f)" % (
+            self.pos,
+            self.height,
+            self.sigma,
+            self.significance,
+        )
+
+    def __lt__(self, other):
+        return self.pos < other.pos
+
+
+def Kernel(sigma):
+    """
+    Negative second derivative of a gaussian, normalized to zero sum so that
+    constant and linear background does not contribute to the response.
+    Returns the kernel and its response to a gaussian of unit height.
+    """
+    half = int(np.ceil(KERNEL_HALF_WIDTH * sigma))
+    x = np.arange(-half, half + 1, dtype=float)
+    gauss = np.exp(-0.5 * (x / sigma) ** 2)
+    kernel = (1.0 - (x / sigma) ** 2) * gauss
+    kernel -= kernel.mean()
+    return kernel, np.dot(kernel, gauss)
+
+
+def Chunks(sigma, chunk_size=CHUNK_SIZE):
+    """
+    Split the channel range into chunks of similar peak width.
+    Returns a list of (start, stop, sigma) tuples.
+    """
+    classes = np.round(np.log(sigma) / np.log1p(WIDTH_STEP)).astype(int)
+    edges = np.flatnonzero(np.diff(classes)) + 1
+    bounds = np.concatenate(([0], edges, [len(sigma)]))
+    chunks = list()
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        for a in range(start, stop, chunk_size):
+            b = min(a + chunk_size, stop)
+            chunks.append((a, b, float(np.median(sigma[a:b]))))
+    return chunks
+
+
+def _SearchChunk(padded, padded_counts, pad, start, stop, sigma, min_significance):
+    """
+    Filter one chunk and return positions, heights and significances of
+    the local maxima of the filter response. The variance of the response
+    is always taken from the (unsubtracted) counts.
+    """
+    kernel, unit_response = Kernel(sigma)
+    half = len(kernel) // 2
+    section = slice(pad + start - half - 1, pad + stop + half + 1)
+    response = np.correlate(padded[section], kernel, mode="valid")
+    variance = np.correlate(
+        np.maximum(padded_counts[section], 1.0), kernel**2, mode="valid"
+    )
+    significance = response / np.sqrt(variance)
+
+    # response has one extra channel at each side for the maximum search
+    window = 2 * int(np.ceil(sigma)) + 1
+    inner = response[1:-1]
+    is_max = (
+        (inner > response[:-2])
+        & (inner >= response[2:])
+        & (inner >= maximum_filter1d(response, window)[1:-1])
+        & (significance[1:-1] >= min_significance)
+    )
+    idx = np.flatnonzero(is_max) + 1
+
+    # Parabolic interpolation of the maximum position
+    left, center, right = response[idx - 1], response[idx], response[idx + 1]
+    denom = left - 2.0 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = np.where(denom < 0, 0.5 * (left - right) / denom, 0.0)
+
+    return (
+        start + idx - 1 + delta,
+        center / unit_response,
+        np.full(len(idx), sigma),
+        significance[idx],
+    )
+
+
+def SearchPeaks(
+    counts,
+    sigma,
+    threshold=0.0,
+    significance=3.0,
+    start=0,
+    stop=None,
+    nthreads=None,
+    background=None,
+):
+    """
+    Search peaks in an array of bin contents
+
+    counts:       bin contents
+    sigma:        peak width in channels, either a scalar or one value per bin
+    threshold:    minimum peak height as fraction of the highest peak found
+    significance: minimum significance (response / uncertainty) of a peak
+    start, stop:  range of bins to search in
+    nthreads:     number of threads to use (default: number of CPUs)
+    background:   continuum (one value per bin) to subtract before the search
+
+    Returns a list of PeakCandidates, sorted by position. Positions are
+    given as (fractional) indices into counts.
+    """
+    counts = np.asarray(counts, dtype=float)
+    nbins = len(counts)
+    start = max(int(start), 0)
+    stop = nbins if stop is None else min(int(np.ceil(stop)), nbins)
+    if stop <= start:
+        return list()
+
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (nbins,))[start:stop]
+    if np.any(sigma <= 0):
+        raise ValueError("Sigma must be > 0")
+
+    chunks = Chunks(sigma)
+    pad = int(np.ceil(KERNEL_HALF_WIDTH * sigma.max())) + 2
+    padded_counts = np.pad(counts, pad, mode="edge")
+    if background is None:
+        padded = padded_counts
+    else:
+        padded = np.pad(counts - np.asarray(background, dtype=float), pad, mode="edge")
+
+    def search(chunk):
+        a, b, s = chunk
+        return _SearchChunk(
+            padded, padded_counts, pad, start + a, start + b, s, significance
+        )
+
+    if len(chunks) > 1 and nthreads != 1:
+        with ThreadPoolExecutor(max_workers=nthreads or os.cpu_count()) as pool:
+            results = list(pool.map(search, chunks))
+    else:
+        results = [search(chunk) for chunk in chunks]
+
+    pos, height, width, signif = (np.concatenate(r) for r in zip(*results))
+    keep = height > 0
+    if np.any(keep):
+        keep &= height >= threshold * height[keep].max()
+
+    return sorted(
+        PeakCandidate(*values)
+        for values in zip(pos[keep], height[keep], width[keep], signif[keep])
+    )
@@ -23,11 +23,16 @@
 Function for energy calibration
 """
 
+import numpy as np
+from scipy.ndimage import uniform_filter1d
 from uncertainties import ufloat
 
+import hdtv.cal
+import hdtv.cmdline
 import hdtv.util
 import hdtv.ui
 from hdtv.database import IAEALibraries, DDEPLibraries
+from hdtv.peaksearch import SearchPeaks
 
 
 def SearchNuclide(nuclide, database):
@@ -76,50 +81,30 @@ def TableOfNuclide(data):
     hdtv.ui.msg(html=str(table))
 
 
-def MatchPeaksAndEnergies(peaks, energies, sigma):
+def _Nominal(values):
+    return np.array([getattr(v, "nominal_value", v) for v in values], dtype=float)
+
+
+def MatchPeaksAndEnergies(peaks, energies, sigma, method="gradient"):
     """
     Combines Peaks with the right energies from the table (with searchEnergie).
-    """
-    gradient = []  # list of all gradients energy/PeakPosition
-    pair = []  # list of all possible pairs energy, Peak
-    accordanceCount = []
 
+    method "gradient" looks for the most frequent gradient energy/peak
+    (within sigma) among all (peak, energy) pairs, i.e. for a calibration
+    without offset. method "ransac" fits offset and gain to randomly chosen
+    pairs of (peak, energy) pairs and takes the calibration that matches
+    the most peaks (within sigma * peak).
+    """
     # error message if there are no given peaks
-    if peaks == []:
+    if len(peaks) == 0:
         raise hdtv.cmdline.HDTVCommandError("You must fit at least one peak.")
+    if len(energies) == 0:
+        return []
 
-    # saves all pairs and gradients in lists
-    for peak in peaks:
-        for energy in energies:
-            gradient.append(1.0 * energy / peak)
-            pair.append([peak, energy])
-            accordanceCount.append(0)
-
-    NumberHighestAccordance = 0
-    bestAccordance = 0  # gradient with best accordance to the others
-
-    # compare all gradients with each other to find the most frequently one
-    # (within sigma)
-    for i in range(0, len(gradient)):
-        for j in range(0, len(gradient)):
-            if gradient[j] > gradient[i] - sigma and gradient[j] < gradient[i] + sigma:
-                accordanceCount[i] = accordanceCount[i] + 1
-                if accordanceCount[i] > NumberHighestAccordance:
-                    NumberHighestAccordance = accordanceCount[i]
-                    bestAccordance = gradient[i]
-
-    accordance = []  # all pairs with the right gradient will be saved in this list
-
-    for i in range(0, len(gradient)):
-        if (
-            gradient[i] > bestAccordance - sigma
-            and gradient[i] < bestAccordance + sigma
-        ):
-            for a in accordance:
-                if a[0] == pair[i][0] or a[1] == pair[i][1]:
-                    hdtv.ui.msg(f"{a} {pair[i]}")
-                    hdtv.ui.warning("Some peaks/energies are used more than one time.")
-            accordance.append(pair[i])
+    if method == "ransac":
+        accordance = _MatchRansac(peaks, energies, sigma)
+    else:
+        accordance = _MatchGradient(peaks, energies, sigma)
 
     if len(accordance) < 4:
         # hdtv.ui.msg(accordance)
@@ -128,6 +113,157 @@ def MatchPeaksAndEnergies(peaks, energies, sigma):
     return accordance
 
 
+def _MatchGradient(peaks, energies, sigma):
+    # all gradients energy/PeakPosition, in the order of the pairs (peak, energy)
+    gradient = np.divide.outer(_Nominal(energies), _Nominal(peaks)).T.ravel()
+
+    # count, for each gradient, the gradients within sigma and take the one
+    # with the highest count (the first one, if there are several)
+    ordered = np.sort(gradient)
+    accordanceCount = np.searchsorted(
+        ordered, gradient + sigma, "left"
+    ) - np.searchsorted(ordered, gradient - sigma, "right")
+    bestAccordance = gradient[np.argmax(accordanceCount)]
+
+    accordance = []  # all pairs with the right gradient will be saved in this list
+    usedPeaks = set()
+    usedEnergies = set()
+    for i in np.flatnonzero(np.abs(gradient - bestAccordance) < sigma):
+        (p, e) = divmod(int(i), len(energies))
+        if p in usedPeaks or e in usedEnergies:
+            hdtv.ui.warning("Some peaks/energies are used more than one time.")
+        usedPeaks.add(p)
+        usedEnergies.add(e)
+        accordance.append([peaks[p], energies[e]])
+    return accordance
+
+
+# Probability with which the RANSAC matcher draws at least one pair of peaks
+# that both belong to the nuclide(s), and number of the best (offset, gain)
+# hypotheses that are refined
+RANSAC_CONFIDENCE = 0.999
+RANSAC_REFINE = 20
+
+
+def _RansacIterations(inliers, confidence=RANSAC_CONFIDENCE):
+    """
+    Number of random pairs of peaks needed to draw, with probability
+    confidence, at least one pair of inliers, if the fraction inliers of
+    the peaks are inliers
+    """
+    if inliers >= 1.0:
+        return 1
+    if inliers <= 0.0:
+        return np.inf
+    return np.ceil(np.log(1.0 - confidence) / np.log(1.0 - inliers**2))
+
+
+def _Nearest(ordered, calibrated):
+    """
+    Return the indices of the values in ordered (sorted, at least two values)
+    which are nearest to calibrated (any shape)
+    """
+    right = np.clip(np.searchsorted(ordered, calibrated), 1, len(ordered) - 1)
+    left = right - 1
+    return np.where(
+        np.abs(ordered[left] - calibrated) <= np.abs(ordered[right] - calibrated),
+        left,
+        right,
+    )
+
+
+def _Assign(channels, ordered, offset, gain, sigma):
+    """
+    Assign the nearest energy (index into ordered) to each peak, if it is
+    within sigma * channel of the calibrated peak position. Each energy is
+    used at most once. Returns arrays of peak and energy indices.
+    """
+    calibrated = offset + gain * channels
+    nearest = _Nearest(ordered, calibrated)
+    distance = np.abs(ordered[nearest] - calibrated)
+
+    # If several peaks share an energy, keep the closest one
+    candidates = np.flatnonzero(distance < sigma * np.abs(channels))
+    candidates = candidates[np.lexsort((distance[candidates], nearest[candidates]))]
+    _, first = np.unique(nearest[candidates], return_index=True)
+    peak_idx = np.sort(candidates[first])
+    return peak_idx, nearest[peak_idx]
+
+
+def _MatchRansac(peaks, energies, sigma):
+    channels = _Nominal(peaks)
+    order = np.argsort(_Nominal(energies), kind="stable")
+    ordered = _Nominal(energies)[order]
+    if len(channels) < 2 or len(ordered) < 2:
+        # Not enough peaks or energies for a line
+        return _MatchGradient(peaks, energies, sigma)
+
+    # Hypotheses from two peaks and two energies, in the same order: random
+    # pairs of peaks, each combined with all pairs of energies. If both
+    # peaks of a pair belong to the nuclide(s), one of these hypotheses is
+    # right. The number of pairs follows from the fraction of peaks matched
+    # by the best hypothesis so far (the estimated inlier fraction), so that
+    # such a pair is drawn with probability RANSAC_CONFIDENCE. Pairs are
+    # drawn without replacement, so all of them are tried for few peaks.
+    rng = np.random.default_rng(0)
+    ek, el = np.triu_indices(len(ordered), 1)
+    pairs = np.transpose(np.triu_indices(len(channels), 1))
+    pairs = pairs[rng.permutation(len(pairs))]
+    offsets = list()
+    gains = list()
+    score = list()
+    (iterations, best) = (np.inf, 0)
+    for (n, (i, j)) in enumerate(pairs):
+        if n >= iterations:
+            break
+        (i, j) = sorted((i, j), key=channels.take)
+        if channels[i] == channels[j]:
+            continue
+        gain = (ordered[el] - ordered[ek]) / (channels[j] - channels[i])
+        offset = ordered[ek] - gain * channels[i]
+        valid = gain > 0
+        (gain, offset) = (gain[valid], offset[valid])
+        # Score all hypotheses at once by the number of energies with a
+        # peak nearby
+        calibrated = offset[:, None] + gain[:, None] * channels[None, :]
+        nearest = _Nearest(ordered, calibrated)
+        distance = np.abs(ordered[nearest] - calibrated)
+        matched = np.where(distance < sigma * np.abs(channels), nearest, -1)
+        matched.sort(axis=1)
+        score.append(
+            np.sum((np.diff(matched, axis=1) != 0) & (matched[:, 1:] >= 0), axis=1)
+            + (matched[:, 0] >= 0)
+        )
+        offsets.append(offset)
+        gains.append(gain)
+        if len(score[-1]) > 0 and score[-1].max() > best:
+            best = score[-1].max()
+            iterations = _RansacIterations(best / len(channels))
+    if not gains:
+        return _MatchGradient(peaks, energies, sigma)
+    (offsets, gains, score) = map(np.concatenate, (offsets, gains, score))
+
+    # Refine the best hypotheses with a linear fit to their matches
+    best = (0, 0.0, None)
+    for i in np.argsort(-score, kind="stable")[:RANSAC_REFINE]:
+        (offset, gain) = (offsets[i], gains[i])
+        (p, e) = _Assign(channels, ordered, offset, gain, sigma)
+        for _ in range(2):
+            if len(p) < 2:
+                break
+            (g, o) = np.polyfit(channels[p], ordered[e], 1)
+            (p_new, e_new) = _Assign(channels, ordered, o, g, sigma)
+            if len(p_new) < len(p):
+                break
+            (p, e, offset, gain) = (p_new, e_new, o, g)
+        residual = -np.sum((ordered[e] - offset - gain * channels[p]) ** 2)
+        if best[2] is None or (len(p), residual) > best[:2]:
+            best = (len(p), residual, (p, e))
+
+    (p, e) = best[2]
+    return [[peaks[i], energies[order[j]]] for (i, j) in zip(p, e)]
+
+
 def MatchFitsAndTransitions(fits, transitions, sigma=0.5):
     """
     Combines peaks with the right intensities.
@@ -138,3 +274,191 @@ def MatchFitsAndTransitions(fits, transitions, sigma=0.5):
         for transition in transitions
         if abs(transition["energy"] - fit.ExtractParams()[0][0]["pos"]) <= sigma
     ]
+
+
+def CalibrateSpectrum(
+    counts,
+    xmin,
+    binwidth,
+    energies,
+    width,
+    degree=1,
+    sigma=0.001,
+    method="gradient",
+    threshold=0.0,
+    significance=5.0,
+    ignore_errors=False,
+):
+    """
+    Calibrate a spectrum with the bin contents counts against the reference
+    energies: search for peaks, match them to the energies and fit a
+    calibration polynomial. No ROOT objects are used, so that several
+    spectra can be calibrated in parallel.
+
+    width: peak width in channels (hdtv.peaksearch.WidthModel)
+
+    Returns a dict with the number of peaks found, the matched channels and
+    energies, the calibration coefficients, chi^2, ndf and the residuals.
+    """
+    channels = xmin + (np.arange(len(counts)) + 0.5) * binwidth
+    candidates = SearchPeaks(
+        counts,
+        width(channels) / binwidth,
+        threshold=threshold,
+        significance=significance,
+        nthreads=1,
+    )
+    peaks = [xmin + (c.pos + 0.5) * binwidth for c in candidates]
+    if not peaks:
+        raise hdtv.cmdline.HDTVCommandError("No peaks found")
+
+    pairs = MatchPeaksAndEnergies(peaks, energies, sigma, method)
+    channels = np.array([p[0] for p in pairs], dtype=float)
+    matched = [p[1] for p in pairs]
+    errors = np.array([getattr(e, "std_dev", 0.0) for e in matched])
+    if ignore_errors or not (errors > 0).all():
+        errors = None
+    try:
+        (coeffs, chi2) = hdtv.cal.FitPolynomial(
+            channels, _Nominal(matched), degree, errors
+        )
+    except RuntimeError:
+        raise hdtv.cmdline.HDTVCommandError(
+            "Only %d (peak, energy) pairs found, need at least %d"
+            % (len(pairs), max(degree, 0) + 1)
+        )
+    residuals = _Nominal(matched) - np.polynomial.polynomial.polyval(channels, coeffs)
+
+    return {
+        "peaks": len(peaks),
+        "channels": channels,
+        "energies": matched,
+        "coeffs": coeffs,
+        "chi2": chi2,
+        "ndf": len(pairs) - max(degree, 0) - 1,
+        "residuals": residuals,
+    }
+
+
+# Lowest bin of the log-scale spectra used for the gain estimate
+DRIFT_MIN_BIN = 16
+# Width of the window in which a peak is searched, in units of its sigma
+DRIFT_WINDOW = 3.0
+
+
+def ReferencePeaks(counts, sigma, npeaks, significance=5.0):
+    """
+    Return the bin positions of the npeaks highest peaks in counts, sorted by
+    position (sigma: peak width in bins as function of the bin position)
+    """
+    bins = np.arange(len(counts), dtype=float)
+    candidates = SearchPeaks(counts, sigma(bins), significance=significance, nthreads=1)
+    candidates = sorted(candidates, key=lambda c: -c.height)[:npeaks]
+    return np.sort([c.pos for c in candidates])
+
+
+def _LogSpectrum(counts, nbins):
+    """
+    Spectrum on a logarithmic bin scale, where a change of the gain is a
+    shift. The continuum is suppressed by subtracting a moving average.
+    """
+    grid = np.geomspace(DRIFT_MIN_BIN, len(counts) - 1, nbins)
+    values = np.sqrt(np.maximum(np.interp(grid, np.arange(len(counts)), counts), 0.0))
+    return values - uniform_filter1d(values, size=max(nbins // 64, 3))
+
+
+def GainRatio(reference, counts, max_shift=0.05):
+    """
+    Estimate the gain of counts relative to reference (the ratio of the bin
+    positions of the same peak in both spectra) by cross-correlation on a
+    logarithmic scale. Only ratios within 1 +/- max_shift are considered.
+    """
+    nbins = min(len(reference), len(counts))
+    if nbins <= 2 * DRIFT_MIN_BIN:
+        return 1.0
+    step = np.log((nbins - 1) / DRIFT_MIN_BIN) / (nbins - 1)
+    a = _LogSpectrum(counts[:nbins], nbins)
+    b = _LogSpectrum(reference[:nbins], nbins)
+    corr = np.fft.irfft(np.fft.rfft(a, 2 * nbins) * np.conj(np.fft.rfft(b, 2 * nbins)))
+    maxlag = min(int(np.ceil(np.log1p(max_shift) / step)), nbins - 2)
+    lags = np.arange(-maxlag, maxlag + 1)
+    values = corr[lags]
+    i = int(np.argmax(values))
+    lag = float(lags[i])
+    if 0 < i < len(values) - 1:
+        # Parabolic interpolation of the maximum
+        denom = values[i - 1] - 2.0 * values[i] + values[i + 1]
+        if denom < 0:
+            lag += 0.5 * (values[i - 1] - values[i + 1]) / denom
+    return float(np.exp(lag * step))
+
+
+def LocatePeaks(counts, start, sigma):
+    """
+    Locate peaks near the bin positions start, as centroid (above a linear
+    background) in a window of +/- DRIFT_WINDOW sigma (peak width in bins as
+    function of the bin position). Peaks that cannot be located are NaN.
+    """
+    positions = np.full(len(start), np.nan)
+    for (i, (pos, width)) in enumerate(zip(start, sigma(np.asarray(start)))):
+        if not np.isfinite(pos):
+            continue
+        lo = int(np.floor(pos - DRIFT_WINDOW * width))
+        hi = int(np.ceil(pos + DRIFT_WINDOW * width)) + 1
+        if lo < 0 or hi > len(counts) or hi - lo < 3:
+            continue
+        bins = np.arange(lo, hi, dtype=float)
+        window = counts[lo:hi]
+        net = window - np.interp(bins, [bins[0], bins[-1]], [window[0], window[-1]])
+        if net.sum() <= 0:
+            continue
+        positions[i] = np.sum(net * bins) / net.sum()
+    return positions
+
+
+def TrackSlice(
+    counts, xmin, binwidth, peaks, cal, sigma, reference, degree=1, start=None
+):
+    """
+    Calibrate a time slice of a measurement with respect to a reference
+    spectrum with the calibration coefficients cal: locate the reference
+    peaks (bin positions peaks in the reference spectrum) in the bin contents
+    counts of the slice, and fit the correction from the channels of the
+    slice to the reference channels with a polynomial of the given degree.
+
+    The peaks are searched near their bin positions start (default: peaks)
+    in the spectrum with the bin contents reference, scaled by the gain
+    ratio from a cross-correlation of both spectra, so that reference may
+    also be the previous slice. sigma is the peak width in bins as function
+    of the bin position.
+
+    Returns a dict with the gain ratio, the located bin positions, the
+    coefficients of the correction and of the calibration of the slice and
+    the residuals (in energy).
+    """
+    peaks = np.asarray(peaks, dtype=float)
+    if start is None:
+        start = peaks
+    start = np.asarray(start, dtype=float) * GainRatio(reference, counts)
+    positions = LocatePeaks(counts, start, sigma)
+    found = np.isfinite(positions)
+    if found.sum() < degree + 1:
+        raise hdtv.cmdline.HDTVCommandError(
+            "Only %d of %d reference peaks found" % (found.sum(), len(peaks))
+        )
+    channels = xmin + (positions[found] + 0.5) * binwidth
+    ref_channels = xmin + (peaks[found] + 0.5) * binwidth
+    (correction, chi2) = hdtv.cal.FitPolynomial(channels, ref_channels, degree)
+    coeffs = np.polynomial.Polynomial(cal)(np.polynomial.Polynomial(correction)).coef
+    residuals = np.polynomial.polynomial.polyval(
+        ref_channels, cal
+    ) - np.polynomial.polynomial.polyval(channels, coeffs)
+
+    return {
+        "gain": float(np.median(positions[found] / peaks[found])),
+        "positions": positions,
+        "found": int(found.sum()),
+        "correction": list(correction),
+        "coeffs": list(coeffs),
+        "residuals": residuals,
+    }
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Core plugins of hdtv
+
+The plugins in EAGER are imported at startup (they e.g. register hotkeys of
+the spectrum window), except for those in INTERACTIVE in headless sessions.
+The plugins in LAZY are only imported when one of their commands is used
+for the first time; until then, their commands are declared here as
+(title, level, fileargs), which must match the arguments of their
+AddCommand calls.
+"""
+
+EAGER = [
+    "hdtv.plugins.textInterface",
+    "hdtv.plugins.ls",
+    "hdtv.plugins.run",
+    "hdtv.plugins.specInterface",
+    "hdtv.plugins.fitInterface",
+    "hdtv.plugins.matInterface",
+    "hdtv.plugins.config",
+]
+
+INTERACTIVE = ["hdtv.plugins.textInterface"]
+
+LAZY = {
+    "hdtv.plugins.calInterface": [
+        ("calibration efficiency set", None, False),
+        ("calibration efficiency read parameter", None, False),
+        ("calibration efficiency read covariance", None, False),
+        ("calibration efficiency write parameter", None, False),
+        ("calibration efficiency write covariance", None, False),
+        ("calibration efficiency plot", None, False),
+        ("calibration efficiency fit", None, False),
+        ("calibration efficiency list", None, False),
+        ("calibration position set", None, False),
+        ("calibration position unset", None, False),
+        ("calibration position copy", None, False),
+        ("calibration position enter", 0, True),
+        ("calibration position nuclide", None, False),
+        ("calibration position batch", None, False),
+        ("calibration position drift", None, False),
+        ("nuclide", None, False),
+        ("calibration position read", None, True),
+        ("calibration position assign", None, False),
+        ("calibration position list", None, False),
+        ("calibration position list write", None, True),
+        ("calibration position list read", None, True),
+        ("calibration position list clear", None, False),
+    ],
+    "hdtv.plugins.rootInterface": [
+        ("root ls", None, False),
+        ("root ll", 0, False),
+        ("root pwd", None, False),
+        ("root browse", None, False),
+        ("root open", None, True),
+        ("root close", None, False),
+        ("root cd", None, False),
+        ("root get", None, False),
+        ("root matrix view", None, False),
+        ("root matrix get", None, False),
+        ("root cut view", None, False),
+        ("root cut delete", None, False),
+    ],
+    "hdtv.plugins.fitlist": [
+        ("fit write", None, True),
+        ("fit read", None, True),
+        ("fit query", None, True),
+        ("fit getlists", None, True),
+        ("fit savelists", None, True),
+    ],
+    "hdtv.plugins.fittex": [
+        ("fit tex", None, False),
+    ],
+    "hdtv.plugins.fitmap": [
+        ("fit position assign", None, False),
+        ("fit position erase", None, False),
+        ("fit position map", None, True),
+        ("calibration position recalibrate", None, False),
+    ],
+    "hdtv.plugins.dblookup": [
+        ("db lookup", None, False),
+        ("db list", None, False),
+        ("db set", None, False),
+        ("db info", None, False),
+        ("db compile", None, False),
+        ("db ddep import", None, True),
+        ("db ddep prefetch", None, False),
+        ("db ddep list", None, False),
+        ("db ddep clear", None, False),
+    ],
+    "hdtv.plugins.peakfinder": [
+        ("fit peakfind", 4, False),
+    ],
+    "hdtv.plugins.printing": [
+        ("print", None, True),
+    ],
+    "hdtv.plugins.sessionInterface": [
+        ("session save", None, True),
+        ("session load", None, True),
+    ],
+}
+
+
+def EagerPlugins(headless=False):
+    """
+    Returns the plugins to import at startup
+    """
+    if headless:
+        return [module for module in EAGER if module not in INTERACTIVE]
+    return EAGER
+
+
+def DeclareLazyCommands():
+    """
+    Declare the commands of all plugins in LAZY
+    """
+    import hdtv.cmdline
+
+    for (module, commands) in LAZY.items():
+        for (title, level, fileargs) in commands:
+            hdtv.cmdline.AddLazyCommand(title, module, level=level, fileargs=fileargs)
@@ -25,6 +25,10 @@ Functions for efficiency, energy calibration
 
 import argparse
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from uncertainties import ufloat, ufloat_fromstr
 
 import hdtv.efficiency
@@ -34,6 +38,8 @@ import hdtv.ui
 import hdtv.cal
 import hdtv.util
 from hdtv.fitxml import FitXml
+from hdtv.histogram import GetBinContents
+from hdtv.peaksearch import WidthModel
 from . import EnergyCalibration
 
 
@@ -254,16 +260,16 @@ class EffCalIf(object):
             for match in matches:
                 tabledata.append(
                     {
-                        "Peak": match["fit"].ExtractParams()[0][0]["pos"],
+                        "Peak": match["pos"],
                         "Efficiency": match["efficiency"],
                         "ID": spectrumID,
                         "Nuclide": nuclide,
                         "Intensity": match["transition"]["intensity"],
-                        "Vol": match["fit"].ExtractParams()[0][0]["vol"],
+                        "Vol": match["vol"],
                     }
                 )
 
-            energies = [match["fit"].ExtractParams()[0][0]["pos"] for match in matches]
+            energies = [match["pos"] for match in matches]
             efficiencies = [match["efficiency"] for match in matches]
             fitValues.fromLists(energies, efficiencies)
 
@@ -293,19 +299,17 @@ class EffCalIf(object):
                         )
 
                     # all new efficiencies are added to the first ones
-                    energies.extend(
-                        [match["fit"].ExtractParams()[0][0]["pos"] for match in NewEff]
-                    )
+                    energies.extend([match["pos"] for match in NewEff])
                     efficiencies.extend([match["efficiency"] for match in NewEff])
                     for match in NewEff:
                         tabledata.append(
                             {
-                                "Peak": match["fit"].ExtractParams()[0][0]["pos"],
+                                "Peak": match["pos"],
                                 "Efficiency": match["efficiency"],
                                 "ID": spectrumIDs[j],
                                 "Nuclide": nuclides[j],
                                 "Intensity": match["transition"]["intensity"],
-                                "Vol": match["fit"].ExtractParams()[0][0]["vol"],
+                                "Vol": match["vol"],
                             }
                         )
 
@@ -361,7 +365,10 @@ class EffCalIf(object):
 
         # Calculate efficiency
         for match in matches:
-            match["efficiency"] = match["fit"].ExtractParams()[0][0]["vol"] / (
+            params = match["fit"].ExtractParams()[0][0]
+            match["pos"] = params["pos"]
+            match["vol"] = params["vol"]
+            match["efficiency"] = match["vol"] / (
                 coefficient * match["transition"]["intensity"]
             )
 
@@ -381,55 +388,27 @@ class EffCalIf(object):
         # calculate efficiency values for peaks
         matches = self.CalculateEff(spectrumID, nuclide, 1, source, sigma)
 
-        division = 0.0
-        amountDivisionError = 0.0
-        amountError = 0.0
+        # evaluate the reference efficiency at all peaks at once
+        positions = np.array(
+            [getattr(m["pos"], "nominal_value", m["pos"]) for m in matches]
+        )
+        efficiencies = np.array([m["efficiency"].nominal_value for m in matches])
+        std_devs = np.array([m["efficiency"].std_dev for m in matches])
+        divisions = efficiencies / self.spectra.dict[referenceID].effCal.value(
+            positions
+        )
 
-        # calculates the factor of the nuclide
+        # calculates the factor of the nuclide as mean of the divisions below
+        # maxEnergy (or of all divisions, if there are none), weighted with
+        # the errors of the efficiencies if possible
         # TODO: maybe a iterative function works better
-        try:
-            for match in matches:
-                energy = match["fit"].ExtractParams()[0][0]["pos"]
-                if energy <= maxEnergy:
-                    functionValue = self.spectra.dict[referenceID].effCal.value(energy)
-
-                    division = match["efficiency"].nominal_value / functionValue
-                    amountDivisionError = amountDivisionError + division * (
-                        match["efficiency"].std_dev
-                    ) ** (-2)
-                    amountError = amountError + (match["efficiency"].std_dev) ** (-2)
-
-        except BaseException:
-            division = 0.0
-            amountDivisionError = 0.0
-            amountError = 0.0
-
-            for match in matches:
-                energy = match["fit"].ExtractParams()[0][0]["pos"]
-                if energy <= maxEnergy:
-                    functionValue = self.spectra.dict[referenceID].effCal.value(energy)
-
-                    division = match["efficiency"].nominal_value / functionValue
-                    amountDivisionError = amountDivisionError + division
-                    amountError = amountError + 1
-
-        if amountError == 0:
-            division = 0.0
-            amountDivisionError = 0.0
-            amountError = 0.0
-
-            for match in matches:
-                energy = match["fit"].ExtractParams()[0][0]["pos"]
-                functionValue = self.spectra.dict[referenceID].effCal.nominal_value(
-                    energy
-                )
-
-                division = match["efficiency"].nominal_value / functionValue
-                amountDivisionError = amountDivisionError + division
-                amountError = amountError + 1
-
-        # the mean value of the divisions is calculated
-        factor = amountDivisionError / amountError
+        selected = positions <= getattr(maxEnergy, "nominal_value", maxEnergy)
+        if not selected.any():
+            factor = np.mean(divisions)
+        elif (std_devs[selected] > 0).all():
+            factor = np.average(divisions[selected], weights=std_devs[selected] ** (-2))
+        else:
+            factor = np.mean(divisions[selected])
 
         # the corrected efficiency is calculated
         # Efficiency[1] = list(map(lambda x: x / factor, Efficiency[1]))
@@ -912,6 +891,135 @@ class EnergyCalIf(object):
             valid_pairs, degree, table, fit, residual, ignore_errors=ignore_errors
         )
 
+    def CalFromSearch(self, ids, energies, width, nthreads=None, **kwargs):
+        """
+        Calibrate several spectra against the same reference energies, by
+        searching for peaks, matching them to the energies and fitting a
+        calibration polynomial (see EnergyCalibration.CalibrateSpectrum,
+        which also takes the remaining arguments). The spectra are processed
+        in parallel. Returns a dict of the results by spectrum ID; spectra
+        that could not be calibrated are left out.
+        """
+        jobs = list()
+        for ID in ids:
+            hist = self.spectra.dict[ID].hist.hist
+            axis = hist.GetXaxis()
+            jobs.append((ID, GetBinContents(hist), axis.GetXmin(), axis.GetBinWidth(1)))
+
+        def calibrate(job):
+            (ID, counts, xmin, binwidth) = job
+            try:
+                result = EnergyCalibration.CalibrateSpectrum(
+                    counts, xmin, binwidth, energies, width, **kwargs
+                )
+            except (hdtv.cmdline.HDTVCommandError, ValueError) as msg:
+                return (ID, None, msg)
+            return (ID, result, None)
+
+        with ThreadPoolExecutor(max_workers=nthreads or os.cpu_count()) as pool:
+            results = list(pool.map(calibrate, jobs))
+
+        for (ID, result, msg) in results:
+            if result is None:
+                hdtv.ui.warning("Could not calibrate spectrum %s: %s" % (ID, msg))
+        return {ID: result for (ID, result, msg) in results if result is not None}
+
+    def CalFromDrift(
+        self,
+        refID,
+        ids,
+        width,
+        npeaks=10,
+        degree=1,
+        significance=5.0,
+        follow=False,
+        nthreads=None,
+    ):
+        """
+        Track the gain drift of the spectra ids (time slices of a measurement,
+        in chronological order) with respect to the calibrated reference
+        spectrum refID: the npeaks highest peaks of the reference spectrum
+        are located in each slice, and their channels are used to correct
+        the reference calibration (see EnergyCalibration.TrackSlice).
+
+        The peaks are searched near the positions predicted from a
+        cross-correlation with the reference spectrum, so that all slices
+        are processed in parallel, or, if follow is set, from a
+        cross-correlation with the previous slice and the positions found
+        there.
+
+        Returns a list of (ID, result) in the order of ids, where result is
+        None for slices that could not be calibrated.
+        """
+        refspec = self.spectra.dict[refID]
+        if refspec.cal is None or refspec.cal.IsTrivial():
+            raise hdtv.cmdline.HDTVCommandError(
+                "Reference spectrum %s is not calibrated" % refID
+            )
+        cal = hdtv.cal.GetCoeffs(refspec.cal)
+        hist = refspec.hist.hist
+        axis = hist.GetXaxis()
+        binning = (hist.GetNbinsX(), axis.GetXmin(), axis.GetBinWidth(1))
+        (_, xmin, binwidth) = binning
+        reference = GetBinContents(hist)
+
+        def sigma(bins):
+            return width(xmin + (bins + 0.5) * binwidth) / binwidth
+
+        peaks = EnergyCalibration.ReferencePeaks(reference, sigma, npeaks, significance)
+        if len(peaks) < degree + 1:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Only %d peaks found in reference spectrum" % len(peaks)
+            )
+
+        jobs = list()
+        for ID in ids:
+            hist = self.spectra.dict[ID].hist.hist
+            axis = hist.GetXaxis()
+            if (hist.GetNbinsX(), axis.GetXmin(), axis.GetBinWidth(1)) != binning:
+                hdtv.ui.warning(
+                    "Binning of spectrum %s differs from reference spectrum, ignored"
+                    % ID
+                )
+                continue
+            jobs.append((ID, GetBinContents(hist)))
+
+        def track(ID, counts, previous=reference, start=None):
+            try:
+                result = EnergyCalibration.TrackSlice(
+                    counts,
+                    xmin,
+                    binwidth,
+                    peaks,
+                    cal,
+                    sigma,
+                    previous,
+                    degree=degree,
+                    start=start,
+                )
+            except (hdtv.cmdline.HDTVCommandError, ValueError) as msg:
+                hdtv.ui.warning("Could not calibrate spectrum %s: %s" % (ID, msg))
+                return (ID, None)
+            return (ID, result)
+
+        if not follow:
+            with ThreadPoolExecutor(max_workers=nthreads or os.cpu_count()) as pool:
+                return list(pool.map(lambda job: track(*job), jobs))
+
+        results = list()
+        (previous, start) = (reference, None)
+        for (ID, counts) in jobs:
+            results.append(track(ID, counts, previous, start))
+            result = results[-1][1]
+            if result is not None:
+                previous = counts
+                start = np.where(
+                    np.isfinite(result["positions"]),
+                    result["positions"],
+                    peaks * result["gain"],
+                )
+        return results
+
     def CalsFromList(self, fname):
         """
         Reads calibrations from a calibration list file. The file has the format
@@ -1112,9 +1220,211 @@ class EnergyCalHDTVInterface(object):
             default="active",
             help="Database from witch the data should be imported.",
         )
+        parser.add_argument(
+            "-m",
+            "--method",
+            choices=["gradient", "ransac"],
+            default="gradient",
+            help="how to match peaks and energies: most frequent gradient "
+            "energy/channel (no offset) or RANSAC fit of offset and gain "
+            "(default: %(default)s)",
+        )
         parser.add_argument("nuclide", nargs="+", help="nuclide to use for calibration")
         hdtv.cmdline.AddCommand(prog, self.CalPosNuc, parser=parser)
 
+        prog = "calibration position batch"
+        description = """Calibrate several spectra with the same calibration
+        source: search for peaks in each spectrum, match them to the energies
+        of the given nuclides and fit a calibration polynomial. Spectra are
+        processed in parallel."""
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-s",
+            "--spectrum",
+            action="store",
+            default="all",
+            help="spectrum ids to calibrate (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-d",
+            "--degree",
+            action="store",
+            default=1,
+            type=int,
+            help="degree of calibration polynomial fitted [default: %(default)s]",
+        )
+        parser.add_argument(
+            "-w",
+            "--width",
+            action="store",
+            default="4",
+            help="channel dependent peak width, given as comma separated "
+            "coefficients c0,c1,c2 of sigma(ch)^2 = c0 + c1*ch + c2*ch^2 "
+            "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "--threshold",
+            action="store",
+            default=0.01,
+            type=float,
+            help="minimum peak height, as fraction of the highest peak "
+            "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "--significance",
+            action="store",
+            default=5.0,
+            type=float,
+            help="minimum significance of peaks (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-S",
+            "--sigma",
+            action="store",
+            default=0.001,
+            type=float,
+            help="allowed error by variation of energy/channel "
+            "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "-m",
+            "--method",
+            choices=["gradient", "ransac"],
+            default="ransac",
+            help="how to match peaks and energies (see calibration position "
+            "nuclide, default: %(default)s)",
+        )
+        parser.add_argument(
+            "-D",
+            "--database",
+            action="store",
+            default="active",
+            help="Database from witch the data should be imported.",
+        )
+        parser.add_argument(
+            "-i",
+            "--ignore-errors",
+            action="store_true",
+            default=False,
+            help="set all weights to 1 in fit (ignore errors of the energies)",
+        )
+        parser.add_argument(
+            "-t",
+            "--show-table",
+            action="store_true",
+            default=False,
+            help="print table of energies given and energies obtained from fit",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            action="store",
+            default=None,
+            type=int,
+            help="number of parallel jobs (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            action="store",
+            default=None,
+            help="write the calibrations to a calibration list file",
+        )
+        parser.add_argument(
+            "-F",
+            "--force",
+            action="store_true",
+            default=False,
+            help="overwrite existing files without asking",
+        )
+        parser.add_argument("nuclide", nargs="+", help="nuclide to use for calibration")
+        hdtv.cmdline.AddCommand(prog, self.CalPosBatch, parser=parser)
+
+        prog = "calibration position drift"
+        description = """Follow the gain drift in a series of spectra (e.g.
+        time slices of a measurement, in chronological order): the highest
+        peaks of a calibrated reference spectrum are located in each spectrum
+        and used to correct the reference calibration. The spectra are
+        processed in parallel, unless the peaks are followed from spectrum
+        to spectrum."""
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-r",
+            "--reference",
+            action="store",
+            default="active",
+            help="calibrated reference spectrum (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-s",
+            "--spectrum",
+            action="store",
+            default="all",
+            help="spectrum ids to calibrate (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-d",
+            "--degree",
+            action="store",
+            default=1,
+            type=int,
+            help="degree of the correction polynomial [default: %(default)s]",
+        )
+        parser.add_argument(
+            "-w",
+            "--width",
+            action="store",
+            default="4",
+            help="channel dependent peak width, given as comma separated "
+            "coefficients c0,c1,c2 of sigma(ch)^2 = c0 + c1*ch + c2*ch^2 "
+            "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "-n",
+            "--peaks",
+            action="store",
+            default=10,
+            type=int,
+            help="number of reference peaks (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--significance",
+            action="store",
+            default=5.0,
+            type=float,
+            help="minimum significance of reference peaks (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            default=False,
+            help="follow the peaks from spectrum to spectrum, correlating each "
+            "spectrum with the previous one instead of the reference spectrum",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            action="store",
+            default=None,
+            type=int,
+            help="number of parallel jobs (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            action="store",
+            default=None,
+            help="write the calibrations to a calibration list file",
+        )
+        parser.add_argument(
+            "-F",
+            "--force",
+            action="store_true",
+            default=False,
+            help="overwrite existing files without asking",
+        )
+        hdtv.cmdline.AddCommand(prog, self.CalPosDrift, parser=parser)
+
         prog = "nuclide"
         description = "Prints out the Information of the nuclide."
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
@@ -1378,7 +1688,9 @@ class EnergyCalHDTVInterface(object):
         energies = [t["energy"] for t in transitions]
 
         # matches the right peaks with the right energy
-        Match = EnergyCalibration.MatchPeaksAndEnergies(Peaks, energies, args.sigma)
+        Match = EnergyCalibration.MatchPeaksAndEnergies(
+            Peaks, energies, args.sigma, args.method
+        )
 
         # prints all important values
         nuclideStr = " ".join(args.nuclide)
@@ -1407,6 +1719,190 @@ class EnergyCalHDTVInterface(object):
         for ID in spectrumID:
             self.spectra.ApplyCalibration(ID, cal)  # do the calibration
 
+    def CalPosBatch(self, args):
+        """
+        Calibrate several spectra from a peak search
+        """
+        ids = hdtv.util.ID.ParseIds(args.spectrum, self.spectra)
+        if not ids:
+            hdtv.ui.warning("Nothing to do")
+            return
+        try:
+            width = WidthModel.Parse(args.width)
+        except ValueError as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+        nuclei = [
+            EnergyCalibration.SearchNuclide(nucl, args.database)
+            for nucl in args.nuclide
+        ]
+        energies = [t["energy"] for n in nuclei for t in n["transitions"]]
+
+        results = self.EnergyCalIf.CalFromSearch(
+            ids,
+            energies,
+            width,
+            nthreads=args.jobs,
+            degree=args.degree,
+            sigma=args.sigma,
+            method=args.method,
+            threshold=args.threshold,
+            significance=args.significance,
+            ignore_errors=args.ignore_errors,
+        )
+        if not results:
+            raise hdtv.cmdline.HDTVCommandError("No spectrum could be calibrated")
+
+        cals = dict()
+        tabledata = list()
+        residuals = list()
+        for (ID, result) in results.items():
+            name = self.spectra.dict[ID].name
+            cals[ID] = hdtv.cal.MakeCalibration(result["coeffs"])
+            tabledata.append(
+                {
+                    "id": ID,
+                    "name": name,
+                    "peaks": result["peaks"],
+                    "matches": len(result["channels"]),
+                    "chi2": "%.4f" % result["chi2"],
+                    "chi2_ndf": "%.4f" % (result["chi2"] / result["ndf"])
+                    if result["ndf"] > 0
+                    else "",
+                    "rms": "%.3f" % np.sqrt(np.mean(result["residuals"] ** 2)),
+                    "max": "%.3f" % np.max(np.abs(result["residuals"])),
+                }
+            )
+            for (ch, e, residual) in zip(
+                result["channels"], result["energies"], result["residuals"]
+            ):
+                residuals.append(
+                    {
+                        "id": ID,
+                        "channel": "%10.2f" % ch,
+                        "e_given": "%10.2f" % e.nominal_value,
+                        "e_fit": "%10.2f" % (e.nominal_value - residual),
+                        "residual": "%10.2f" % residual,
+                    }
+                )
+
+        table = hdtv.util.Table(
+            tabledata,
+            ["id", "name", "peaks", "matches", "chi2", "chi2_ndf", "rms", "max"],
+            header=[
+                "ID",
+                "Name",
+                "Peaks",
+                "Matches",
+                "Chi²",
+                "Chi²/NDF",
+                "RMS residual",
+                "Max residual",
+            ],
+            sortBy="id",
+        )
+        hdtv.ui.msg(html=str(table))
+        if args.show_table:
+            table = hdtv.util.Table(
+                residuals,
+                ["id", "channel", "e_given", "e_fit", "residual"],
+                header=["ID", "Channel", "E_given", "E_fit", "Residual"],
+            )
+            hdtv.ui.msg(html=str(table))
+
+        for (ID, cal) in cals.items():
+            self.spectra.ApplyCalibration([ID], cal)
+
+        if args.output is not None:
+            self.WriteCalList(cals, args.output, args.force)
+
+    def WriteCalList(self, cals, output, force=False):
+        """
+        Write the calibrations cals ({ID: cal}) of spectra to a calibration
+        list, which is keyed by the spectrum names. Spectra with the same name
+        (e.g. files with the same name in different directories) cannot be
+        told apart there, so the list is not written for them.
+        """
+        names = dict()
+        for ID in sorted(cals.keys()):
+            names.setdefault(self.spectra.dict[ID].name, list()).append(ID)
+        duplicates = [
+            "%s (%s)" % (name, ", ".join(str(ID) for ID in ids))
+            for (name, ids) in names.items()
+            if len(ids) > 1
+        ]
+        if duplicates:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Not writing calibration list %s, since spectra have the same "
+                "name: %s" % (output, "; ".join(duplicates))
+            )
+        fname = hdtv.util.user_save_file(output, force)
+        if not fname:
+            return
+        caldict = {name: cals[ids[0]] for (name, ids) in names.items()}
+        with open(fname, "w") as calfile:
+            calfile.write(self.EnergyCalIf.CreateCalList(caldict))
+
+    def CalPosDrift(self, args):
+        """
+        Follow the gain drift in a series of spectra
+        """
+        refIDs = hdtv.util.ID.ParseIds(args.reference, self.spectra)
+        if len(refIDs) != 1:
+            raise hdtv.cmdline.HDTVCommandError("Need exactly one reference spectrum")
+        ids = hdtv.util.ID.ParseIds(args.spectrum, self.spectra)
+        if not ids:
+            hdtv.ui.warning("Nothing to do")
+            return
+        try:
+            width = WidthModel.Parse(args.width)
+        except ValueError as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+
+        results = self.EnergyCalIf.CalFromDrift(
+            refIDs[0],
+            ids,
+            width,
+            npeaks=args.peaks,
+            degree=args.degree,
+            significance=args.significance,
+            follow=args.follow,
+            nthreads=args.jobs,
+        )
+
+        cals = dict()
+        tabledata = list()
+        for (ID, result) in results:
+            name = self.spectra.dict[ID].name
+            if result is None:
+                tabledata.append({"id": ID, "name": name})
+                continue
+            cals[ID] = hdtv.cal.MakeCalibration(result["coeffs"])
+            tabledata.append(
+                {
+                    "id": ID,
+                    "name": name,
+                    "gain": "%.6f" % result["gain"],
+                    "peaks": "%d/%d" % (result["found"], len(result["positions"])),
+                    "rms": "%.3f" % np.sqrt(np.mean(result["residuals"] ** 2)),
+                    "cal": hdtv.cal.PrintCal(cals[ID]),
+                }
+            )
+        table = hdtv.util.Table(
+            tabledata,
+            ["id", "name", "gain", "peaks", "rms", "cal"],
+            header=["ID", "Name", "Gain", "Peaks", "RMS residual", "Calibration"],
+            ignoreEmptyCols=False,
+        )
+        hdtv.ui.msg(html=str(table))
+        if not cals:
+            raise hdtv.cmdline.HDTVCommandError("No spectrum could be calibrated")
+
+        for (ID, cal) in cals.items():
+            self.spectra.ApplyCalibration([ID], cal)
+
+        if args.output is not None:
+            self.WriteCalList(cals, args.output, args.force)
+
     def CalPosRead(self, args):
         """
         Read calibration from file
@@ -1494,19 +1990,16 @@ class EnergyCalHDTVInterface(object):
         # update calcdict of main session
         self.spectra.caldict.update(caldict)
         for name in caldict.keys():
-            for sid in self.spectra.dict.keys():
-                if self.spectra.dict[sid].name == name:
-                    cal = caldict[name]
-                    self.spectra.ApplyCalibration([sid], cal)
+            for sid in self.spectra.GetIDsByName(name):
+                self.spectra.ApplyCalibration([sid], caldict[name])
 
     def CalPosListClear(self, args):
         """
         Clear list of name <-> calibration pairs
         """
         for name in list(self.spectra.caldict.keys()):
-            for sid in self.spectra.dict.keys():
-                if self.spectra.dict[sid].name == name:
-                    self.spectra.ApplyCalibration([sid], None)
+            for sid in self.spectra.GetIDsByName(name):
+                self.spectra.ApplyCalibration([sid], None)
         self.spectra.caldict.clear()
 
 
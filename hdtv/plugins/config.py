@@ -28,7 +28,17 @@ import hdtv.cmdline
 import hdtv.util
 
 
+def _LoadOptions(varname=None):
+    """
+    Import lazily loaded plugins, which register their options on import,
+    unless varname is already known
+    """
+    if varname not in hdtv.options.OptionManager.__dict__:
+        hdtv.cmdline.LoadLazyCommands()
+
+
 def ConfigSet(args):
+    _LoadOptions(args.variable)
     try:
         hdtv.options.Set(args.variable, args.value)
     except KeyError:
@@ -40,6 +50,7 @@ def ConfigSet(args):
 
 
 def ConfigShow(args):
+    _LoadOptions(args.variable)
     if args.variable:
         try:
             hdtv.ui.msg(html=hdtv.options.Show(args.variable))
@@ -55,12 +66,14 @@ def ConfigReset(args):
             hdtv.options.ResetAll()
             hdtv.ui.debug("All configuration variables were reset.")
         else:
+            _LoadOptions(args.variable)
             try:
                 hdtv.options.Reset(args.variable)
                 hdtv.ui.debug("Reset configuration variable " + args.variable)
             except KeyError:
                 hdtv.ui.warning(args.variable + ": no such option")
     else:
+        _LoadOptions()
         hdtv.ui.msg(hdtv.options.Str(), end="")
 
 
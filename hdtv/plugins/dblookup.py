@@ -24,12 +24,15 @@ Gamma database integration for HDTV
 """
 
 import re
+import sqlite3
+import time
 from html import escape
 
 import hdtv.plugins
 import hdtv.cmdline
 import hdtv.options
 import hdtv.database
+from hdtv.database import DDEPLibraries
 import hdtv.ui
 
 import hdtv.fit
@@ -126,13 +129,67 @@ class Database(object):
         parser.add_argument("database", default=None, nargs="*")
         hdtv.cmdline.AddCommand(prog, self.Info, parser=parser, fileargs=False)
 
+        prog = "db compile"
+        description = (
+            "Compile the database tables into a binary format, which is "
+            "much faster to read (this is also done automatically on first use)"
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-o",
+            "--output",
+            default=None,
+            help="directory to write the compiled tables to (default: cache directory)",
+        )
+        hdtv.cmdline.AddCommand(prog, self.Compile, parser=parser, fileargs=False)
+
+        prog = "db ddep import"
+        description = (
+            "Import DDEP nuclide tables (.lara.txt files) into the local "
+            "DDEP cache, e.g. for use without network access"
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "path", nargs="+", help=".lara.txt files or directories containing them"
+        )
+        hdtv.cmdline.AddCommand(prog, self.DDEPImport, parser=parser, fileargs=True)
+
+        prog = "db ddep prefetch"
+        description = "Download DDEP nuclide tables into the local DDEP cache"
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="number of parallel downloads",
+        )
+        parser.add_argument(
+            "-r",
+            "--refresh",
+            action="store_true",
+            default=False,
+            help="download again, even if the nuclide is cached",
+        )
+        parser.add_argument("nuclide", nargs="+", help="nuclides to download")
+        hdtv.cmdline.AddCommand(prog, self.DDEPPrefetch, parser=parser, fileargs=False)
+
+        prog = "db ddep list"
+        description = "List the nuclides in the local DDEP cache"
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        hdtv.cmdline.AddCommand(prog, self.DDEPList, parser=parser, fileargs=False)
+
+        prog = "db ddep clear"
+        description = "Remove all nuclides from the local DDEP cache"
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        hdtv.cmdline.AddCommand(prog, self.DDEPClear, parser=parser, fileargs=False)
+
     def FitPeakPostHook(self, fitclass):
         """
         Hook for hdtv.fit.Fit.FitPeakFunc function to automatically list matching
         database entries
         """
-        for p in fitclass.peaks:
-            self.Lookup(["energy=" + str(p.pos_cal.value)], defaults=True)
+        self.LookupEnergies([p.pos_cal.nominal_value for p in fitclass.peaks])
 
     def SetAutoLookup(self, autolookup_opt):
         """
@@ -191,6 +248,63 @@ class Database(object):
             except KeyError:
                 raise hdtv.cmdline.HDTVCommandError("No such database: " + db.name)
 
+    def Compile(self, args):
+        """
+        Compile all database tables
+        """
+        try:
+            hdtv.database.CompileAll(args.output)
+        except OSError as msg:
+            raise hdtv.cmdline.HDTVCommandError("Could not compile tables: %s" % msg)
+        hdtv.ui.msg("Compiled database tables")
+
+    def DDEPImport(self, args):
+        """
+        Import .lara.txt files into the DDEP cache
+        """
+        try:
+            nuclides = DDEPLibraries.cache.Import(args.path)
+        except OSError as msg:
+            raise hdtv.cmdline.HDTVCommandError("Import failed: %s" % msg)
+        hdtv.ui.msg("Imported %d nuclides into DDEP cache" % len(nuclides))
+
+    def DDEPPrefetch(self, args):
+        """
+        Download nuclides into the DDEP cache
+        """
+        errors = DDEPLibraries.cache.Prefetch(args.nuclide, args.jobs, args.refresh)
+        for (nuclide, msg) in errors.items():
+            hdtv.ui.error("Could not download nuclide %s: %s" % (nuclide, msg))
+        hdtv.ui.msg(
+            "%d of %d nuclides in DDEP cache"
+            % (len(args.nuclide) - len(errors), len(args.nuclide))
+        )
+
+    def DDEPList(self, args):
+        """
+        List the nuclides in the DDEP cache
+        """
+        entries = [
+            {
+                "nuclide": nuclide,
+                "fetched": time.strftime("%Y-%m-%d %H:%M", time.localtime(fetched)),
+            }
+            for (nuclide, fetched) in DDEPLibraries.cache.List()
+        ]
+        if entries:
+            table = hdtv.util.Table(entries, keys=["nuclide", "fetched"], sortBy=None)
+            hdtv.ui.msg(html=str(table))
+        hdtv.ui.msg("%d nuclides in DDEP cache" % len(entries))
+
+    def DDEPClear(self, args):
+        """
+        Remove all nuclides from the DDEP cache
+        """
+        try:
+            DDEPLibraries.cache.Clear()
+        except (OSError, sqlite3.Error) as msg:
+            raise hdtv.cmdline.HDTVCommandError("Could not clear DDEP cache: %s" % msg)
+
     def assureOpen(self):
         """
         assure that the database has been opened
@@ -269,6 +383,33 @@ class Database(object):
         except AttributeError:
             return False
 
+        self.ShowResults(results)
+
+    def LookupEnergies(self, energies):
+        """
+        Lookup database entries for a list of energies (with the default
+        fuzziness and sorting)
+        """
+        self.assureOpen()
+
+        try:
+            results = self.database.find_batch(
+                energies,
+                hdtv.options.Get("database.fuzziness"),
+                sort_key=hdtv.options.Get("database.sort_key"),
+                sort_reverse=hdtv.options.Get("database.sort_reverse"),
+            )
+        except AttributeError:
+            return False
+
+        for (energy, found) in zip(energies, results):
+            hdtv.ui.msg("Database entries for energy %.2f:" % energy)
+            self.ShowResults(found)
+
+    def ShowResults(self, results):
+        """
+        Print a table of database entries
+        """
         if len(results) > 0:
             table = hdtv.util.Table(
                 results,
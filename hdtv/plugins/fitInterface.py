@@ -168,7 +168,7 @@ class FitInterface(object):
                 raise RuntimeError("background degree of -1")
             fit.FitBgFunc(spec)
         hdtv.ui.msg(html=str(fit))
-        fit.Draw(self.window.viewport)
+        fit.Draw(self.spectra.viewport)
 
     def ExecuteReintegrate(self, specID, fitID, print_result=True):
         """
@@ -202,7 +202,7 @@ class FitInterface(object):
         fit.integral = hdtv.integral.Integrate(spec, bg, region)
         if print_result:
             hdtv.ui.msg(html=fit.print_integral())
-        fit.Draw(self.window.viewport)
+        fit.Draw(self.spectra.viewport)
         print("Successfully reintegrated")
 
     def QuickFit(self, pos=None):
@@ -1173,7 +1173,7 @@ class TvFitInterface(object):
                 spec.HideObjects(fitids)
             else:
                 spec.ShowObjects(fitids)
-                if args.adjust_viewport:
+                if args.adjust_viewport and self.spectra.window:
                     fits = [spec.dict[fitid] for fitid in fitids]
                     self.spectra.window.FocusObjects(fits)
 
@@ -1222,7 +1222,8 @@ class TvFitInterface(object):
                 if not fits:
                     hdtv.ui.warning("Nothing to focus in spectrum %s" % sid)
                     return
-        self.spectra.window.FocusObjects(fits)
+        if self.spectra.window:
+            self.spectra.window.FocusObjects(fits)
 
     def FitList(self, args):
         """
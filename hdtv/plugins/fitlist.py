@@ -25,11 +25,19 @@ Write and Read Fitlist saved in xml format
 
 import os
 import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from uncertainties import ufloat
+
 import hdtv.cmdline
 import hdtv.options
+import hdtv.fitstore
 import hdtv.fitxml
 import hdtv.ui
 import hdtv.util
+from hdtv.histogram import FileHistogram
 
 
 class FitlistManager(object):
@@ -70,6 +78,89 @@ class FitlistManager(object):
                 fname=fname,
             )
 
+    def Write(self, sid, fname, fmt=None):
+        """
+        Write the fits of spectrum sid as xml fit list or fit store,
+        depending on fmt (default: from the file extension)
+        """
+        fmt = hdtv.fitstore.Format(fname, fmt)
+        if fmt == "xml":
+            return self.WriteXML(sid, fname)
+        name = self.spectra.dict[sid].name
+        fname = os.path.abspath(fname)
+        self.list[name] = fname
+        with open(fname, mode="wb") as f:
+            self.xml.WriteFitStore(f, sid, fmt)
+
+    def Read(
+        self,
+        sid,
+        fname,
+        calibrate=False,
+        refit=False,
+        interactive=True,
+        associate=True,
+        fmt=None,
+    ):
+        """
+        Read fits to spectrum sid from an xml fit list or fit store,
+        depending on fmt (default: from the file extension)
+        """
+        fmt = hdtv.fitstore.Format(fname, fmt)
+        if fmt == "xml":
+            return self.ReadXML(sid, fname, calibrate, refit, interactive, associate)
+        spec = self.spectra.dict[sid]
+        fname = os.path.abspath(fname)
+        if associate:
+            self.list[spec.name] = fname
+        else:
+            self.list.pop(spec.name, None)
+        self.xml.ReadFitStore(
+            fname,
+            sid,
+            calibrate=calibrate,
+            refit=refit,
+            interactive=interactive,
+            fmt=fmt,
+        )
+
+    def QueryPeaks(self, fname, params, erange=None, fmt=None):
+        """
+        Return the peaks stored in a fit store, with the calibrated values
+        of params (None if not available), and optionally only those with
+        a position within erange = (min, max). No fits are restored.
+        """
+        columns = ["fit", "peak", "pos_cal"]
+        for param in params:
+            columns += [param + "_cal", param + "_cal_err"]
+        tables = hdtv.fitstore.Read(
+            fname, tables=["fits", "peaks"], columns=columns, fmt=fmt
+        )
+        (fits, peaks) = (tables["fits"], tables["peaks"])
+        if "pos_cal" not in peaks:
+            return list()
+        mask = np.ones(len(peaks["pos_cal"]), dtype=bool)
+        if erange is not None:
+            mask = (peaks["pos_cal"] >= erange[0]) & (peaks["pos_cal"] <= erange[1])
+        spectra = dict(zip(fits["fit"].tolist(), fits["spectrum"].tolist()))
+        result = list()
+        for i in np.flatnonzero(mask):
+            row = {
+                "file": fname,
+                "spectrum": spectra.get(int(peaks["fit"][i]), ""),
+                "fit": int(peaks["fit"][i]),
+                "peak": int(peaks["peak"][i]),
+            }
+            for param in params:
+                try:
+                    value = peaks[param + "_cal"][i]
+                    error = peaks.get(param + "_cal_err", np.zeros(len(mask)))[i]
+                except KeyError:
+                    value = np.nan
+                row[param] = None if np.isnan(value) else ufloat(value, error)
+            result.append(row)
+        return result
+
     def WriteList(self, fname):
         lines = list()
         listpath = os.path.abspath(fname)
@@ -83,7 +174,16 @@ class FitlistManager(object):
         with open(fname, "w") as f:
             f.write(text)
 
-    def ReadList(self, fname):
+    def ReadList(self, fname, refit=False, nprocs=None):
+        """
+        Read the fit lists of several spectra, listed in fname
+
+        With refit, the fits of xml fit lists are repeated in nprocs
+        (default: number of CPUs) worker processes, which only send back
+        the results. Restoring fits needs the spectra of this session, so
+        without refit the fit lists are read here, one after the other.
+        """
+        jobs = list()
         with open(fname, "r") as f:
             dirname = os.path.dirname(fname)
             for linenum, l in enumerate(f):
@@ -100,13 +200,9 @@ class FitlistManager(object):
                     if not os.path.exists(xmlfile):
                         hdtv.ui.warning("No such file %s" % xmlfile)
                         continue
-                    sid = None
-                    for ID in self.spectra.ids:
-                        if self.spectra.dict[ID].name == name:
-                            sid = ID
-                            break
+                    sid = self.spectra.GetIDByName(name)
                     if sid is not None:
-                        self.ReadXML(sid, xmlfile)
+                        jobs.append((sid, xmlfile))
                     else:
                         hdtv.ui.warning("Spectrum %s is not loaded. " % name)
                 except ValueError:
@@ -115,6 +211,54 @@ class FitlistManager(object):
                         % (linenum + 1, fname)
                     )
 
+        results = [None] * len(jobs)
+        if refit and len(jobs) > 1 and nprocs != 1:
+            results = self._RefitParallel(jobs, nprocs)
+        for ((sid, xmlfile), tables) in zip(jobs, results):
+            if tables is None:
+                self.Read(sid, xmlfile, refit=refit)
+            else:
+                self.list[self.spectra.dict[sid].name] = os.path.abspath(xmlfile)
+                self.xml.RestoreFromTables(tables, sid, fname=xmlfile)
+
+    def _RefitParallel(self, jobs, nprocs=None):
+        """
+        Refit the xml fit lists of (sid, xmlfile) jobs in worker processes.
+        Returns the fit store tables for each job, or None if the fit list
+        has to be read in this process.
+        """
+        futures = list()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=nprocs or min(len(jobs), os.cpu_count() or 1),
+            mp_context=context,
+        ) as pool:
+            for (sid, xmlfile) in jobs:
+                hist = self.spectra.dict[sid].hist
+                if hdtv.fitstore.Format(xmlfile) != "xml" or not isinstance(
+                    hist, FileHistogram
+                ):
+                    futures.append(None)
+                    continue
+                cal = hist.cal.GetCoeffs() if hist.cal else None
+                futures.append(
+                    pool.submit(
+                        hdtv.fitxml.RefitFitlist,
+                        os.path.abspath(xmlfile),
+                        os.path.abspath(hist.filename),
+                        hist.fmt,
+                        None if cal is None else list(cal),
+                    )
+                )
+            results = list()
+            for ((sid, xmlfile), future) in zip(jobs, futures):
+                try:
+                    results.append(None if future is None else future.result())
+                except Exception as msg:
+                    hdtv.ui.warning("Refitting %s failed: %s" % (xmlfile, msg))
+                    results.append(None)
+        return results
+
 
 class FitlistHDTVInterface(object):
     def __init__(self, FitlistIf):
@@ -138,6 +282,14 @@ class FitlistHDTVInterface(object):
             default=False,
             help="overwrite existing files without asking",
         )
+        parser.add_argument(
+            "-f",
+            "--format",
+            choices=hdtv.fitstore.FORMATS,
+            default=None,
+            help="format of the fit list (default: from the file extension, "
+            "xml for unknown extensions)",
+        )
         parser.add_argument(
             "filename",
             nargs="?",
@@ -181,6 +333,14 @@ class FitlistHDTVInterface(object):
             but create a new one according to the name of the spectrum.
             Useful for reusing fits from a different spectrum.""",
         )
+        parser.add_argument(
+            "-f",
+            "--format",
+            choices=hdtv.fitstore.FORMATS,
+            default=None,
+            help="format of the fit list (default: from the file extension, "
+            "xml for unknown extensions)",
+        )
         parser.add_argument(
             "filename",
             nargs="+",
@@ -189,9 +349,69 @@ class FitlistHDTVInterface(object):
         )
         hdtv.cmdline.AddCommand(prog, self.FitRead, fileargs=True, parser=parser)
 
+        prog = "fit query"
+        description = "list peaks of fit stores (npz or parquet fit lists)"
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-r",
+            "--range",
+            nargs=2,
+            type=float,
+            default=None,
+            metavar=("MIN", "MAX"),
+            help="only list peaks with energies between MIN and MAX",
+        )
+        parser.add_argument(
+            "-p",
+            "--params",
+            action="store",
+            default="pos,vol,width",
+            help="parameters to list (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-k",
+            "--key-sort",
+            action="store",
+            default=None,
+            help="sort table by key",
+        )
+        parser.add_argument(
+            "-f",
+            "--format",
+            choices=hdtv.fitstore.FORMATS[1:],
+            default=None,
+            help="format of the fit stores (default: from the file extension)",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            action="store",
+            default=None,
+            type=int,
+            help="number of files read in parallel",
+        )
+        parser.add_argument("filename", nargs="+", help="fit stores to read")
+        hdtv.cmdline.AddCommand(prog, self.FitQuery, fileargs=True, parser=parser)
+
         prog = "fit getlists"
         description = "reads fitlists according to the list saved in a file"
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-r",
+            "--refit",
+            action="store_true",
+            default=False,
+            help="Force refitting during load",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            action="store",
+            default=None,
+            type=int,
+            help="number of worker processes for refitting "
+            "(default: number of CPUs)",
+        )
         parser.add_argument("filename", default=None)
         hdtv.cmdline.AddCommand(prog, self.FitGetlists, fileargs=True, parser=parser)
 
@@ -234,7 +454,11 @@ class FitlistHDTVInterface(object):
                     fname = self.FitlistIf.list[name]
                 except KeyError:
                     (base, ext) = os.path.splitext(name)
-                    fname = base + "." + hdtv.options.Get("fit.list.default_extension")
+                    if args.format in (None, "xml"):
+                        ext = hdtv.options.Get("fit.list.default_extension")
+                    else:
+                        ext = args.format
+                    fname = base + "." + ext
             else:
                 fname = os.path.expanduser(args.filename)
                 # Try to replace placeholder "%s" in filename with specid
@@ -247,7 +471,7 @@ class FitlistHDTVInterface(object):
             hdtv.ui.msg("Saving fits of spectrum %d to %s" % (sid, fname))
 
             if hdtv.util.user_save_file(fname, args.force):
-                self.FitlistIf.WriteXML(sid, fname)
+                self.FitlistIf.Write(sid, fname, args.format)
 
     def FitRead(self, args):
         """
@@ -279,14 +503,42 @@ class FitlistHDTVInterface(object):
         for sid in sids:
             for fname in fnames[sid]:
                 hdtv.ui.msg("Reading fitlist %s to spectrum %s" % (fname, sid))
-                self.FitlistIf.ReadXML(
+                self.FitlistIf.Read(
                     sid,
                     fname,
                     calibrate=args.calibrate,
                     refit=args.refit,
                     associate=(not args.no_associate),
+                    fmt=args.format,
                 )
 
+    def FitQuery(self, args):
+        """
+        List the peaks of fit stores, without restoring the fits
+        """
+        fnames = list()
+        for fname in args.filename:
+            more = sorted(glob.glob(os.path.expanduser(fname)))
+            if len(more) == 0:
+                hdtv.ui.warning("No such file %s" % fname)
+            fnames.extend(more)
+        if not fnames:
+            return
+        params = [p.strip() for p in args.params.split(",") if p.strip()]
+
+        def query(fname):
+            return self.FitlistIf.QueryPeaks(fname, params, args.range, args.format)
+
+        with ThreadPoolExecutor(
+            max_workers=args.jobs or min(len(fnames), os.cpu_count() or 1)
+        ) as pool:
+            peaks = [peak for result in pool.map(query, fnames) for peak in result]
+        table = hdtv.util.Table(
+            peaks, ["file", "spectrum", "fit", "peak"] + params, sortBy=args.key_sort
+        )
+        hdtv.ui.msg(html=str(table), end="")
+        hdtv.ui.msg("%d peaks in %d files" % (len(peaks), len(fnames)))
+
     def FitSavelists(self, args):
         if hdtv.util.user_save_file(args.filename, args.force):
             self.FitlistIf.WriteList(args.filename)
@@ -298,7 +550,7 @@ class FitlistHDTVInterface(object):
         fname = fname[0]
         if not os.path.exists(fname):
             raise hdtv.cmdline.HDTVCommandError("No such file %s" % fname)
-        self.FitlistIf.ReadList(fname)
+        self.FitlistIf.ReadList(fname, refit=args.refit, nprocs=args.jobs)
 
 
 hdtv.options.RegisterOption(
@@ -20,12 +20,90 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 import argparse
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
 from uncertainties import ufloat_fromstr
 
 import hdtv.cmdline
 import hdtv.ui
 
 
+def MatchPositions(positions, errors, energies, tolerance, method="nearest"):
+    """
+    Match peak positions (with errors) to energies
+
+    A peak and an energy match if their difference is below tolerance
+    times the error of the peak position (the absolute z-score). With
+    method "nearest", each peak is matched to the nearest energy, even if
+    several peaks match the same energy. "greedy" and "optimal" assign
+    each energy to at most one peak, either by taking the pairs in order of
+    their z-scores or by maximizing the number of matches with the lowest
+    total z-score (Hungarian algorithm).
+
+    Returns a list of (peak index, energy index) tuples.
+    """
+    positions = np.asarray(positions, dtype=float)
+    errors = np.asarray(errors, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    if len(positions) == 0 or len(energies) == 0:
+        return list()
+    order = np.argsort(energies, kind="stable")
+    energies = energies[order]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "nearest":
+            idx = np.searchsorted(energies, positions)
+            lower = np.clip(idx - 1, 0, len(energies) - 1)
+            upper = np.clip(idx, 0, len(energies) - 1)
+            nearest = np.where(
+                np.abs(energies[lower] - positions)
+                <= np.abs(energies[upper] - positions),
+                lower,
+                upper,
+            )
+            z = np.abs(energies[nearest] - positions) / errors
+            matched = np.flatnonzero(z < tolerance)
+            return [(int(i), int(order[nearest[i]])) for i in matched]
+
+        # All candidate pairs within the tolerance
+        lo = np.searchsorted(energies, positions - tolerance * errors, side="left")
+        hi = np.searchsorted(energies, positions + tolerance * errors, side="right")
+        counts = np.maximum(hi - lo, 0)
+        peaks = np.repeat(np.arange(len(positions)), counts)
+        cands = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cands += np.repeat(lo, counts)
+        z = np.abs(energies[cands] - positions[peaks]) / errors[peaks]
+    valid = z < tolerance
+    (peaks, cands, z) = (peaks[valid], cands[valid], z[valid])
+
+    if method == "greedy":
+        matches = list()
+        (used_peaks, used_energies) = (set(), set())
+        for i in np.argsort(z, kind="stable"):
+            if peaks[i] in used_peaks or cands[i] in used_energies:
+                continue
+            used_peaks.add(peaks[i])
+            used_energies.add(cands[i])
+            matches.append((int(peaks[i]), int(order[cands[i]])))
+        return sorted(matches)
+    elif method == "optimal":
+        (rows, row_idx) = np.unique(peaks, return_inverse=True)
+        (cols, col_idx) = np.unique(cands, return_inverse=True)
+        # Forbidden pairs cost more than any complete assignment of allowed
+        # pairs, so that the number of matches is maximized first
+        forbidden = tolerance * (len(z) + 1)
+        cost = np.full((len(rows), len(cols)), forbidden)
+        cost[row_idx, col_idx] = z
+        (r, c) = linear_sum_assignment(cost)
+        allowed = cost[r, c] < forbidden
+        return sorted(
+            (int(rows[i]), int(order[cols[j]]))
+            for (i, j) in zip(r[allowed], c[allowed])
+        )
+    raise ValueError("Unknown matching method %s" % method)
+
+
 class FitMap(object):
     def __init__(self, spectra, ecal):
         hdtv.ui.debug("Loaded plugin for setting nominal positions to peaks")
@@ -71,6 +149,16 @@ class FitMap(object):
             type=float,
             help="Tolerance for associating peaks to positions [default:%(default)s]",
         )
+        parser.add_argument(
+            "-m",
+            "--method",
+            choices=["nearest", "greedy", "optimal"],
+            default="nearest",
+            help="nearest: map each peak to the nearest energy, "
+            "greedy/optimal: map each energy to one peak at most, "
+            "by best z-score first or minimal total z-score "
+            "[default: %(default)s]",
+        )
         hdtv.cmdline.AddCommand(prog, self.FitPosMap, fileargs=True, parser=parser)
 
         prog = "calibration position recalibrate"
@@ -210,19 +298,24 @@ class FitMap(object):
             hdtv.ui.warning("No energies found in file {}.".format(args.filename))
             return False
         spec = self.spectra.GetActiveObject()
-        count = 0
+        peaks = list()
         for fit in spec.dict.values():
             for peak in fit.peaks:
                 if args.overwrite:
                     peak.extras.pop("pos_lit", None)
-                # pick best match within a certain tolerance (if it exists)
-                tol = args.tolerance
-                enlit = [e for e in energies if abs(peak.pos_cal.std_score(e)) < tol]
-                if len(enlit) > 0:
-                    peak.extras["pos_lit"] = min(
-                        enlit, key=lambda e: abs(peak.pos_cal.std_score(e))
-                    )
-                    count += 1
+                peaks.append(peak)
+        # pick best match within a certain tolerance (if it exists)
+        positions = [peak.pos_cal for peak in peaks]
+        matches = MatchPositions(
+            [p.nominal_value for p in positions],
+            [p.std_dev for p in positions],
+            [e.nominal_value for e in energies],
+            args.tolerance,
+            args.method,
+        )
+        for (i, j) in matches:
+            peaks[i].extras["pos_lit"] = energies[j]
+        count = len(matches)
         # give a feetback to the user
         hdtv.ui.msg("Mapped %s energies to peaks" % count)
 
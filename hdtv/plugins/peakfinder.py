@@ -24,18 +24,30 @@ Peak finding and fitting plugin for HDTV
 """
 
 import copy
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
+
+import hdtv.cal
 import hdtv.cmdline
+import hdtv.fitter
 import hdtv.options
 import hdtv.ui
+import hdtv.util
 import hdtv.plugins
 
+from hdtv.histogram import GetBinCenters, GetBinContents
+from hdtv.peaksearch import SearchPeaks, WidthModel
+
 import ROOT
 
 
 class PeakFinder(object):
     """
-    Automatic peak finder - using ROOTS peak search function
+    Automatic peak finder - using either the native peak search of hdtv
+    or ROOTS peak search function
     """
 
     def __init__(self, spectra):
@@ -43,12 +55,32 @@ class PeakFinder(object):
         hdtv.ui.debug("Loaded PeakFinder plugin")
 
     def __call__(
-        self, sid, sigma, threshold, start=None, end=None, autofit=False, reject=False
+        self,
+        sid,
+        sigma,
+        threshold,
+        start=None,
+        end=None,
+        autofit=False,
+        reject=False,
+        engine="tspectrum",
+        width=None,
+        significance=3.0,
+        nthreads=1,
+        continuum=False,
     ):
         self.spec = self.spectra.dict[sid]
         self.sigma_E = sigma
-        peaks = self.PeakSearch(sigma, threshold, start, end)
-        num = self.StoreFits(peaks, autofit, reject)
+        if width is None:
+            width = WidthModel.Constant(sigma)
+        self.width = width
+        if engine == "native":
+            peaks = self.NativePeakSearch(
+                width, threshold, significance, start, end, continuum
+            )
+        else:
+            peaks = self.PeakSearch(sigma, threshold, start, end)
+        num = self.StoreFits(peaks, autofit, reject, nthreads)
         hdtv.ui.msg("Found " + str(num) + " peaks")
         # remove reference to spec otherwise we get trouble with garbage
         # collection
@@ -103,13 +135,101 @@ class PeakFinder(object):
 
         return foundpeaks
 
-    def StoreFits(self, foundpeaks, autofit=False, reject=False):
+    def NativePeakSearch(
+        self, width, threshold, significance, start=None, end=None, continuum=False
+    ):
         """
-        Create fit objects from peak positions and add them to the fitlist
-        If autofit is set to True fitting is done,
-        if reject is set to True all badFits will be remove.
+        Search for peaks with the native peak search, using the energy
+        dependent peak width given by width (a WidthModel). If continuum is
+        set, the continuum of the spectrum is subtracted before the search
+        (it is estimated first, if necessary).
         """
-        peak_count = 0
+        hist = self.spec.hist.hist
+        cal = self.spec.cal
+        axis = hist.GetXaxis()
+        xmin = axis.GetXmin()
+        binwidth = axis.GetBinWidth(1)
+
+        channels = GetBinCenters(hist)
+        sigma = width(hdtv.cal.Ch2EArray(cal, channels)) / np.abs(
+            hdtv.cal.dEdChArray(cal, channels)
+        )
+        if not np.all(sigma > 0):
+            raise hdtv.cmdline.HDTVCommandError("Sigma must be > 0")
+
+        # Init start and end region
+        start_E = 0.0 if start is None else start
+        if end is None:
+            end_E = cal.Ch2E(channels[-1])
+        else:
+            end_E = end
+        first = (cal.E2Ch(start_E) - xmin) / binwidth - 0.5
+        last = (cal.E2Ch(end_E) - xmin) / binwidth - 0.5
+        first, last = sorted([first, last])
+
+        text = "Search Peaks in region "
+        text += str(start_E) + "--" + str(end_E)
+        text += " (width: " + str(width)
+        text += " threshold=" + str(threshold * 100) + "%"
+        text += " significance=" + str(significance) + ")"
+        hdtv.ui.msg(text)
+
+        background = None
+        if continuum:
+            background = GetBinContents(self.spec.hist.GetContinuum(width).GetHist())
+
+        candidates = SearchPeaks(
+            GetBinContents(hist),
+            sigma / binwidth,
+            threshold=threshold,
+            significance=significance,
+            start=np.ceil(first),
+            stop=np.floor(last) + 1,
+            background=background,
+        )
+        positions = [xmin + (c.pos + 0.5) * binwidth for c in candidates]
+        if candidates:
+            rows = [
+                {
+                    "channel": "%.2f" % pos,
+                    "pos": "%.2f" % cal.Ch2E(pos),
+                    "significance": "%.1f" % c.significance,
+                }
+                for (pos, c) in zip(positions, candidates)
+            ]
+            table = hdtv.util.Table(rows, ["channel", "pos", "significance"])
+            hdtv.ui.msg(html=str(table), end="")
+
+        return positions
+
+    def WidthFromFits(self, sid):
+        """
+        Determine the width model from the fitted peaks of a spectrum
+        """
+        spec = self.spectra.dict[sid]
+        energies = list()
+        fwhms = list()
+        for fit in spec.dict.values():
+            for peak in fit.peaks:
+                try:
+                    energies.append(peak.pos_cal.nominal_value)
+                    fwhms.append(peak.width_cal.nominal_value)
+                except AttributeError:
+                    continue
+        if not energies:
+            raise hdtv.cmdline.HDTVCommandError(
+                "No fitted peaks with width to determine width model from"
+            )
+        return WidthModel.FromPeaks(energies, fwhms)
+
+    def GroupPeaks(self, foundpeaks, autofit=False):
+        """
+        Group the found peaks (in channels) into fits. If autofit is set,
+        peaks closer than the fit region width are collected into one
+        multiplet and region markers are set for each fit.
+        """
+        fits = list()
+        foundpeaks = list(foundpeaks)
         while len(foundpeaks) > 0:
             p = foundpeaks.pop(0)
             fitter = copy.copy(self.spectra.workFit.fitter)
@@ -117,7 +237,7 @@ class PeakFinder(object):
             pos_E = self.spec.cal.Ch2E(p)
             fit.ChangeMarker("peak", pos_E, action="set")
             if autofit:
-                region_width = self.sigma_E * 5.0  # TODO: something sensible here
+                region_width = float(self.width(pos_E)) * 5.0
                 # left region marker
                 fit.ChangeMarker("region", pos_E - region_width / 2.0, action="set")
                 limit = pos_E + region_width
@@ -127,11 +247,89 @@ class PeakFinder(object):
                 ):
                     next = foundpeaks.pop(0)
                     pos_E = self.spec.cal.Ch2E(next)
+                    region_width = float(self.width(pos_E)) * 5.0
                     limit = pos_E + region_width
                     fit.ChangeMarker("peak", pos_E, "set")
                 # right region marker
                 fit.ChangeMarker("region", pos_E + region_width / 2.0, "set")
-                fit.FitPeakFunc(self.spec)  # , silent = True
+            fits.append(fit)
+        return fits
+
+    def FitRegion(self, fit, hists=None):
+        """
+        Fit a single region and integrate it. In a worker thread, the fit
+        works on a private copy of the histogram taken from the queue hists.
+        """
+        hist = None if hists is None else hists.get()
+        try:
+            fit.FitPeakFunc(hist=hist)  # , silent = True
+            # Integrate. TODO: Might use this for additional checks
+            region = [
+                fit.regionMarkers[0].p1.pos_uncal,
+                fit.regionMarkers[0].p2.pos_uncal,
+            ]
+            fit.integral = hdtv.integral.Integrate(
+                fit.spec, fit.fitter.bgFitter, region, hist=hist
+            )
+        finally:
+            if hists is not None:
+                hists.put(hist)
+        return fit
+
+    def PrepareThreads(self, fits, nthreads):
+        """
+        Set up everything the fits share before they run in nthreads
+        threads and return a queue with a copy of the histogram for
+        each thread
+        """
+        hdtv.fitter.EnableThreads()
+        backgroundModel = fits[0].fitter.backgroundModel
+        if backgroundModel.requiredBgRegions == 0:
+            backgroundModel.GetContinuum(self.spec)
+        hists = queue.Queue()
+        for _ in range(nthreads):
+            hist = self.spec.hist.hist.Clone()
+            hist.SetDirectory(0)
+            hists.put(hist)
+        return hists
+
+    def StoreFits(self, foundpeaks, autofit=False, reject=False, nthreads=1):
+        """
+        Create fit objects from peak positions and add them to the fitlist
+        If autofit is set to True fitting is done, using nthreads threads
+        (all CPUs if nthreads is 0), if reject is set to True all badFits
+        will be remove.
+        """
+        fits = self.GroupPeaks(foundpeaks, autofit)
+        if autofit and fits:
+            for fit in fits:
+                fit.spec = self.spec
+            if nthreads == 0:
+                nthreads = os.cpu_count()
+            nthreads = min(nthreads, len(fits) - 1)
+            if nthreads > 1:
+                hists = self.PrepareThreads(fits, nthreads)
+                # The first fit runs alone, so that the fitters and ROOT
+                # set up their lazily created globals before the threads start
+                self.FitRegion(fits[0])
+                self.ShowProgress(1, len(fits), overwrite=False)
+                with ThreadPoolExecutor(max_workers=nthreads) as pool:
+                    futures = [
+                        pool.submit(self.FitRegion, fit, hists) for fit in fits[1:]
+                    ]
+                    for done, _ in enumerate(as_completed(futures), 2):
+                        self.ShowProgress(done, len(fits), overwrite=False)
+                    # Propagate exceptions from the workers
+                    for future in futures:
+                        future.result()
+            else:
+                for done, fit in enumerate(fits, 1):
+                    self.FitRegion(fit)
+                    self.ShowProgress(done, len(fits))
+
+        peak_count = 0
+        for fit in fits:
+            if autofit:
                 # check fits
                 result = self.BadFit(fit)
                 if reject:
@@ -143,15 +341,6 @@ class PeakFinder(object):
                     if result:
                         text = "Adding invalid fit:" + result
                         hdtv.ui.warning(text)
-            # Integrate. TODO: Might use this for additional checks
-            if fit.regionMarkers.IsFull():
-                region = [
-                    fit.regionMarkers[0].p1.pos_uncal,
-                    fit.regionMarkers[0].p2.pos_uncal,
-                ]
-                fit.integral = hdtv.integral.Integrate(
-                    self.spec, fit.fitter.bgFitter, region
-                )
             # add fits to spectrum
             ID = self.spec.Insert(fit)
             # FIXME: no fit title
@@ -164,6 +353,18 @@ class PeakFinder(object):
 
         return peak_count
 
+    def ShowProgress(self, done, total, overwrite=True):
+        """
+        Show progress of the autofit. ROOT may print warnings of fits in
+        worker threads at any time, so without overwrite the progress is
+        shown on lines of its own.
+        """
+        steps = 20 if overwrite else 4
+        if done != total and done % max(total // steps, 1):
+            return
+        end = "\r" if overwrite and done != total else "\n"
+        hdtv.ui.msg("Fitted %d of %d regions" % (done, total), end=end)
+
     def BadFit(self, fit):
         """
         Check if the fit is sensible
@@ -186,7 +387,8 @@ class PeakFinder(object):
             elif fit.fitter.peakModel.name == "theuerkauf":
                 if (
                     peak.width.nominal_value <= 0.0
-                    or peak.width.nominal_value > 5 * self.sigma_E
+                    or peak.width_cal.nominal_value
+                    > 5 * float(self.width(peak.pos_cal.nominal_value))
                 ):
                     bad = True
                     reason = "width = %s" % peak.width
@@ -201,29 +403,6 @@ class PeakFinder(object):
             return text
 
 
-# FIXME or remove
-#    def BGFit(self):
-#        """
-#        Do a background fit
-#        """
-#        # Background fit
-#        sid = self.spectra.activeID
-#        tSpec = ROOT.TSpectrum()
-#
-#        spec = self.spectra[self.spectra.activeID]
-
-#        hist = spec.fHist.__class__(spec.fHist) # Copy hist here
-#        # TODO: draw background
-#        hbg = hist.ShowBackground(20, "goff")
-#        print "hbg", hbg
-#        bgspec = hdtv.spectrum.Spectrum(hbg, cal=spec.cal)
-#
-#        bspec = hdtv.spectrum.SpectrumCompound(spec.viewport, bgspec)
-#        sid = self.spectra.Add(bgspec)
-#        bgspec.SetColor(hdtv.color.ColorForID(sid))
-#        print "BGSPec", sid
-
-
 # plugin initialisation
 import __main__
 
@@ -251,10 +430,42 @@ def PeakSearch(args):
         args.threshold = hdtv.options.Get("fit.peakfind.threshold")
     if args.autofit is None:
         args.autofit = hdtv.options.Get("fit.peakfind.auto_fit")
+    if args.engine is None:
+        args.engine = hdtv.options.Get("fit.peakfind.engine")
+    if args.significance is None:
+        args.significance = hdtv.options.Get("fit.peakfind.significance")
+    if args.jobs is None:
+        args.jobs = hdtv.options.Get("fit.peakfind.jobs")
+    if args.jobs < 0:
+        raise hdtv.cmdline.HDTVCommandError("Number of jobs must be >= 0")
+
+    width = None
+    if args.width_from_fits:
+        width = peakfinder.WidthFromFits(sid)
+    elif args.width is not None:
+        try:
+            width = WidthModel.Parse(args.width)
+        except ValueError as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+    if width is not None and args.engine != "native":
+        hdtv.ui.warning("Width model is only used by the native peak search engine")
+    if args.continuum and args.engine != "native":
+        hdtv.ui.warning("Continuum is only used by the native peak search engine")
 
     # TODO: Access session peakfinder
     peakfinder(
-        sid, args.sigma, args.threshold, args.start, args.end, args.autofit, args.reject
+        sid,
+        args.sigma,
+        args.threshold,
+        args.start,
+        args.end,
+        args.autofit,
+        args.reject,
+        engine=args.engine,
+        width=width,
+        significance=args.significance,
+        nthreads=args.jobs,
+        continuum=args.continuum,
     )
 
 
@@ -265,6 +476,14 @@ opt = hdtv.options.Option(default=0.05, parse=lambda x: float(x))
 hdtv.options.RegisterOption("fit.peakfind.threshold", opt)
 opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
 hdtv.options.RegisterOption("fit.peakfind.auto_fit", opt)
+opt = hdtv.options.Option(
+    default="tspectrum", parse=hdtv.options.parse_choices(["native", "tspectrum"])
+)
+hdtv.options.RegisterOption("fit.peakfind.engine", opt)
+opt = hdtv.options.Option(default=3.0, parse=lambda x: float(x))
+hdtv.options.RegisterOption("fit.peakfind.significance", opt)
+opt = hdtv.options.Option(default=1, parse=lambda x: int(x))
+hdtv.options.RegisterOption("fit.peakfind.jobs", opt)
 
 # Register command "fit peakfind"
 prog = "fit peakfind"
@@ -295,6 +514,53 @@ parser.add_argument(
     default=False,
     help="reject fits with unreasonable values",
 )
+parser.add_argument(
+    "-e",
+    "--engine",
+    choices=["native", "tspectrum"],
+    default=None,
+    help="peak search engine to use",
+)
+parser.add_argument(
+    "-w",
+    "--width",
+    action="store",
+    default=None,
+    help="energy dependent peak width (native engine only), given as comma "
+    "separated coefficients c0,c1,c2 of sigma(E)^2 = c0 + c1*E + c2*E^2",
+)
+parser.add_argument(
+    "-W",
+    "--width-from-fits",
+    action="store_true",
+    default=False,
+    help="determine the energy dependent peak width from the fitted peaks "
+    "of the active spectrum (native engine only)",
+)
+parser.add_argument(
+    "-S",
+    "--significance",
+    type=float,
+    action="store",
+    default=None,
+    help="minimum significance of peaks in standard deviations (native engine only)",
+)
+parser.add_argument(
+    "-c",
+    "--continuum",
+    action="store_true",
+    default=False,
+    help="subtract the continuum of the spectrum (see 'spectrum background') "
+    "before searching (native engine only)",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    action="store",
+    default=None,
+    help="number of regions to fit in parallel with --autofit (0: number of CPUs)",
+)
 parser.add_argument("start", nargs="?", type=float, default=None, help="start of range")
 parser.add_argument("end", nargs="?", type=float, default=None, help="end of range")
 hdtv.cmdline.AddCommand(prog, PeakSearch, level=4, parser=parser, fileargs=False)
@@ -47,6 +47,10 @@ class PrintOut(object):
         """
         creates a plot with all currently visible objects
         """
+        if self.spectra.window is None:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Printing needs the spectrum window, which a headless session lacks"
+            )
         # extract visible spectrum objects
         ids = list(self.spectra.visible)
         specs = [self.spectra.dict[i] for i in ids]
@@ -383,8 +383,8 @@ class RootFileInterface(object):
             self.spectra.Clear()
 
         loaded = list()
-        if self.window.viewport:
-            self.window.viewport.LockUpdate()
+        if self.spectra.viewport:
+            self.spectra.viewport.LockUpdate()
         try:  # We should really use a context manager here...
             for obj in objs:
                 if isinstance(obj, ROOT.TH1):
@@ -411,11 +411,11 @@ class RootFileInterface(object):
                 # activate last loaded spectrum
                 self.spectra.ActivateObject(loaded[-1])
             # Expand window if it is the only spectrum
-            if len(self.spectra) == 1:
+            if len(self.spectra) == 1 and self.window:
                 self.window.Expand()
         finally:
-            if self.window.viewport:
-                self.window.viewport.UnlockUpdate()
+            if self.spectra.viewport:
+                self.spectra.viewport.UnlockUpdate()
 
 
 # plugin initialisation
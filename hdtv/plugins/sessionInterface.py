@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Save and restore complete sessions
+"""
+
+import os
+
+import hdtv.cmdline
+import hdtv.options
+import hdtv.snapshot
+import hdtv.ui
+import hdtv.util
+
+
+class SessionInterface(object):
+    def __init__(self, spectra):
+        hdtv.ui.debug("Loaded user interface for saving and loading sessions")
+        self.spectra = spectra
+
+        prog = "session save"
+        description = (
+            "save spectra, calibrations, fits, matrices and options to a "
+            "snapshot, which can be restored without reading the spectra "
+            "or repeating fits"
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "-F",
+            "--force",
+            action="store_true",
+            default=False,
+            help="overwrite existing files without asking",
+        )
+        parser.add_argument("filename", metavar="output-file")
+        hdtv.cmdline.AddCommand(prog, self.SessionSave, fileargs=True, parser=parser)
+
+        prog = "session load"
+        description = "replace the current session by a snapshot"
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument("filename", metavar="snapshot-file")
+        hdtv.cmdline.AddCommand(prog, self.SessionLoad, fileargs=True, parser=parser)
+
+    def Save(self, fname):
+        hdtv.snapshot.Save(self.spectra, fname)
+        hdtv.ui.msg("Saved session to %s" % fname)
+
+    def Load(self, fname):
+        hdtv.snapshot.Load(self.spectra, fname)
+
+    def SessionSave(self, args):
+        fname = os.path.expanduser(args.filename)
+        if not os.path.splitext(fname)[1]:
+            fname += "." + hdtv.options.Get("session.default_extension")
+        if hdtv.util.user_save_file(fname, args.force):
+            try:
+                self.Save(fname)
+            except OSError as msg:
+                raise hdtv.cmdline.HDTVCommandError(
+                    "Could not write %s: %s" % (fname, msg)
+                )
+
+    def SessionLoad(self, args):
+        fname = os.path.expanduser(args.filename)
+        if not os.path.exists(fname):
+            raise hdtv.cmdline.HDTVCommandError("No such file %s" % fname)
+        self.Load(fname)
+
+
+hdtv.options.RegisterOption(
+    "session.default_extension", hdtv.options.Option(default="hdtvs")
+)
+
+import __main__
+
+session_interface = SessionInterface(__main__.spectra)
+hdtv.cmdline.RegisterInteractive("snapshot", session_interface)
@@ -23,6 +23,7 @@ import ROOT
 import os
 import glob
 import copy
+from concurrent.futures import ThreadPoolExecutor
 
 import hdtv.cmdline
 import hdtv.color
@@ -30,9 +31,12 @@ import hdtv.cal
 import hdtv.options
 import hdtv.util
 import hdtv.ui
+import hdtv.speccache
+import hdtv.specreader
 
 from hdtv.spectrum import Spectrum
-from hdtv.histogram import FileHistogram
+from hdtv.histogram import FileHistogram, Histogram, SNIP_WINDOW
+from hdtv.peaksearch import WidthModel
 from hdtv.specreader import SpecReaderError
 from hdtv.util import LockViewport
 
@@ -120,63 +124,74 @@ class SpecInterface(object):
             if self.window:
                 self.window.viewport.SetStatusText("Invalid id: %s" % arg)
 
-    def LoadSpectra(self, patterns, ID=None):
+    def LoadSpectra(self, patterns, ID=None, lazy=False, nthreads=1):
         """
         Load spectra from files matching patterns.
 
         If ID is specified, the spectrum is stored with id ID, possibly
         replacing a spectrum that was there before.
 
+        The files are read using nthreads threads (all CPUs if nthreads is
+        0). If lazy is True, only the file headers are read, and the bins are
+        read when a spectrum is first shown, fitted, ...
+
         Returns:
             A list of the loaded spectra
         """
-        with LockViewport(self.window.viewport if self.window else None):
-            # only one filename is given
-            if isinstance(patterns, str):
-                patterns = [patterns]
+        # only one filename is given
+        if isinstance(patterns, str):
+            patterns = [patterns]
 
-            if ID is not None and len(patterns) > 1:
-                raise hdtv.cmdline.HDTVCommandError(
-                    "If you specify an ID, you can only give one pattern"
-                )
+        if ID is not None and len(patterns) > 1:
+            raise hdtv.cmdline.HDTVCommandError(
+                "If you specify an ID, you can only give one pattern"
+            )
 
-            loaded = []
-            for p in patterns:
-                # put fmt if available
-                p = p.rsplit("'", 1)
-                if len(p) == 1 or not p[1]:
-                    (fpat, fmt) = (p[0], None)
-                else:
-                    (fpat, fmt) = p
+        todo = []
+        for p in patterns:
+            # put fmt if available
+            p = p.rsplit("'", 1)
+            if len(p) == 1 or not p[1]:
+                (fpat, fmt) = (p[0], None)
+            else:
+                (fpat, fmt) = p
 
-                files = glob.glob(os.path.expanduser(fpat))
+            files = glob.glob(os.path.expanduser(fpat))
 
-                if len(files) == 0:
-                    hdtv.ui.warning("%s: no such file" % fpat)
-                elif ID is not None and len(files) > 1:
-                    raise hdtv.cmdline.HDTVCommandAbort(
-                        "pattern %s is ambiguous and you specified an ID" % fpat
-                    )
-                    break
+            if len(files) == 0:
+                hdtv.ui.warning("%s: no such file" % fpat)
+            elif ID is not None and len(files) > 1:
+                raise hdtv.cmdline.HDTVCommandAbort(
+                    "pattern %s is ambiguous and you specified an ID" % fpat
+                )
+
+            files.sort()
+            todo.extend((fname, fmt) for fname in files)
 
-                files.sort()
+        hists = self.ReadSpectra(todo, lazy, nthreads)
 
-                for fname in files:
-                    try:
-                        # Create spectrum object
-                        spec = Spectrum(FileHistogram(fname, fmt))
-                    except (OSError, SpecReaderError):
-                        hdtv.ui.warning("Could not load %s'%s" % (fname, fmt))
+        with LockViewport(self.window.viewport if self.window else None):
+            loaded = []
+            for ((fname, fmt), hist) in zip(todo, hists):
+                try:
+                    # Create spectrum object
+                    spec = Spectrum(FileHistogram(fname, fmt, hist=hist, lazy=lazy))
+                except (OSError, SpecReaderError):
+                    hdtv.ui.warning("Could not load %s'%s" % (fname, fmt))
+                else:
+                    sid = self.spectra.Insert(spec, ID)
+                    if not spec.loaded:
+                        # Lazily loaded spectra are not shown before they
+                        # are activated or shown explicitly
+                        self.spectra.visible.discard(sid)
+                    spec.color = hdtv.color.ColorForID(sid.major)
+                    if spec.name in list(self.spectra.caldict.keys()):
+                        spec.cal = self.spectra.caldict[spec.name]
+                    loaded.append(spec)
+                    if fmt is None:
+                        hdtv.ui.msg("Loaded %s into %s" % (fname, sid))
                     else:
-                        sid = self.spectra.Insert(spec, ID)
-                        spec.color = hdtv.color.ColorForID(sid.major)
-                        if spec.name in list(self.spectra.caldict.keys()):
-                            spec.cal = self.spectra.caldict[spec.name]
-                        loaded.append(spec)
-                        if fmt is None:
-                            hdtv.ui.msg("Loaded %s into %s" % (fname, sid))
-                        else:
-                            hdtv.ui.msg("Loaded %s'%s into %s" % (fname, fmt, sid))
+                        hdtv.ui.msg("Loaded %s'%s into %s" % (fname, fmt, sid))
 
             if loaded:
                 # activate last loaded spectrum
@@ -187,6 +202,33 @@ class SpecInterface(object):
                     self.window.Expand()
             return loaded
 
+    @staticmethod
+    def ReadSpectra(files, lazy=False, nthreads=1):
+        """
+        Read the histograms of a list of (fname, fmt) tuples in parallel.
+
+        Returns a list with one ROOT histogram per file, or None, if the file
+        is to be loaded lazily or could not be read (the error is reported
+        again when creating the FileHistogram).
+        """
+        if lazy or not files:
+            return [None] * len(files)
+
+        def read(item):
+            try:
+                return hdtv.speccache.GetSpectrum(*item)
+            except (OSError, SpecReaderError):
+                return None
+
+        if nthreads == 0:
+            nthreads = os.cpu_count()
+        nthreads = min(nthreads, len(files))
+        if nthreads <= 1:
+            return [read(item) for item in files]
+        hdtv.specreader.EnableThreads()
+        with ThreadPoolExecutor(max_workers=nthreads) as pool:
+            return list(pool.map(read, files))
+
     def ListSpectra(self, visible=False):
         """
         Create a list of all spectra (for printing)
@@ -254,6 +296,13 @@ class TvSpecInterface(object):
         self.specIf = specInterface
         self.spectra = self.specIf.spectra
 
+        self.opt["get.jobs"] = hdtv.options.Option(default=0, parse=lambda x: int(x))
+        hdtv.options.RegisterOption("spec.get.jobs", self.opt["get.jobs"])
+        self.opt["get.lazy"] = hdtv.options.Option(
+            default=False, parse=hdtv.options.parse_bool
+        )
+        hdtv.options.RegisterOption("spec.get.lazy", self.opt["get.lazy"])
+
         # spectrum commands
         prog = "spectrum get"
         description = "Load a spectrum from a file (using libmfile)"
@@ -265,6 +314,21 @@ class TvSpecInterface(object):
             default=None,
             help="id for loaded spectrum",
         )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            action="store",
+            default=None,
+            help="number of files to read in parallel (0: number of CPUs)",
+        )
+        parser.add_argument(
+            "-l",
+            "--lazy",
+            action="store_true",
+            default=None,
+            help="only read the file headers now, and the bins when the spectra are first used",
+        )
         parser.add_argument("pattern", nargs="+")
         hdtv.cmdline.AddCommand(
             prog, self.SpectrumGet, level=0, fileargs=True, parser=parser
@@ -441,6 +505,49 @@ class TvSpecInterface(object):
             parser=parser,
         )
 
+        prog = "spectrum background"
+        description = (
+            "Estimate the continuum of the whole spectrum with the SNIP "
+            "algorithm. It is used as background by the 'snip' background "
+            "model and by 'fit peakfind --continuum', and inserted as new "
+            "spectrum."
+        )
+        parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+        parser.add_argument(
+            "specid", nargs="*", default=None, help="id of spectrum to process"
+        )
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            "-s",
+            "--sigma",
+            type=float,
+            default=None,
+            help="peak width (standard deviation) in energy units",
+        )
+        group.add_argument(
+            "-w",
+            "--width",
+            default=None,
+            help="energy dependent peak width, given as comma separated "
+            "coefficients c0,c1,c2 of sigma(E)^2 = c0 + c1*E + c2*E^2",
+        )
+        parser.add_argument(
+            "-n",
+            "--window",
+            type=float,
+            default=SNIP_WINDOW,
+            help="clipping window in units of the peak width (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-q",
+            "--no-insert",
+            action="store_true",
+            help="do not insert the continuum as new spectrum",
+        )
+        hdtv.cmdline.AddCommand(
+            prog, self.SpectrumBackground, level=2, fileargs=False, parser=parser
+        )
+
         prog = "spectrum add"
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog)
         parser.add_argument(
@@ -525,7 +632,15 @@ class TvSpecInterface(object):
                 raise hdtv.cmdline.HDTVCommandError("Invalid ID: %s" % msg)
         else:
             ID = None
-        self.specIf.LoadSpectra(patterns=args.pattern, ID=ID)
+        if args.jobs is None:
+            args.jobs = hdtv.options.Get("spec.get.jobs")
+        if args.jobs < 0:
+            raise hdtv.cmdline.HDTVCommandError("Number of jobs must be >= 0")
+        if args.lazy is None:
+            args.lazy = hdtv.options.Get("spec.get.lazy")
+        self.specIf.LoadSpectra(
+            patterns=args.pattern, ID=ID, lazy=args.lazy, nthreads=args.jobs
+        )
 
     def SpectrumDelete(self, args):
         """
@@ -674,6 +789,51 @@ class TvSpecInterface(object):
                     "Cannot multiply spectrum " + str(i) + " (Does not exist)"
                 )
 
+    def SpectrumBackground(self, args):
+        """
+        Estimate the continuum of spectra
+        """
+        if not args.specid:
+            if self.spectra.activeID is not None:
+                ids = [self.spectra.activeID]
+            else:
+                hdtv.ui.msg("No active spectrum")
+                ids = list()
+        else:
+            ids = hdtv.util.ID.ParseIds(args.specid, self.spectra)
+
+        if len(ids) == 0:
+            hdtv.ui.warning("Nothing to do")
+            return
+
+        width = None
+        try:
+            if args.width is not None:
+                width = WidthModel.Parse(args.width)
+            elif args.sigma is not None:
+                width = WidthModel.Constant(args.sigma)
+        except ValueError as msg:
+            raise hdtv.cmdline.HDTVCommandError(str(msg))
+
+        for i in ids:
+            try:
+                spec = self.spectra.dict[i]
+            except KeyError:
+                raise hdtv.cmdline.HDTVCommandError("No such spectrum: " + str(i))
+            continuum = spec.hist.EstimateContinuum(width, args.window)
+            hdtv.ui.msg("Estimated continuum of spectrum " + str(i))
+            if args.no_insert:
+                continue
+            hist = ROOT.TH1D(continuum.GetHist())
+            hist.SetName("%s (background)" % spec.name)
+            bgspec = Spectrum(Histogram(hist, cal=spec.cal))
+            bgspec.typeStr = "spectrum, background"
+            sid = self.spectra.Insert(bgspec)
+            bgspec.color = hdtv.color.ColorForID(sid.major)
+            if spec.cal:
+                self.spectra.caldict[bgspec.name] = spec.cal
+            hdtv.ui.msg("Inserted continuum of spectrum %s as spectrum %s" % (i, sid))
+
     def SpectrumRebin(self, args):
         """
         Rebin spectrum
@@ -1,3 +1,3 @@
 import hdtv.rootext.dlmgr
 
-hdtv.rootext.dlmgr.LoadLibrary("calibration")
+hdtv.rootext.dlmgr.LoadLibrary("calibration", deferred=True)
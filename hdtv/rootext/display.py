@@ -1,4 +1,4 @@
 import hdtv.rootext.dlmgr
 import hdtv.rootext.calibration
 
-hdtv.rootext.dlmgr.LoadLibrary("display")
+hdtv.rootext.dlmgr.LoadLibrary("display", deferred=True)
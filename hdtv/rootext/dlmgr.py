@@ -23,6 +23,7 @@
 HDTV dynamic (C++) library manager
 """
 
+import ctypes
 import os
 import sys
 import shutil
@@ -66,58 +67,100 @@ def FindLibrary(name, libname):
     return None
 
 
-def LoadLibrary(name):
+def LoadLibrary(name, deferred=False):
     """
-    Load a dynamic library. Try to find and load it, or rebuild it on fail
+    Load a dynamic library. Try to find and load it, or rebuild it on fail.
+    If it is missing, all missing libraries are built in one go.
+
+    With deferred=True, the library is only opened to check that it is
+    intact, its rootmap is registered, and ROOT loads the library and its dictionary when one of its classes is
+    first used. Libraries whose free functions are used directly must not
+    be deferred, since these are not listed in the rootmap.
     """
     loaded = False
     libname = libfmt % name
     fname = FindLibrary(name, libname)
     if fname:
-        loaded = _LoadLibrary(fname) >= 0
-
-    if not loaded:
-        fname = BuildLibrary(name, usrdir)
-        loaded = _LoadLibrary(fname) >= 0
+        loaded = _LoadLibrary(fname, deferred) >= 0
+        if not loaded:
+            fname = BuildLibrary(name, usrdir)
+            loaded = _LoadLibrary(fname, deferred) >= 0
+    else:
+        # A freshly built library that fails to load is not rebuilt again
+        missing = [
+            module for module in modules if not FindLibrary(module, libfmt % module)
+        ]
+        BuildLibraries(usrdir, missing)
+        fname = FindLibrary(name, libname)
+        loaded = fname is not None and _LoadLibrary(fname, deferred) >= 0
 
     if not loaded:
         hdtv.ui.error("Failed to load library %s" % libname)
         sys.exit(1)
 
 
-def _LoadLibrary(fname):
+def _LoadLibrary(fname, deferred=False):
     ROOT.gSystem.SetDynamicPath(
         os.path.dirname(fname) + os.pathsep + ROOT.gSystem.GetDynamicPath()
     )
     ROOT.gSystem.SetIncludePath(
         os.path.dirname(fname) + os.pathsep + ROOT.gSystem.GetDynamicPath()
     )
+    rootmap = os.path.splitext(fname)[0] + ".rootmap"
+    if deferred and os.path.isfile(rootmap):
+        # Registering the rootmap succeeds even for broken libraries, which
+        # would then only fail when ROOT autoloads them. Opening the library
+        # (without resolving its symbols) catches these, so that they are
+        # rebuilt. If this fails only because a dependency is found by ROOT
+        # alone, the library is loaded right away below.
+        try:
+            ctypes.CDLL(fname, mode=os.RTLD_LAZY)
+        except OSError:
+            pass
+        else:
+            return ROOT.gInterpreter.LoadLibraryMap(rootmap)
     return ROOT.gSystem.Load(fname)
 
 
 def RebuildLibraries(dir, libraries=None):
     if os.path.exists(dir):
         shutil.rmtree(dir)
-    for name in libraries or modules:
-        BuildLibrary(name, dir)
+    BuildLibraries(dir, libraries or modules)
 
 
 def BuildLibrary(name, dir):
-    srcdir = os.path.join(os.path.dirname(__file__), name)
-    # with tempfile.TemporaryDirectory() as tmpdir: TOOD: Not available in python2
-    tmpdir = tempfile.mkdtemp()
-    subprocess.check_call(
-        [
-            "cmake",
-            srcdir,
-            "-DCMAKE_INSTALL_PREFIX=%s" % dir,
-            "-DCMAKE_BUILD_TYPE=Release",
-        ],
-        cwd=tmpdir,
-    )
-    subprocess.check_call(["cmake", "--build", ".", "-j"], cwd=tmpdir)
-    subprocess.check_call(["cmake", "--build", ".", "--target", "install"], cwd=tmpdir)
-    shutil.rmtree(tmpdir)
+    return BuildLibraries(dir, [name])[0]
 
-    hdtv.ui.info("Rebuild library %s in %s" % ((libfmt % name), dir))
-    return os.path.join(dir, "lib", libfmt % name)
+
+def BuildLibraries(dir, libraries, nprocs=None):
+    """
+    Configure and build several libraries at once and install them
+    (including rootmap and dictionary) to dir. The sources of all libraries
+    are compiled in parallel using nprocs jobs (default: number of CPUs).
+    Returns the filenames of the libraries.
+    """
+    srcdir = os.path.dirname(__file__)
+    nprocs = nprocs or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmpdir:
+        subprocess.check_call(
+            [
+                "cmake",
+                srcdir,
+                "-DCMAKE_INSTALL_PREFIX=%s" % dir,
+                "-DCMAKE_BUILD_TYPE=Release",
+                "-DHDTV_MODULES=%s" % ";".join(libraries),
+            ],
+            cwd=tmpdir,
+        )
+        subprocess.check_call(
+            ["cmake", "--build", ".", "--parallel", str(nprocs)], cwd=tmpdir
+        )
+        subprocess.check_call(
+            ["cmake", "--build", ".", "--target", "install"], cwd=tmpdir
+        )
+
+    fnames = []
+    for name in libraries:
+        hdtv.ui.info("Rebuild library %s in %s" % ((libfmt % name), dir))
+        fnames.append(os.path.join(dir, "lib", libfmt % name))
+    return fnames
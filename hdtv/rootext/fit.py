@@ -1,3 +1,4 @@
 import hdtv.rootext.dlmgr
 
+# Not deferred: HDTV::TH1IntegrateWithPartialBins is not in the rootmap
 hdtv.rootext.dlmgr.LoadLibrary("fit")
@@ -31,7 +31,7 @@
 #include <TError.h>
 #include <TF1.h>
 #include <TH1.h>
-#include <TVirtualFitter.h>
+#include <TFitResult.h>
 
 #include "Util.hh"
 
@@ -135,11 +135,9 @@ TF1 *EEPeak::GetPeakFunc() {
 //! Initialize fVol and fVolError
 //! The volume is the integral from -\infty to x_0 + 5 * \sigma_1
 //!  (see email from Oleksiy Burda <burda@ikp.tu-darmstadt.de>, 2008-12-05)
-void EEPeak::StoreIntegral() {
-  // Get fitter
-  TVirtualFitter *fitter = TVirtualFitter::GetFitter();
-  if (fitter == nullptr) {
-    Error("EEPeak::StoreIntegral", "No existing fitter");
+void EEPeak::StoreIntegral(const TFitResult *result) {
+  if (result == nullptr) {
+    Error("EEPeak::StoreIntegral", "No fit result");
     return;
   }
 
@@ -229,7 +227,7 @@ void EEPeak::StoreIntegral() {
       if (id[i] < 0 || id[j] < 0) {
         covar = 0.0;
       } else {
-        covar = fitter->GetCovarianceMatrixElement(id[i], id[j]);
+        covar = result->CovMatrix(id[i], id[j]);
       }
 
       errsq += deriv[i] * deriv[j] * covar;
@@ -353,13 +351,13 @@ void EEFitter::_Fit(TH1 &hist) {
   }
 
   // Do the fit
-  char options[7];
-  sprintf(options, "RQNM%s%s", fIntegrate.GetValue() ? "I" : "", fLikelihood.GetValue() == "poisson" ? "L" : "");
-  hist.Fit(fSumFunc.get(), options);
+  char options[8];
+  sprintf(options, "RQNMS%s%s", fIntegrate.GetValue() ? "I" : "", fLikelihood.GetValue() == "poisson" ? "L" : "");
+  TFitResultPtr result = hist.Fit(fSumFunc.get(), options);
 
-  // Calculate the peak volumes while the covariance matrix is still available
+  // Calculate the peak volumes from the covariance matrix of the fit result
   for (auto &peak : fPeaks) {
-    peak.StoreIntegral();
+    peak.StoreIntegral(result.Get());
   }
 
   // For debugging only
@@ -33,6 +33,7 @@
 
 class TArrayD;
 class TF1;
+class TFitResult;
 class TH1;
 
 namespace HDTV {
@@ -96,7 +97,7 @@ public:
   TF1 *GetPeakFunc();
 
 private:
-  void StoreIntegral();
+  void StoreIntegral(const TFitResult *result);
 
   Param fPos, fAmp, fSigma1, fSigma2, fEta, fGamma;
   double fVol, fVolError;
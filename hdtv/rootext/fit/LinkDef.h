@@ -17,6 +17,7 @@
 #pragma link C++ class HDTV::Fit::ExpBg+;
 #pragma link C++ class HDTV::Fit::PolyBg+;
 #pragma link C++ class HDTV::Fit::InterpolationBg+;
+#pragma link C++ class HDTV::Fit::SnipBg+;
 #pragma link C++ class HDTV::Fit::Param+;
 #pragma link C++ class HDTV::Fit::Option<bool>+;
 #pragma link C++ class HDTV::Fit::Option<std::string>+;
@@ -30,7 +30,7 @@
 #include <TError.h>
 #include <TF1.h>
 #include <TH1.h>
-#include <TVirtualFitter.h>
+#include <TFitResult.h>
 
 #include "Util.hh"
 
@@ -104,22 +104,23 @@ void PolyBg::Fit(TH1 &hist) {
   }
 
   // Fit
-  char options[7];
-  sprintf(options, "RQNM%s%s", fIntegrate.GetValue() ? "I" : "", fLikelihood.GetValue() == "poisson" ? "L" : "");
-  hist.Fit(&fitFunc, options);
+  // The covariance matrix is taken from the fit result, not from the global
+  // TVirtualFitter, so that fits can run in several threads at once
+  char options[8];
+  sprintf(options, "RQNMS%s%s", fIntegrate.GetValue() ? "I" : "", fLikelihood.GetValue() == "poisson" ? "L" : "");
+  TFitResultPtr result = hist.Fit(&fitFunc, options);
 
   // Copy chisquare
   fChisquare = fitFunc.GetChisquare();
 
   // Copy covariance matrix (needed for error evaluation)
-  TVirtualFitter *fitter = TVirtualFitter::GetFitter();
-  if (fitter == nullptr) {
-    Error("PolyBg::Fit", "No existing fitter after fit");
+  if (result.Get() == nullptr) {
+    Error("PolyBg::Fit", "No fit result");
   } else {
     fCovar = std::vector<std::vector<double>>(fnParams, std::vector<double>(fnParams + 1));
     for (int i = 0; i < fnParams; ++i) {
       for (int j = 0; j < fnParams; ++j) {
-        fCovar[i][j] = fitter->GetCovarianceMatrixElement(i, j);
+        fCovar[i][j] = result->CovMatrix(i, j);
       }
     }
   }
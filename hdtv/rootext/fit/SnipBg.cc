@@ -0,0 +1,147 @@
+/*
+ * HDTV - A ROOT-based spectrum analysis software
+ *  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+ *
+ * This file is part of HDTV.
+ *
+ * HDTV is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the
+ * Free Software Foundation; either version 2 of the License, or (at your
+ * option) any later version.
+ *
+ * HDTV is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+ * for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with HDTV; if not, write to the Free Software Foundation,
+ * Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+ *
+ */
+
+#include "SnipBg.hh"
+
+#include <algorithm>
+#include <cmath>
+
+#include <TArrayD.h>
+
+#include "Util.hh"
+
+namespace HDTV {
+namespace Fit {
+
+SnipBg::SnipBg(double window) : fWindow(window) {}
+
+SnipBg::SnipBg(const SnipBg &src) : fWindow(src.fWindow), fWindows(src.fWindows), fHist(src.fHist) {
+  //! Copy constructor (the estimated continuum is shared, not copied)
+}
+
+SnipBg &SnipBg::operator=(const SnipBg &src) {
+  //! Assignment operator
+
+  // Handle self assignment
+  if (this == &src) {
+    return *this;
+  }
+
+  fWindow = src.fWindow;
+  fWindows = src.fWindows;
+  fHist = src.fHist;
+  fFunc.reset();
+
+  return *this;
+}
+
+void SnipBg::SetWindows(const TArrayD &windows) {
+  fWindows.assign(windows.GetArray(), windows.GetArray() + windows.GetSize());
+}
+
+void SnipBg::Fit(TH1 &hist) {
+  //! Estimate the continuum of hist
+
+  const int nbins = hist.GetNbinsX();
+
+  // Clipping window of every bin
+  std::vector<int> windows(nbins);
+  for (int i = 0; i < nbins; ++i) {
+    double window = (static_cast<int>(fWindows.size()) == nbins) ? fWindows[i] : fWindow;
+    windows[i] = std::max(static_cast<int>(std::lround(window)), 0);
+  }
+  const int maxWindow = nbins > 0 ? *std::max_element(windows.begin(), windows.end()) : 0;
+
+  // Log-log-sqrt transformation, which reduces the dynamic range
+  std::vector<double> v(nbins);
+  for (int i = 0; i < nbins; ++i) {
+    double y = std::max(hist.GetBinContent(i + 1), 0.);
+    v[i] = std::log(std::log(std::sqrt(y + 1.) + 1.) + 1.);
+  }
+
+  // Clipping with decreasing window
+  std::vector<double> w(nbins);
+  for (int p = maxWindow; p >= 1; --p) {
+    for (int i = p; i < nbins - p; ++i) {
+      double mean = 0.5 * (v[i - p] + v[i + p]);
+      w[i] = (windows[i] >= p) ? std::min(v[i], mean) : v[i];
+    }
+    for (int i = p; i < nbins - p; ++i) {
+      v[i] = w[i];
+    }
+  }
+
+  // Back transformation
+  const TAxis *axis = hist.GetXaxis();
+  if (axis->GetXbins()->GetSize() > 0) {
+    fHist = std::make_shared<TH1D>(GetFuncUniqueName("snip", this).c_str(), "SNIP background", nbins,
+                                   axis->GetXbins()->GetArray());
+  } else {
+    fHist = std::make_shared<TH1D>(GetFuncUniqueName("snip", this).c_str(), "SNIP background", nbins,
+                                   axis->GetXmin(), axis->GetXmax());
+  }
+  fHist->SetDirectory(nullptr);
+  for (int i = 0; i < nbins; ++i) {
+    double y = std::exp(std::exp(v[i]) - 1.) - 1.;
+    fHist->SetBinContent(i + 1, y * y - 1.);
+  }
+  fFunc.reset();
+}
+
+TF1 *SnipBg::GetFunc() {
+  //! Function describing the continuum, e.g. for display purposes
+
+  if (fFunc == nullptr && fHist != nullptr) {
+    fFunc = std::make_unique<TF1>(GetFuncUniqueName("b", this).c_str(), this, &SnipBg::_Eval,
+                                  fHist->GetXaxis()->GetXmin(), fHist->GetXaxis()->GetXmax(), 0, "SnipBg", "_Eval");
+  }
+  return fFunc.get();
+}
+
+double SnipBg::Eval(double x) const {
+  //! Linear interpolation between the bin centers of the continuum
+
+  if (fHist == nullptr) {
+    return std::numeric_limits<double>::quiet_NaN();
+  }
+
+  const TAxis *axis = fHist->GetXaxis();
+  const int nbins = fHist->GetNbinsX();
+  if (x < axis->GetXmin() || x > axis->GetXmax()) {
+    return 0.;
+  }
+
+  int bin = axis->FindFixBin(x);
+  bin = std::min(std::max(bin, 1), nbins);
+  double center = axis->GetBinCenter(bin);
+  int other = (x < center) ? bin - 1 : bin + 1;
+  if (other < 1 || other > nbins) {
+    return fHist->GetBinContent(bin);
+  }
+
+  double otherCenter = axis->GetBinCenter(other);
+  double t = (x - center) / (otherCenter - center);
+  return (1. - t) * fHist->GetBinContent(bin) + t * fHist->GetBinContent(other);
+}
+
+} // end namespace Fit
+} // end namespace HDTV
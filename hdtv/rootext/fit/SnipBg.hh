@@ -0,0 +1,86 @@
+/*
+ * HDTV - A ROOT-based spectrum analysis software
+ *  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+ *
+ * This file is part of HDTV.
+ *
+ * HDTV is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the
+ * Free Software Foundation; either version 2 of the License, or (at your
+ * option) any later version.
+ *
+ * HDTV is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+ * for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with HDTV; if not, write to the Free Software Foundation,
+ * Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+ *
+ */
+
+#ifndef __SnipBg_h__
+#define __SnipBg_h__
+
+#include <limits>
+#include <memory>
+#include <vector>
+
+#include <TF1.h>
+#include <TH1.h>
+
+#include "Background.hh"
+
+class TArrayD;
+
+namespace HDTV {
+namespace Fit {
+
+//! Continuum of a full spectrum, estimated with the SNIP algorithm
+/** Sensitive Nonlinear Iterative Peak clipping (C.G. Ryan et al., NIM B 34
+ *  (1988) 396, M. Morhac et al., NIM A 401 (1997) 113): The spectrum is
+ *  transformed with a log-log-sqrt operator and every bin is then replaced by
+ *  the minimum of its content and the mean of its neighbours at distance p,
+ *  for decreasing clipping windows p. The clipping window of each bin can be
+ *  set individually, to follow the energy dependent width of the peaks.
+ *
+ *  Unlike the other backgrounds, the estimate covers the whole spectrum and
+ *  needs no background regions. It is computed once by Fit() and shared by
+ *  all copies made with Clone(). */
+class SnipBg : public Background {
+public:
+  explicit SnipBg(double window = 10.);
+  SnipBg(const SnipBg &src);
+  SnipBg &operator=(const SnipBg &src);
+
+  //! Set the clipping window (in bins) of each bin
+  void SetWindows(const TArrayD &windows);
+  void Fit(TH1 &hist);
+
+  //! The estimated continuum (owned by the SnipBg)
+  TH1D *GetHist() { return fHist.get(); }
+
+  double GetCoeff(int i) const override { return std::numeric_limits<double>::quiet_NaN(); }
+  unsigned int GetNparams() const override { return 0; }
+
+  SnipBg *Clone() const override { return new SnipBg(*this); }
+  TF1 *GetFunc() override;
+
+  double Eval(double x) const override;
+  //! The SNIP algorithm gives no uncertainty estimate
+  double EvalError(double x) const override { return 0.; }
+
+private:
+  double _Eval(double *x, double *p) { return Eval(x[0]); }
+
+  double fWindow;
+  std::vector<double> fWindows;
+  std::shared_ptr<TH1D> fHist;
+  std::unique_ptr<TF1> fFunc;
+};
+
+} // end namespace Fit
+} // end namespace HDTV
+
+#endif
@@ -33,8 +33,6 @@
 #include <stdlib.h>
 #include <unistd.h>
 
-static void checkconvbuffer(uint32_t size);
-
 static int32_t conv_int_to_dbl(double *dst, const int32_t *src, int32_t num);
 static int32_t conv_flt_to_dbl(double *dst, const float *src, int32_t num);
 static int32_t conv_int_to_flt(float *dst, const int32_t *src, int32_t num);
@@ -118,80 +116,103 @@ static int32_t conv_dbl_to_int(int32_t *dst, const double *src, int32_t num) {
 
 /*------------------------------------------------------------------------*/
 
-static void *mgetconvbuf = NULL;
-static uint32_t mgetconvbufsize = 0;
-
-static void checkconvbuffer(uint32_t size) {
-
-  if (mgetconvbufsize < size) {
-    if (mgetconvbuf)
-      free(mgetconvbuf);
-    mgetconvbuf = (void *)malloc(size);
-    if (mgetconvbuf == NULL) {
-      PERROR("malloc");
-    }
-    mgetconvbufsize = (mgetconvbuf != NULL) ? size : 0;
-  }
-}
+/* The conversion buffers are allocated for each call (instead of sharing one
+ * static buffer), so that several files can be read from different threads. */
 
 static int32_t mgetint_via_flt(MFILE *mat, int32_t *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(float));
 
-  checkconvbuffer(n * sizeof(float));
-  num = mgetflt(mat, (float *)mgetconvbuf, v, l, c, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = mgetflt(mat, (float *)buf, v, l, c, n);
+  num = conv_flt_to_int(b, (float *)buf, num);
+  free(buf);
 
-  return conv_flt_to_int(b, (float *)mgetconvbuf, num);
+  return num;
 }
 
 static int32_t mgetint_via_dbl(MFILE *mat, int32_t *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(double));
 
-  checkconvbuffer(n * sizeof(double));
-  num = mgetdbl(mat, (double *)mgetconvbuf, v, l, c, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = mgetdbl(mat, (double *)buf, v, l, c, n);
+  num = conv_dbl_to_int(b, (double *)buf, num);
+  free(buf);
 
-  return conv_dbl_to_int(b, (double *)mgetconvbuf, num);
+  return num;
 }
 
 static int32_t mgetflt_via_int(MFILE *mat, float *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(int));
 
-  checkconvbuffer(n * sizeof(int));
-  num = mgetint(mat, (int32_t *)mgetconvbuf, v, l, c, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = mgetint(mat, (int32_t *)buf, v, l, c, n);
+  num = conv_int_to_flt(b, (int32_t *)buf, num);
+  free(buf);
 
-  return conv_int_to_flt(b, (int32_t *)mgetconvbuf, num);
+  return num;
 }
 
 static int32_t mgetflt_via_dbl(MFILE *mat, float *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(double));
 
-  checkconvbuffer(n * sizeof(double));
-  num = mgetdbl(mat, (double *)mgetconvbuf, v, l, c, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = mgetdbl(mat, (double *)buf, v, l, c, n);
+  num = conv_dbl_to_flt(b, (double *)buf, num);
+  free(buf);
 
-  return conv_dbl_to_flt(b, (double *)mgetconvbuf, num);
+  return num;
 }
 
 static int32_t mgetdbl_via_int(MFILE *mat, double *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(int));
 
-  checkconvbuffer(n * sizeof(int));
-  num = mgetint(mat, (int32_t *)mgetconvbuf, v, l, c, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = mgetint(mat, (int32_t *)buf, v, l, c, n);
+  num = conv_int_to_dbl(b, (int32_t *)buf, num);
+  free(buf);
 
-  return conv_int_to_dbl(b, (int32_t *)mgetconvbuf, num);
+  return num;
 }
 
 static int32_t mgetdbl_via_flt(MFILE *mat, double *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(float));
 
-  checkconvbuffer(n * sizeof(float));
-  num = mgetflt(mat, (float *)mgetconvbuf, v, l, c, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = mgetflt(mat, (float *)buf, v, l, c, n);
+  num = conv_flt_to_dbl(b, (float *)buf, num);
+  free(buf);
 
-  return conv_flt_to_dbl(b, (float *)mgetconvbuf, num);
+  return num;
 }
 
 /*------------------------------------------------------------------------*/
@@ -199,61 +220,97 @@ static int32_t mgetdbl_via_flt(MFILE *mat, double *b, int32_t v, int32_t l, int3
 static int32_t mputint_via_flt(MFILE *mat, int32_t *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(float));
 
-  checkconvbuffer(n * sizeof(float));
-  num = conv_int_to_flt((float *)mgetconvbuf, b, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = conv_int_to_flt((float *)buf, b, n);
+  num = mputflt(mat, (float *)buf, v, l, c, num);
+  free(buf);
 
-  return mputflt(mat, (float *)mgetconvbuf, v, l, c, num);
+  return num;
 }
 
 static int32_t mputint_via_dbl(MFILE *mat, int32_t *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(double));
 
-  checkconvbuffer(n * sizeof(double));
-  num = conv_int_to_dbl((double *)mgetconvbuf, b, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = conv_int_to_dbl((double *)buf, b, n);
+  num = mputdbl(mat, (double *)buf, v, l, c, num);
+  free(buf);
 
-  return mputdbl(mat, (double *)mgetconvbuf, v, l, c, num);
+  return num;
 }
 
 static int32_t mputflt_via_int(MFILE *mat, float *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(int));
 
-  checkconvbuffer(n * sizeof(int));
-  num = conv_flt_to_int((int32_t *)mgetconvbuf, b, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = conv_flt_to_int((int32_t *)buf, b, n);
+  num = mputint(mat, (int32_t *)buf, v, l, c, num);
+  free(buf);
 
-  return mputint(mat, (int32_t *)mgetconvbuf, v, l, c, num);
+  return num;
 }
 
 static int32_t mputflt_via_dbl(MFILE *mat, float *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(double));
 
-  checkconvbuffer(n * sizeof(double));
-  num = conv_flt_to_dbl((double *)mgetconvbuf, b, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = conv_flt_to_dbl((double *)buf, b, n);
+  num = mputdbl(mat, (double *)buf, v, l, c, num);
+  free(buf);
 
-  return mputdbl(mat, (double *)mgetconvbuf, v, l, c, num);
+  return num;
 }
 
 static int32_t mputdbl_via_int(MFILE *mat, double *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(int));
 
-  checkconvbuffer(n * sizeof(int));
-  num = conv_dbl_to_int((int32_t *)mgetconvbuf, b, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = conv_dbl_to_int((int32_t *)buf, b, n);
+  num = mputint(mat, (int32_t *)buf, v, l, c, num);
+  free(buf);
 
-  return mputint(mat, (int32_t *)mgetconvbuf, v, l, c, num);
+  return num;
 }
 
 static int32_t mputdbl_via_flt(MFILE *mat, double *b, int32_t v, int32_t l, int32_t c, int32_t n) {
 
   int32_t num;
+  void *buf = malloc(n * sizeof(float));
 
-  checkconvbuffer(n * sizeof(float));
-  num = conv_dbl_to_flt((float *)mgetconvbuf, b, n);
+  if (buf == NULL) {
+    PERROR("malloc");
+    return -1;
+  }
+  num = conv_dbl_to_flt((float *)buf, b, n);
+  num = mputflt(mat, (float *)buf, v, l, c, num);
+  free(buf);
 
-  return mputflt(mat, (float *)mgetconvbuf, v, l, c, num);
+  return num;
 }
 
 /*------------------------------------------------------------------------*/
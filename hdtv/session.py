@@ -43,11 +43,17 @@ class Session(DrawableManager):
     First of all this provides a list of spectra, which is why this is called
     spectra in most contexts. But this also keeps track of the basic fit interface
     and of a list of calibrations.
+
+    A headless session has neither a window nor a viewport, so that
+    nothing is drawn (e.g. for batch processing).
     """
 
-    def __init__(self):
-        self.window = Window()
-        super(Session, self).__init__(viewport=self.window.viewport)
+    def __init__(self, headless=False):
+        self.window = None if headless else Window()
+        super(Session, self).__init__(
+            viewport=None if headless else self.window.viewport
+        )
+        self.headless = headless
         # TODO: make peakModel and bgdeg configurable
         self.workFit = Fit(Fitter(peakModel="theuerkauf", backgroundModel="polynomial"))
         self.workFit.active = True
@@ -56,9 +62,43 @@ class Session(DrawableManager):
         self.workCut.active = True
         self.workCut.Draw(self.viewport)
         self.caldict = dict()
+        # spectrum name -> IDs, see GetIDsByName
+        self._names = dict()
         # main session is always active
         self._active = True
 
+    def Insert(self, spec, ID=None):
+        """
+        Insert spectrum and add it to the name index
+        """
+        ID = super(Session, self).Insert(spec, ID)
+        self._names.setdefault(spec.name, list()).append(ID)
+        return ID
+
+    def _IndexNames(self):
+        self._names = dict()
+        for ID in sorted(self.dict.keys()):
+            self._names.setdefault(self.dict[ID].name, list()).append(ID)
+
+    def GetIDsByName(self, name):
+        """
+        Return the sorted IDs of all spectra called name
+        """
+        ids = self._names.get(name, list())
+        valid = [ID for ID in ids if ID in self.dict and self.dict[ID].name == name]
+        if not valid or len(valid) != len(ids):
+            # The index may be stale, e.g. after renaming spectra
+            self._IndexNames()
+            valid = self._names.get(name, list())
+        return sorted(valid)
+
+    def GetIDByName(self, name):
+        """
+        Return the (lowest) ID of the spectrum called name, or None
+        """
+        ids = self.GetIDsByName(name)
+        return ids[0] if ids else None
+
     def ApplyCalibration(self, specIDs, cal):
         """
         Apply calibration cal to spectra with ids
@@ -126,7 +166,7 @@ class Session(DrawableManager):
             hdtv.ui.error("Region not set.")
             return
 
-        if len(fit.bgMarkers) > 0:
+        if fit.HasExternalBackground():
             if fit.fitter.backgroundModel.fParStatus["nparams"] == -1:
                 hdtv.ui.error("Background degree of -1 contradicts background fit.")
                 return
@@ -155,7 +195,7 @@ class Session(DrawableManager):
 
         fit = self.workFit
         try:
-            if not peaks and len(fit.bgMarkers) > 0:
+            if not peaks and fit.HasExternalBackground():
                 fit.FitBgFunc(spec)
             if peaks:
                 # full fit
@@ -366,5 +406,7 @@ class Session(DrawableManager):
         self.workFit = Fit(Fitter(peakModel="theuerkauf", backgroundModel="polynomial"))
         self.workFit.active = True
         self.workFit.Draw(self.viewport)
-        self.caldict = dict()
+        # Other modules keep a reference to caldict
+        self.caldict.clear()
+        self._names = dict()
         return super(Session, self).Clear()
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Session snapshots
+
+A snapshot holds everything needed to continue working on a session:
+the bins of all spectra, calibrations, fits (as fit store tables, see
+hdtv.fitstore), matrices with their cuts, and all options that differ from
+their default. Restoring a snapshot neither reads the original spectrum
+files nor repeats any fit. Matrices are stored by reference, i.e. their
+projections and cuts are read from the matrix files again.
+
+File layout (little-endian):
+  header:   magic, version, reserved, length of the description
+  JSON description of the session (padded to a multiple of 8 bytes)
+  data:     the doubles of all spectra (see hdtv.speccache.Hist2Arrays),
+            which are mapped into memory when loading
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+import hdtv.cal
+import hdtv.color
+import hdtv.fitstore
+import hdtv.options
+import hdtv.speccache
+import hdtv.ui
+import hdtv.util
+
+from hdtv._version import get_versions
+from hdtv.cmdline import HDTVCommandError
+from hdtv.cut import Cut
+from hdtv.fitxml import FitXml
+from hdtv.histogram import FileHistogram, Histogram, MHisto2D
+from hdtv.matrix import Matrix
+from hdtv.specreader import SpecReaderError
+from hdtv.spectrum import CutSpectrum, Spectrum
+from hdtv.util import LockViewport
+
+MAGIC = b"HDTVSES\0"
+# Increase if the layout of snapshots changes
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+
+
+def _ID(ID):
+    return [ID.major, ID.minor]
+
+
+def _MakeID(ID):
+    return hdtv.util.ID(*ID)
+
+
+def _Markers(markers):
+    """
+    Return the (calibrated) positions of paired markers
+    """
+    return [[marker.p1.pos_cal, marker.p2.pos_cal] for marker in markers]
+
+
+class _Writer(object):
+    """
+    Collects the arrays of a snapshot and their offsets in the data section
+    """
+
+    def __init__(self):
+        self.arrays = list()
+        self.size = 0
+
+    def Hist(self, hist):
+        (nbins, flags, xmin, xmax, entries), arrays = hdtv.speccache.Hist2Arrays(hist)
+        data = {
+            "nbins": nbins,
+            "flags": flags,
+            "xmin": xmin,
+            "xmax": xmax,
+            "entries": entries,
+            "offset": self.size,
+            "size": sum(len(array) for array in arrays),
+        }
+        self.arrays.extend(arrays)
+        self.size += data["size"]
+        return data
+
+
+def _SpectrumEntry(spec, ID, session, writer, data=True):
+    """
+    Describe a spectrum, its calibration and its fits. The bins are only
+    stored if data is True.
+    """
+    entry = {
+        "id": _ID(ID),
+        "name": spec.name,
+        "cal": hdtv.cal.GetCoeffs(spec.cal) if spec.cal is not None else None,
+        "norm": spec.norm,
+        "visible": ID in session.visible,
+        "fits": None,
+        "fitids": [_ID(fitID) for fitID in sorted(spec.dict)],
+    }
+    if spec.dict:
+        entry["fits"] = hdtv.fitstore.Tables2Lists(hdtv.fitstore.Fits2Tables(spec.dict))
+    if not data:
+        return entry
+    if isinstance(spec.hist, FileHistogram):
+        entry["filename"] = os.path.abspath(spec.hist.filename)
+        entry["fmt"] = spec.hist.fmt
+    if isinstance(spec.hist, FileHistogram) and not spec.hist.loaded:
+        # Read from file, once it is needed
+        entry["data"] = None
+    else:
+        entry["data"] = writer.Hist(spec.hist.hist)
+    return entry
+
+
+def Describe(session):
+    """
+    Describe the state of session, returns the description and the arrays
+    of the data section
+    """
+    writer = _Writer()
+    description = {
+        "hdtv": get_versions()["version"],
+        "options": hdtv.options.Changed(),
+        "calibrations": {
+            name: hdtv.cal.GetCoeffs(cal) for (name, cal) in session.caldict.items()
+        },
+        "active": _ID(session.activeID) if session.activeID is not None else None,
+        "spectra": list(),
+        "matrices": list(),
+    }
+
+    matrices = dict()
+    for ID in sorted(session.dict):
+        spec = session.dict[ID]
+        matrix = getattr(spec, "matrix", None)
+        if isinstance(spec, CutSpectrum) and matrix is not None:
+            if ID.minor == 1010:
+                # Unstored cut (workCut)
+                continue
+            if not isinstance(matrix.histo2D, MHisto2D):
+                hdtv.ui.warning("Matrix of spectrum %s cannot be saved" % ID)
+                continue
+            if matrix.ID not in matrices:
+                matrices[matrix.ID] = {
+                    "id": _ID(matrix.ID),
+                    "filename": os.path.abspath(matrix.histo2D.filename),
+                    "sym": matrix.sym,
+                    "cuts": [
+                        {
+                            "id": _ID(cutID),
+                            "axis": cut.axis,
+                            "region": _Markers(cut.regionMarkers),
+                            "bg": _Markers(cut.bgMarkers),
+                        }
+                        for (cutID, cut) in sorted(matrix.dict.items())
+                    ],
+                    "spectra": list(),
+                }
+            matrices[matrix.ID]["spectra"].append(
+                _SpectrumEntry(spec, ID, session, writer, data=False)
+            )
+        elif isinstance(spec.hist, Histogram):
+            description["spectra"].append(_SpectrumEntry(spec, ID, session, writer))
+        else:
+            hdtv.ui.warning("Spectrum %s cannot be saved" % ID)
+    description["matrices"] = list(matrices.values())
+    return description, writer.arrays
+
+
+def Save(session, fname):
+    """
+    Write a snapshot of session to fname
+    """
+    description, arrays = Describe(session)
+    text = json.dumps(description).encode("utf-8")
+    text += b" " * (-(HEADER.size + len(text)) % 8)
+
+    # Write to a temporary file first, so that an existing snapshot is not
+    # lost if writing fails
+    tmpname = "%s.%d.tmp" % (fname, os.getpid())
+    try:
+        with open(tmpname, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(text)))
+            f.write(text)
+            for array in arrays:
+                f.write(array.astype("<f8").tobytes())
+        os.replace(tmpname, fname)
+    except OSError:
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+def Read(fname):
+    """
+    Read a snapshot, returns the description and the (memory mapped) data
+    section
+    """
+    with open(fname, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise HDTVCommandError("%s is not a session snapshot" % fname)
+        (magic, version, _, length) = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise HDTVCommandError("%s is not a session snapshot" % fname)
+        if version > VERSION:
+            raise HDTVCommandError(
+                "Session snapshot %s was written by a newer version of hdtv "
+                "(version %d)" % (fname, version)
+            )
+        try:
+            description = json.loads(f.read(length).decode("utf-8"))
+        except ValueError as msg:
+            raise HDTVCommandError("Corrupt session snapshot %s: %s" % (fname, msg))
+    offset = HEADER.size + length
+    if os.path.getsize(fname) > offset:
+        data = np.memmap(fname, dtype="<f8", mode="r", offset=offset)
+    else:
+        data = np.zeros(0)
+    return description, data
+
+
+def _RestoreHist(entry, data):
+    """
+    Create the histogram of a spectrum entry
+    """
+    if entry["data"] is None:
+        hist = FileHistogram(entry["filename"], entry["fmt"], lazy=True)
+    else:
+        d = entry["data"]
+        rhist = hdtv.speccache.Arrays2Hist(
+            data[d["offset"] : d["offset"] + d["size"]],
+            d["nbins"],
+            d["flags"],
+            d["xmin"],
+            d["xmax"],
+            d["entries"],
+            entry["name"],
+            entry["name"],
+        )
+        if rhist is None:
+            raise HDTVCommandError("Corrupt data of spectrum %s" % entry["name"])
+        if "filename" in entry:
+            hist = FileHistogram(entry["filename"], entry["fmt"], hist=rhist)
+        else:
+            hist = Histogram(rhist)
+    hist.name = entry["name"]
+    return hist
+
+
+def _RestoreSpectrum(spec, entry, fitxml):
+    """
+    Restore calibration, normalization and fits of a spectrum
+    """
+    if entry["cal"] is not None:
+        spec.cal = hdtv.cal.MakeCalibration(entry["cal"])
+    spec.norm = entry["norm"]
+    if entry["fits"] is None:
+        return 0
+    tables = hdtv.fitstore.Lists2Tables(entry["fits"])
+    elements = hdtv.fitstore.Tables2Xml(tables)
+    for (fitElement, fitID) in zip(elements, entry["fitids"]):
+        (fit, success) = fitxml.Xml2Fit(fitElement, calibration=spec.cal)
+        if success:
+            try:
+                fit.Restore(spec=spec)
+            except (TypeError, IndexError) as err:
+                hdtv.ui.debug("An exception occurred while restoring the peaks")
+                hdtv.ui.debug(err)
+                success = False
+        if not success:
+            hdtv.ui.warning("Could not restore fit %s, refitting" % fitID)
+            fit.FitPeakFunc(spec)
+        spec.Insert(fit, _MakeID(fitID))
+    return len(entry["fitids"])
+
+
+def _RestoreMatrix(session, entry):
+    """
+    Load a matrix and repeat its cuts, returns the matrix or None
+    """
+    ID = _MakeID(entry["id"])
+    try:
+        histo = MHisto2D(entry["filename"], entry["sym"])
+    except (OSError, SpecReaderError, RuntimeError):
+        hdtv.ui.warning("Could not load matrix %s" % entry["filename"])
+        return None
+    matrix = Matrix(histo, entry["sym"], session.viewport)
+    matrix.ID = ID
+    matrix.color = hdtv.color.ColorForID(ID.major)
+    session.Insert(matrix.xproj, ID=hdtv.util.ID(ID.major, 1000))
+    if not entry["sym"]:
+        session.Insert(matrix.yproj, ID=hdtv.util.ID(ID.major, 1001))
+    for cutEntry in entry["cuts"]:
+        cut = Cut()
+        for (p1, p2) in cutEntry["region"]:
+            cut.regionMarkers.SetMarker(p1)
+            cut.regionMarkers.SetMarker(p2)
+        for (p1, p2) in cutEntry["bg"]:
+            cut.bgMarkers.SetMarker(p1)
+            cut.bgMarkers.SetMarker(p2)
+        cutID = _MakeID(cutEntry["id"])
+        spec = cut.ExecuteCut(matrix, cutEntry["axis"])
+        matrix.Insert(cut, cutID)
+        matrix.dict[cutID].active = False
+        matrix.ActivateObject(None)
+        if spec is not None:
+            spec.color = hdtv.color.ColorForID(cutID.major)
+            session.Insert(spec, ID=hdtv.util.ID(ID.major, cutID.major))
+    return matrix
+
+
+def Load(session, fname):
+    """
+    Replace the state of session by the snapshot in fname
+    """
+    description, data = Read(fname)
+    fitxml = FitXml(session)
+    nfits = 0
+
+    for (name, value) in description["options"].items():
+        try:
+            hdtv.options.Set(name, value)
+        except (KeyError, ValueError):
+            hdtv.ui.warning("Could not restore option %s = %s" % (name, value))
+
+    with LockViewport(session.viewport):
+        session.Clear()
+        for (name, coeffs) in description["calibrations"].items():
+            session.caldict[name] = hdtv.cal.MakeCalibration(coeffs)
+
+        for entry in description["spectra"]:
+            try:
+                hist = _RestoreHist(entry, data)
+            except (OSError, SpecReaderError):
+                hdtv.ui.warning("Could not restore spectrum %s" % entry["name"])
+                continue
+            spec = Spectrum(hist)
+            ID = session.Insert(spec, _MakeID(entry["id"]))
+            spec.color = hdtv.color.ColorForID(ID.major)
+            nfits += _RestoreSpectrum(spec, entry, fitxml)
+
+        for entry in description["matrices"]:
+            if _RestoreMatrix(session, entry) is None:
+                continue
+            for specEntry in entry["spectra"]:
+                ID = _MakeID(specEntry["id"])
+                if ID in session.dict:
+                    nfits += _RestoreSpectrum(session.dict[ID], specEntry, fitxml)
+
+        visible = [
+            _MakeID(entry["id"])
+            for entry in description["spectra"]
+            + [e for m in description["matrices"] for e in m["spectra"]]
+            if entry["visible"]
+        ]
+        session.ShowObjects([ID for ID in visible if ID in session.dict])
+        if description["active"] is not None:
+            active = _MakeID(description["active"])
+            if active in session.dict:
+                session.ActivateObject(active)
+
+    hdtv.ui.msg(
+        "Restored %d spectra, %d matrices and %d fits from %s"
+        % (
+            len(description["spectra"]),
+            len(description["matrices"]),
+            nfits,
+            fname,
+        )
+    )
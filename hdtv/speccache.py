@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+On-disk cache for decoded spectra
+
+Decoding a spectrum file (text, LC-compressed, ...) can take much longer
+than its size suggests. The decoded bins are therefore kept in a binary
+cache file, which is read back in one go when the same file is loaded again.
+Cache entries are keyed by the path, size, modification time and format of
+the original file, so that they become invalid as soon as the file changes.
+When the cache grows larger than spec.cache.size, the least recently used
+entries are removed. The cache is only used if the option spec.cache.enable
+is set, since it keeps copies of the spectra in the user cache directory.
+
+Cache file layout (little-endian):
+  header:   magic, version, nbins, flags, reserved, xmin, xmax, entries
+  contents: nbins + 2 doubles (including under- and overflow bin)
+  edges:    nbins + 1 doubles (only for variable bin sizes)
+  sumw2:    nbins + 2 doubles (only for histograms with bin errors)
+"""
+
+import hashlib
+import os
+import struct
+import threading
+
+import numpy as np
+
+import ROOT
+import hdtv.options
+import hdtv.ui
+from hdtv.rootext.dlmgr import cachedir
+from hdtv.specreader import SpecReader
+
+MAGIC = b"HDTVSPC\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIddd")
+
+FLAG_EDGES = 1
+FLAG_SUMW2 = 2
+
+
+def _Doubles(buf, count):
+    """
+    Copy count doubles from a C++ double* to a numpy array
+    """
+    buf.reshape((count,))
+    return np.frombuffer(buf, dtype=np.float64, count=count).copy()
+
+
+def Hist2Arrays(hist):
+    """
+    Return (nbins, flags, xmin, xmax, entries) and the list of arrays
+    (contents, edges, sumw2) of hist, in the layout of a cache file
+    """
+    nbins = hist.GetNbinsX()
+    ncells = nbins + 2
+    axis = hist.GetXaxis()
+    flags = 0
+    arrays = [_Doubles(hist.GetArray(), ncells)]
+    if axis.GetXbins().GetSize() > 0:
+        flags |= FLAG_EDGES
+        arrays.append(_Doubles(axis.GetXbins().GetArray(), nbins + 1))
+    if hist.GetSumw2N() > 0:
+        flags |= FLAG_SUMW2
+        arrays.append(_Doubles(hist.GetSumw2().GetArray(), ncells))
+    return (nbins, flags, axis.GetXmin(), axis.GetXmax(), hist.GetEntries()), arrays
+
+
+def Arrays2Hist(data, nbins, flags, xmin, xmax, entries, histname, histtitle):
+    """
+    Create a ROOT.TH1D from the doubles data (as written by Hist2Arrays),
+    or return None if data does not have the expected length
+    """
+    ncells = nbins + 2
+    pos = ncells
+    contents = data[:pos]
+    if flags & FLAG_EDGES:
+        edges = np.ascontiguousarray(data[pos : pos + nbins + 1])
+        pos += nbins + 1
+        hist = ROOT.TH1D(histname, histtitle, nbins, edges)
+    else:
+        hist = ROOT.TH1D(histname, histtitle, nbins, xmin, xmax)
+    if flags & FLAG_SUMW2:
+        sumw2 = np.ascontiguousarray(data[pos : pos + ncells])
+        pos += ncells
+        hist.Sumw2()
+        hist.GetSumw2().Set(ncells, sumw2)
+    if len(data) != pos:
+        return None
+    hist.SetContent(contents)
+    hist.SetEntries(entries)
+    return hist
+
+
+class SpectrumCache(object):
+    """
+    Size-capped LRU cache of decoded spectra on disk
+    """
+
+    def __init__(self, path=None, maxsize=None):
+        """
+        path:    cache directory
+        maxsize: maximum size of the cache in bytes (default: from option
+                 spec.cache.size, in MB)
+        """
+        self.path = path or os.path.join(cachedir, "spectra")
+        self.maxsize = maxsize
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return hdtv.options.Get("spec.cache.enable")
+
+    def _GetMaxsize(self):
+        if self.maxsize is not None:
+            return self.maxsize
+        return int(hdtv.options.Get("spec.cache.size") * 1024**2)
+
+    def Filename(self, fname, fmt=None):
+        """
+        Return the name of the cache file for fname, or None if fname does
+        not exist
+        """
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            return None
+        key = "\0".join(
+            [
+                os.path.abspath(fname),
+                str(stat.st_size),
+                str(stat.st_mtime_ns),
+                (fmt or "mfile").lower(),
+            ]
+        )
+        digest = hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.path, digest + ".bin")
+
+    def _ReadHeader(self, cname):
+        with open(cname, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            return None
+        header = HEADER.unpack(header)
+        if header[0] != MAGIC or header[1] != VERSION:
+            return None
+        return header
+
+    def GetNbins(self, fname, fmt=None):
+        """
+        Return the number of bins of a cached spectrum, or None if fname
+        is not in the cache
+        """
+        if not self.enabled:
+            return None
+        cname = self.Filename(fname, fmt)
+        if cname is None:
+            return None
+        try:
+            header = self._ReadHeader(cname)
+        except OSError:
+            return None
+        return None if header is None else header[2]
+
+    def Get(self, fname, fmt=None, histname=None, histtitle=None):
+        """
+        Return the cached spectrum as ROOT.TH1D, or None if fname is not in
+        the cache
+        """
+        if not self.enabled:
+            return None
+        cname = self.Filename(fname, fmt)
+        if cname is None:
+            return None
+        try:
+            header = self._ReadHeader(cname)
+            if header is None:
+                return None
+            _, _, nbins, flags, _, xmin, xmax, entries = header
+            data = np.fromfile(cname, dtype="<f8", offset=HEADER.size)
+        except (OSError, ValueError):
+            return None
+
+        if histname is None:
+            histname = os.path.basename(fname)
+        if histtitle is None:
+            histtitle = os.path.basename(fname)
+
+        hist = Arrays2Hist(data, nbins, flags, xmin, xmax, entries, histname, histtitle)
+        if hist is None:
+            hdtv.ui.debug("Ignoring corrupt cache file %s" % cname)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(cname)
+        except OSError:
+            pass
+        hdtv.ui.debug("Read %s from cache file %s" % (fname, cname), level=2)
+        return hist
+
+    def Put(self, fname, fmt, hist):
+        """
+        Store the spectrum hist (read from fname) in the cache
+        """
+        if not self.enabled:
+            return
+        cname = self.Filename(fname, fmt)
+        if cname is None:
+            return
+
+        (nbins, flags, xmin, xmax, entries), arrays = Hist2Arrays(hist)
+        header = HEADER.pack(MAGIC, VERSION, nbins, flags, 0, xmin, xmax, entries)
+
+        # Write to a temporary file first, so that other threads or processes
+        # never see incomplete cache files
+        tmpname = "%s.%d.%d.tmp" % (cname, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmpname, "wb") as f:
+                f.write(header)
+                for array in arrays:
+                    f.write(array.astype("<f8").tobytes())
+            os.replace(tmpname, cname)
+        except OSError as msg:
+            hdtv.ui.debug("Failed to write cache file %s: %s" % (cname, msg))
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(cname)
+            if self._size is None or self._size > self._GetMaxsize():
+                self._Evict()
+
+    def _Evict(self):
+        """
+        Remove least recently used cache files, until the cache is smaller
+        than its maximum size
+        """
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.path)
+                if entry.name.endswith(".bin")
+            ]
+        except OSError:
+            return
+        size = sum(entry[1] for entry in entries)
+        maxsize = self._GetMaxsize()
+        for (_, entrysize, path) in sorted(entries):
+            if size <= maxsize:
+                break
+            try:
+                os.remove(path)
+                size -= entrysize
+            except OSError:
+                pass
+        self._size = size
+
+    def Clear(self):
+        """
+        Remove all cache files
+        """
+        with self._lock:
+            try:
+                for entry in os.scandir(self.path):
+                    if entry.name.endswith(".bin"):
+                        os.remove(entry.path)
+            except OSError:
+                pass
+            self._size = 0
+
+
+cache = SpectrumCache()
+
+
+def GetSpectrum(fname, fmt=None, histname=None, histtitle=None):
+    """
+    Read a spectrum from the cache, or from file (see SpecReader.GetSpectrum)
+    if it is not cached yet
+    """
+    hist = cache.Get(fname, fmt, histname, histtitle)
+    if hist is None:
+        hist = SpecReader.GetSpectrum(fname, fmt, histname, histtitle)
+        cache.Put(fname, fmt, hist)
+    return hist
+
+
+def GetNbins(fname, fmt=None):
+    """
+    Read the number of bins of a spectrum from the cache, or from the file
+    header (see SpecReader.GetNbins)
+    """
+    nbins = cache.GetNbins(fname, fmt)
+    if nbins is None:
+        nbins = SpecReader.GetNbins(fname, fmt)
+    return nbins
+
+
+opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("spec.cache.enable", opt)
+opt = hdtv.options.Option(default=512.0, parse=lambda x: float(x))
+hdtv.options.RegisterOption("spec.cache.size", opt)
@@ -30,6 +30,24 @@ class SpecReaderError(Exception):
     pass
 
 
+_threads_enabled = False
+
+
+def EnableThreads():
+    """
+    Prepare ROOT and libmfile for reading spectra from several python threads
+    at once: enable ROOTs internal locking and release the GIL while libmfile
+    reads the files.
+    """
+    global _threads_enabled
+    if _threads_enabled:
+        return
+    ROOT.EnableThreadSafety()
+    ROOT.MFileHist.Open.__release_gil__ = True
+    ROOT.MFileHist.ToTH1D.__release_gil__ = True
+    _threads_enabled = True
+
+
 class TextSpecReader(object):
     """
     Configurable formatted text file import
@@ -272,6 +290,31 @@ class SpecReader(object):
                 raise SpecReaderError(mhist.GetErrorMsg())
             return hist
 
+    @staticmethod
+    def GetNbins(fname, fmt=None):
+        """
+        Read the number of bins of a spectrum from the file header, without
+        reading the bin contents. Returns None for text files, which have no
+        header.
+        """
+        if not fmt:
+            fmt = "mfile"
+        if fmt.lower() == "cracow":
+            raise SpecReaderError("Format not longer supported")
+        elif fmt.split(":")[0].lower() == "col":
+            if not os.path.isfile(fname):
+                raise SpecReaderError("File %s not found" % fname)
+            return None
+
+        mhist = ROOT.MFileHist()
+        if fmt.lower() == "mfile":
+            result = mhist.Open(fname)
+        else:
+            result = mhist.Open(fname, fmt)
+        if result != ROOT.MFileHist.ERR_SUCCESS:
+            raise SpecReaderError(mhist.GetErrorMsg())
+        return mhist.GetNColumns()
+
     @staticmethod
     def GetMatrix(fname, fmt=None, histname=None, histtitle=None):
         if histname is None:
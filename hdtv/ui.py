@@ -35,7 +35,7 @@ import hdtv.cmdline
 
 from prompt_toolkit.patch_stdout import StdoutProxy, patch_stdout
 from prompt_toolkit import print_formatted_text
-from prompt_toolkit.formatted_text import HTML, ANSI
+from prompt_toolkit.formatted_text import HTML, ANSI, to_plain_text
 
 
 class SimpleUI(object):
@@ -115,6 +115,26 @@ class SimpleUI(object):
         self.print(f"<ansiblue>DEBUG: {html}</ansiblue>", end=end, err=True)
 
 
+class BatchUI(SimpleUI):
+    """
+    User interface without prompt, which writes plain text to stdout and
+    stderr (e.g. for batch processing)
+    """
+
+    def __init__(self, stdout=None, stderr=None):
+        super(BatchUI, self).__init__()
+        self.stdout = stdout or sys.stdout
+        self.stderr = stderr or sys.stderr
+
+    def print(self, html, end="\n", err=False):
+        try:
+            text = to_plain_text(HTML(html))
+        except Exception:
+            # Not every message is valid markup
+            text = html
+        (self.stderr if err else self.stdout).write(text + end)
+
+
 # Initialization
 ui = SimpleUI()
 
@@ -124,6 +144,18 @@ warning = ui.warning
 error = ui.error
 
 
+def SetUI(new):
+    """
+    Replace the user interface
+    """
+    global ui, msg, info, warning, error
+    ui = new
+    msg = ui.msg
+    info = ui.info
+    warning = ui.warning
+    error = ui.error
+
+
 def debug(text, end="\n", level=1):
     if level > hdtv.options.Get("ui.out.level"):
         return
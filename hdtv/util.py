@@ -22,6 +22,7 @@
 import re
 import os
 import shlex
+from bisect import bisect_left, bisect_right
 from itertools import count
 import contextlib
 from html import escape
@@ -531,6 +532,8 @@ class Position(object):
 
 
 class ID(object):
+    __slots__ = ("major", "minor")
+
     def __init__(self, major=None, minor=None):
         if major is None:
             self.major = None
@@ -548,12 +551,12 @@ class ID(object):
     def __eq__(self, other):
         if other is None:
             return False
-        return (self.major, self.minor) == (other.major, other.minor)
+        return self.major == other.major and self.minor == other.minor
 
     def __ne__(self, other):
         if other is None:
             return True
-        return not ((self.major, self.minor) == (other.major, other.minor))
+        return self.major != other.major or self.minor != other.minor
 
     def __gt__(self, other):
         try:
@@ -579,7 +582,16 @@ class ID(object):
 
     def __hash__(self):
         # this is needed to use IDs as keys in dicts and in sets
-        return hash(self.major) ^ hash(self.minor)
+        return hash((self.major, self.minor))
+
+    def SortKey(self):
+        """
+        Key for sorting IDs, where a missing major or minor ID comes first
+        """
+        return (
+            -1 if self.major is None else self.major,
+            -1 if self.minor is None else self.minor,
+        )
 
     def __str__(self):
         if self.major is None and self.minor is None:
@@ -652,6 +664,12 @@ class ID(object):
         # Split string
         parts = [p for p in strings.split(",") if p]
 
+        # Managers of drawables keep an index of their ids, other objects
+        # with ids (like fits with their peaks) get a temporary one
+        index = getattr(manager, "index", None)
+        if index is None:
+            index = IDIndex(manager.ids)
+
         ids = list()
         for s in parts:
             # first deal with ranges
@@ -666,9 +684,9 @@ class ID(object):
                     hdtv.ui.error("Invalid key word %s" % start)
                     raise ValueError
                 else:
-                    if len(special) == 0:
+                    if len(special) == 1 and special[0] is not None:
                         start = special[0]
-                    elif len(special) > 0:
+                    else:
                         hdtv.ui.error("Invalid ID %s" % start)
                         raise ValueError
                 # stop
@@ -680,13 +698,13 @@ class ID(object):
                     hdtv.ui.error("Invalid key word %s" % stop)
                     raise ValueError
                 else:
-                    if len(special) == 0:
+                    if len(special) == 1 and special[0] is not None:
                         stop = special[0]
-                    elif len(special) > 0:
+                    else:
                         hdtv.ui.error("Invalid ID %s" % stop)
                         raise ValueError
                 # fill the range
-                ids.extend([i for i in manager.ids if (i >= start and i <= stop)])
+                ids.extend(index.Range(start, stop))
             else:
                 try:
                     special = cls._parseSpecialID(s, manager)
@@ -698,30 +716,48 @@ class ID(object):
                     raise ValueError
 
         # ID might be None, if e.g. activeID is None
-        count = ids.count(None)
-        for i in range(count):
-            ids.remove(None)
+        ids = [ID for ID in ids if ID is not None]
 
         # filter non-existing ids
         valid_ids = list()
         if only_existent:
             for ID in ids:
-                for mID in manager.ids:
-                    if (mID.major == ID.major) and (mID.minor == ID.minor):
-                        valid_ids.append(ID)
-                        break  # break out of for mID in manager.ids loop
-
-                if (
-                    ID not in valid_ids
-                ):  # This only works because we appended IDs above, not mIDs, because they are different instances of the ID object
+                if ID in index:
+                    valid_ids.append(ID)
+                else:
                     hdtv.ui.warning("Non-existent id %s" % ID)
-
         else:
             valid_ids = ids
 
         return valid_ids
 
 
+class IDIndex(object):
+    """
+    Sorted index of IDs, to look up IDs and ranges of IDs in O(log n)
+    """
+
+    def __init__(self, ids=()):
+        self.ids = sorted(ids, key=ID.SortKey)
+        self._keys = [ID.SortKey() for ID in self.ids]
+        # IDs are mutable, so use their values instead of the objects
+        self._set = set(self._keys)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, ID):
+        return ID.SortKey() in self._set
+
+    def Range(self, start, stop):
+        """
+        Return the ids between start and stop (inclusive)
+        """
+        first = bisect_left(self._keys, start.SortKey())
+        last = bisect_right(self._keys, stop.SortKey())
+        return self.ids[first:last]
+
+
 def remove_comments(string):
     """
     Removes '#' comments at the end of a line
@@ -850,6 +886,30 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+def use_dummy_display():
+    """
+    Replace ROOT.HDTV.Display and the module hdtv.rootext.display by the
+    noop dummy version without loading the display library (for headless
+    sessions). If this is called before hdtv.rootext.display is imported,
+    the library is not even registered.
+    """
+    import sys
+    import ROOT
+    import hdtv.rootext
+    import hdtv.rootext.calibration
+
+    if "hdtv.rootext.display" not in sys.modules:
+        sys.modules["hdtv.rootext.display"] = hdtv.dummy
+        hdtv.rootext.display = hdtv.dummy
+    # Assigning to the namespace looks up HDTV::Display, which would
+    # autoload the display library
+    autoloading = ROOT.gInterpreter.SetClassAutoloading(False)
+    try:
+        ROOT.HDTV.Display = hdtv.dummy
+    finally:
+        ROOT.gInterpreter.SetClassAutoloading(autoloading)
+
+
 class monkey_patch_ui:
     """Replace ROOT.HDTV.Display by a noop dummy version"""
 
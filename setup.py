@@ -83,6 +83,7 @@ setup(
     package_data={
         "hdtv": ["share/*"],
         "hdtv.rootext": [
+            "CMakeLists.txt",
             "calibration/*",
             "display/*",
             "fit/*",
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import os
+
+import pytest
+
+from tests.helpers.utils import setup_io, redirect_stdout
+
+import hdtv.api
+import hdtv.cal
+import hdtv.cmdline
+import hdtv.util
+
+testspectrum = os.path.join(os.path.curdir, "tests", "share", "osiris_bg.spc")
+
+
+@pytest.fixture
+def ana():
+    ana = hdtv.api.Analysis()
+    yield ana
+    ana.spectra.Clear()
+
+
+def session_fit(spectra, sid, region, peaks):
+    spectra.ActivateObject(sid)
+    for pos in region:
+        spectra.SetMarker("region", pos)
+    for pos in peaks:
+        spectra.SetMarker("peak", pos)
+    spectra.ExecuteFit()
+    return spectra.workFit
+
+
+def test_fit(ana):
+    sid = ana.LoadSpectrum(testspectrum)
+    ana.Calibrate(sid, [1.0, 0.5])
+    f, ferr = setup_io(2)
+    with redirect_stdout(f, ferr):
+        result = ana.Fit(sid, (700.0, 760.0), [730.0], store=True)
+    assert f.getvalue() == ""
+    assert result["id"] == hdtv.util.ID(0)
+    assert len(result["peaks"]) == 1
+    assert result["integrals"]["tot"] is not None
+
+    with redirect_stdout(f, ferr):
+        fit = session_fit(ana.spectra, sid, (700.0, 760.0), [730.0])
+    peak = fit.peaks[0]
+    assert result["peaks"][0]["pos"].nominal_value == pytest.approx(
+        peak.pos_cal.nominal_value
+    )
+    assert result["peaks"][0]["vol"].nominal_value == pytest.approx(
+        peak.vol.nominal_value
+    )
+    assert result["chi"] == pytest.approx(fit.chi)
+
+
+def test_integrate(ana):
+    sid = ana.LoadSpectrum(testspectrum)
+    integrals = ana.Integrate(sid, (1400, 1500), bg=[(1350, 1380), (1520, 1550)])
+    (tot, sub) = (integrals["tot"]["uncal"]["vol"], integrals["sub"]["uncal"]["vol"])
+    assert tot.nominal_value > sub.nominal_value
+    assert ana.Integrate(sid, (1400, 1500))["bg"] is None
+
+
+def test_calibrate_from_pairs(ana):
+    sid = ana.LoadSpectrum(testspectrum)
+    result = ana.CalibrateFromPairs(sid, [(100, 51), (200, 101), (300, 151)])
+    assert result["coeffs"] == pytest.approx([1.0, 0.5])
+    assert hdtv.cal.GetCoeffs(ana.spectra.dict[sid].cal) == pytest.approx([1.0, 0.5])
+
+
+def test_invalid_spectrum(ana):
+    with pytest.raises(hdtv.cmdline.HDTVCommandError):
+        ana.Fit(3, (700.0, 760.0), [730.0])
+    ana.LoadSpectrum(testspectrum)
+    with pytest.raises(hdtv.cmdline.HDTVCommandError):
+        ana.Gate(0, (100.0, 110.0))
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from hdtv.util import monkey_patch_ui
+
+monkey_patch_ui()
+
+import hdtv.api
+import hdtv.batch
+import hdtv.drawable
+import hdtv.session
+import hdtv.ui
+
+from hdtv.histogram import FileHistogram
+from hdtv.spectrum import Spectrum
+
+import __main__
+
+try:
+    if not hasattr(__main__, "spectra"):
+        __main__.spectra = hdtv.session.Session()
+except RuntimeError:
+    pass
+
+import hdtv.plugins.specInterface
+import hdtv.plugins.fitInterface
+import hdtv.plugins.calInterface
+import hdtv.plugins.config
+
+testspectrum = os.path.join(os.path.curdir, "tests", "share", "osiris_bg.spc")
+
+BLOCK = [
+    "spectrum get {}",
+    "fit marker region set 100",
+    "fit marker region set 120",
+    "fit marker peak set 110",
+    "fit execute",
+    "fit store",
+    "fit clear",
+    "spectrum delete all",
+]
+
+
+def batch(*names):
+    lines = ["config set table classic"]
+    for name in names:
+        lines.extend(line.format(name) for line in BLOCK)
+    return lines
+
+
+def test_split_blocks():
+    (preamble, blocks, reason) = hdtv.batch.SplitBlocks(batch("a.spc", "b.spc"))
+    assert reason is None
+    assert preamble == ["config set table classic"]
+    assert len(blocks) == 2
+    assert blocks[1][0] == "spectrum get b.spc"
+
+
+def test_split_blocks_last_without_reset():
+    lines = batch("a.spc", "b.spc")[:-2]
+    assert hdtv.batch.SplitBlocks(lines)[2] is None
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("fit execute -s 0", "selects other spectra"),
+        ("spectrum activate 0", "may depend on or change other spectra"),
+        ("nosuchcommand", "is no known command"),
+        ("!ls", "is no hdtv command"),
+    ],
+)
+def test_split_blocks_dependent(line, expected):
+    lines = batch("a.spc", "b.spc")
+    lines.insert(2, line)
+    reason = hdtv.batch.SplitBlocks(lines)[2]
+    assert reason.startswith(line)
+    assert expected in reason
+
+
+def test_split_blocks_without_reset():
+    lines = batch("a.spc", "b.spc")
+    del lines[8]
+    assert "block 1 does not end with" in hdtv.batch.SplitBlocks(lines)[2]
+
+
+@pytest.mark.parametrize(
+    "shard, expected", [("1/3", (1, 3)), ("3/3", (3, 3)), ("4/3", None), ("x", None)]
+)
+def test_parse_shard(shard, expected):
+    if expected is None:
+        with pytest.raises(ValueError):
+            hdtv.batch.ParseShard(shard)
+    else:
+        assert hdtv.batch.ParseShard(shard) == expected
+
+
+@pytest.fixture
+def batchfile(tmp_path):
+    lines = ["config set table classic"]
+    for (region, peak) in (((500, 520), 511), ((700, 760), 730), ((1450, 1470), 1460)):
+        lines += [
+            "spectrum get %s" % testspectrum,
+            "fit marker region set %d" % region[0],
+            "fit marker region set %d" % region[1],
+            "fit marker peak set %d" % peak,
+            "fit execute",
+            "fit store",
+            "fit list",
+            "fit clear",
+            "spectrum delete all",
+        ]
+    fname = tmp_path / "batch.hdtv"
+    fname.write_text("\n".join(lines) + "\n")
+    return str(fname)
+
+
+def run_batchfile(fname, **kwargs):
+    out = io.StringIO()
+    ui = hdtv.ui.ui
+    hdtv.ui.SetUI(hdtv.ui.BatchUI(out, out))
+    try:
+        hdtv.batch.RunBatchfile(fname, **kwargs)
+    finally:
+        hdtv.ui.SetUI(ui)
+    return out.getvalue()
+
+
+def test_run_batchfile(batchfile):
+    out = run_batchfile(batchfile)
+    assert out.count("Storing workFit with ID 0") == 3
+    assert "510.88" in out
+    assert "1 peaks in 1 fits." in out
+    assert len(__main__.spectra) == 0
+
+
+def test_run_batchfile_jobs(batchfile):
+    serial = run_batchfile(batchfile)
+    assert run_batchfile(batchfile, nprocs=2) == serial
+
+
+def test_run_batchfile_jobs_dependent(batchfile):
+    with open(batchfile, "a") as f:
+        f.write("spectrum activate 0\n")
+    out = run_batchfile(batchfile, nprocs=2)
+    assert "serially, since spectrum activate 0" in out
+    assert out.count("Storing workFit with ID 0") == 3
+
+
+def test_run_batchfile_shard(batchfile):
+    out = run_batchfile(batchfile, shard=(2, 2))
+    assert "file> config set table classic" in out
+    assert "fit marker region set 1450" in out
+    assert "fit marker region set 500" not in out
+    assert out.count("Storing workFit with ID 0") == 1
+
+
+def test_headless_session():
+    ana = hdtv.api.Analysis()
+    spectra = ana.spectra
+    assert spectra.window is None
+    assert spectra.viewport is None
+
+    sid = ana.LoadSpectrum(testspectrum)
+    assert sid in spectra.visible
+    fid = ana.Fit(sid, (500.0, 520.0), [511.0], store=True)["id"]
+    assert fid in spectra.dict[sid].visible
+
+    spectra.HideObjects(sid)
+    assert sid not in spectra.visible
+    spectra.ShowObjects(sid)
+    assert sid in spectra.visible
+    spectra.Clear()
+
+
+def test_manager_without_viewport():
+    manager = hdtv.drawable.DrawableManager()
+    sid = manager.Insert(Spectrum(FileHistogram(testspectrum)))
+    assert sid not in manager.visible
+    manager.ShowObjects(sid)
+    assert sid not in manager.visible
+
+
+HEADLESS = """
+import ROOT
+import hdtv.util
+
+hdtv.util.use_dummy_display()
+
+import hdtv.batch
+import hdtv.cmdline
+
+spectra = hdtv.batch.InitSession()
+hdtv.cmdline.command_line.ExecLines(
+    [
+        "spectrum get %s",
+        "fit marker region set 500",
+        "fit marker region set 520",
+        "fit marker peak set 511",
+        "fit execute",
+        "fit store",
+    ]
+)
+assert len(spectra.Get("0").dict) == 1
+print(ROOT.gSystem.GetLibraries())
+"""
+
+
+def test_headless_without_display():
+    """
+    headless sessions do not load the display library
+    """
+    out = subprocess.run(
+        [sys.executable, "-c", HEADLESS % testspectrum],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    assert "libfit" in out
+    assert "libdisplay" not in out
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import importlib
+import sys
+
+import pytest
+
+from tests.helpers.utils import hdtvcmd
+
+from hdtv.util import monkey_patch_ui
+
+monkey_patch_ui()
+
+import hdtv.cmdline
+import hdtv.plugins
+import hdtv.session
+
+import __main__
+
+try:
+    if not hasattr(__main__, "spectra"):
+        __main__.spectra = hdtv.session.Session()
+except RuntimeError:
+    pass
+
+PLUGIN = """
+import hdtv.cmdline
+import hdtv.ui
+
+def LazyRun(args):
+    hdtv.ui.msg("lazy " + " ".join(args.words))
+
+parser = hdtv.cmdline.HDTVOptionParser(prog="lazytest run")
+parser.add_argument("words", nargs="*")
+hdtv.cmdline.AddCommand("lazytest run", LazyRun, level=2, parser=parser)
+"""
+
+
+@pytest.fixture
+def lazy_plugin(tmp_path):
+    (tmp_path / "hdtv_lazytest.py").write_text(PLUGIN)
+    sys.path.insert(0, str(tmp_path))
+    yield "hdtv_lazytest"
+    hdtv.cmdline.RemoveCommand("lazytest run")
+    sys.path.remove(str(tmp_path))
+    sys.modules.pop("hdtv_lazytest", None)
+
+
+def test_lazy_command(lazy_plugin):
+    hdtv.cmdline.AddLazyCommand("lazytest run", lazy_plugin, level=2)
+    assert lazy_plugin not in sys.modules
+    f, ferr = hdtvcmd("lazytest run a b")
+    assert ferr == ""
+    assert f == "lazy a b"
+    assert lazy_plugin in sys.modules
+    (node, _) = hdtv.cmdline.command_tree.FindNode(["lazytest", "run"])
+    assert node.module is None
+    assert node.level == 2
+
+
+def test_lazy_commands_declared():
+    """
+    The declared lazy commands match the commands of the plugins
+    """
+    for module in hdtv.plugins.LAZY:
+        importlib.import_module(module)
+    tree = hdtv.cmdline.command_tree
+    declared = dict()
+    for (module, commands) in hdtv.plugins.LAZY.items():
+        for (title, level, fileargs) in commands:
+            declared[title] = module
+            (node, args) = tree.FindNode(title.split(), use_levels=False)
+            assert not args
+            assert node.module is None
+            assert node.command.__module__ == module
+            assert node.level == (tree.default_level if level is None else level)
+            assert node.options.get("fileargs", False) == fileargs
+
+    nodes = list(tree.childs)
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.childs)
+        module = getattr(node.command, "__module__", None)
+        if module in hdtv.plugins.LAZY:
+            assert declared.get(node.FullTitle()) == module
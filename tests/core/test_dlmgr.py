@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+
+import pytest
+
+import hdtv.rootext.dlmgr as dlmgr
+import hdtv.rootext.calibration
+
+
+@pytest.fixture
+def broken(tmp_path, monkeypatch):
+    """
+    A user library directory with a broken library and its rootmap
+    """
+    libdir = tmp_path / "lib"
+    libdir.mkdir()
+    (libdir / "libbroken.so").write_bytes(b"no shared object")
+    (libdir / "libbroken.rootmap").write_text(
+        "{ decls }\nnamespace HDTV { namespace Broken {  } }\n\n"
+        "[ libbroken.so ]\n# List of selected namespaces\nnamespace HDTV::Broken\n"
+    )
+    monkeypatch.setattr(dlmgr, "usrdir", str(tmp_path))
+    built = []
+
+    def BuildLibrary(name, dir):
+        built.append((name, dir))
+        return dlmgr.FindLibrary("calibration", dlmgr.libfmt % "calibration")
+
+    monkeypatch.setattr(dlmgr, "BuildLibrary", BuildLibrary)
+    yield built
+
+
+@pytest.mark.parametrize("deferred", [False, True])
+def test_load_broken_library(broken, tmp_path, deferred):
+    dlmgr.LoadLibrary("broken", deferred=deferred)
+    assert broken == [("broken", str(tmp_path))]
+
+
+def test_load_library_deferred(broken):
+    dlmgr.LoadLibrary("calibration", deferred=True)
+    assert broken == []
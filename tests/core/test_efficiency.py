@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import math
+
+import numpy as np
+import pytest
+from numpy.polynomial import polynomial
+from uncertainties import covariance_matrix, ufloat
+
+from hdtv.util import monkey_patch_ui, Pairs
+from tests.helpers.utils import redirect_stdout, setup_io
+
+monkey_patch_ui()
+
+import ROOT
+import hdtv.efficiency
+
+energies = np.linspace(50.0, 3000.0, 7)
+
+models = {
+    "poly": (lambda: hdtv.efficiency.PolyEff(degree=4), [1.0, -5.0, 1.2, -0.3, 0.02]),
+    "exp": (hdtv.efficiency.ExpEff, [1.0, 0.5, 0.001, 0.2, 0.0001]),
+    "pow": (hdtv.efficiency.PowEff, [1.0, 0.01, 3.0, 0.7]),
+    "wiedenhoever": (
+        hdtv.efficiency.WiedenhoeverEff,
+        [1.0, 0.8, 20.0, 50.0, 0.01],
+    ),
+}
+
+
+@pytest.fixture(params=list(models))
+def eff(request):
+    (cls, pars) = models[request.param]
+    eff = cls()
+    for (i, par) in enumerate(pars):
+        eff.TF1.SetParameter(i, par)
+    A = np.random.default_rng(42).normal(size=(eff._numPars, eff._numPars))
+    eff.fCov = (1e-6 * A @ A.T).tolist()
+    yield eff
+
+
+def test_value(eff):
+    values = eff.value(energies)
+    assert isinstance(values, np.ndarray)
+    for (E, value) in zip(energies, values):
+        assert eff.value(E) == pytest.approx(value)
+        assert eff.value(ufloat(E, 1.0)) == pytest.approx(value)
+        if not isinstance(eff, hdtv.efficiency.PolyEff):
+            assert eff.TF1.Eval(E) == pytest.approx(value)
+
+
+def test_error(eff):
+    errors = eff.error(energies)
+    E = (
+        math.log(energies[3])
+        if isinstance(eff, hdtv.efficiency.PolyEff)
+        else energies[3]
+    )
+    # Explicit J x cov x J^T
+    J = [eff._dEff_dP[i](E, eff.parameter) for i in range(eff._numPars)]
+    variance = sum(
+        J[i] * eff.fCov[i][j] * J[j]
+        for i in range(eff._numPars)
+        for j in range(eff._numPars)
+    )
+    if isinstance(eff, hdtv.efficiency.PolyEff):
+        assert eff.error(energies[3]) == pytest.approx(
+            eff._Error(energies[3], math.sqrt(variance))
+        )
+    else:
+        assert eff.error(energies[3]) == pytest.approx(math.sqrt(variance))
+    assert errors[3] == pytest.approx(eff.error(energies[3]))
+
+
+def test_call(eff):
+    values = eff(energies)
+    assert len(values) == len(energies)
+    assert [v.nominal_value for v in values] == pytest.approx(eff.value(energies))
+    assert [v.std_dev for v in values] == pytest.approx(eff.error(energies))
+    assert np.allclose(
+        covariance_matrix(values), eff.covariance(energies), rtol=1e-6, atol=1e-14
+    )
+    value = eff(energies[0])
+    assert value.nominal_value == pytest.approx(values[0].nominal_value)
+    assert value.std_dev == pytest.approx(values[0].std_dev)
+
+
+def test_call_without_covariance():
+    eff = hdtv.efficiency.ExpEff()
+    eff.parameter = models["exp"][1]
+    parerrors = [0.0, 0.01, 1e-4, 0.02, 1e-6]
+    for (i, error) in enumerate(parerrors):
+        eff.TF1.SetParError(i, error)
+    values = eff(energies)
+    assert [v.nominal_value for v in values] == pytest.approx(eff.value(energies))
+    # Uncorrelated propagation of the parameter errors
+    J = [eff._dEff_dP[i](energies[2], eff.parameter) for i in range(eff._numPars)]
+    error = math.sqrt(sum((j * e) ** 2 for (j, e) in zip(J, parerrors)))
+    assert values[2].std_dev == pytest.approx(error)
+    assert eff(energies[2]).std_dev == pytest.approx(error)
+
+
+def test_poly_error_norm():
+    eff = hdtv.efficiency.PolyEff(degree=2)
+    eff.TF1.SetParameter(0, 1.0)
+    for (i, par) in enumerate([-5.0, 1.2, -0.1]):
+        eff.TF1.SetParameter(i + 1, par)
+    eff.norm = 2.0
+    variances = [1e-4, 1e-5, 1e-6]
+    eff.fCov = np.diag(variances).tolist()
+    x = math.log(1000.0)
+    ln_eff = -5.0 + 1.2 * x - 0.1 * x**2
+    ln_err = math.sqrt(sum((2.0 * x**i) ** 2 * v for (i, v) in enumerate(variances)))
+    expected = 2.0 * (math.exp(ln_eff + ln_err) - math.exp(ln_eff - ln_err)) / 2.0
+    assert eff.value(1000.0) == pytest.approx(2.0 * math.exp(ln_eff))
+    assert eff.error(1000.0) == pytest.approx(expected)
+    assert eff(1000.0).std_dev == pytest.approx(expected)
+
+
+@pytest.fixture
+def fitpairs():
+    rng = np.random.default_rng(3)
+    E = np.linspace(80.0, 2500.0, 25)
+    eff = np.exp(polynomial.polyval(np.log(E), [-6.0, 1.5, -0.2, 0.005]))
+    eff *= 1 + 0.03 * rng.normal(size=len(E))
+    pairs = Pairs()
+    for (e, value) in zip(E, eff):
+        pairs.add(e, ufloat(value, 0.03 * value))
+    yield pairs
+
+
+def test_poly_linear_fit(fitpairs):
+    eff = hdtv.efficiency.PolyEff(degree=3)
+    eff.fit(fitpairs)
+
+    # Reference: fit of log(eff) vs. log(E) by ROOT
+    E = np.array([p[0] for p in fitpairs])
+    values = np.array([p[1].nominal_value for p in fitpairs])
+    errors = np.array([p[1].std_dev for p in fitpairs])
+    graph = ROOT.TGraphErrors(
+        len(E), np.log(E), np.log(values), np.zeros(len(E)), errors / values
+    )
+    func = ROOT.TF1("ref", "pol3", 0, 10)
+    result = graph.Fit(func, "0QNS")
+    assert [eff.TF1.GetParameter(i + 1) for i in range(4)] == pytest.approx(
+        [func.GetParameter(i) for i in range(4)]
+    )
+    assert np.allclose(
+        eff.fCov,
+        [[result.CovMatrix(i, j) for j in range(4)] for i in range(4)],
+        rtol=1e-4,
+    )
+    assert eff.TF1.GetChisquare() == pytest.approx(func.GetChisquare())
+    assert eff.value(1000.0) == pytest.approx(
+        math.exp(func.Eval(math.log(1000.0))), rel=1e-6
+    )
+
+
+@pytest.mark.parametrize(
+    "cls, message",
+    [
+        (hdtv.efficiency.PolyEff, "Linear least squares fit"),
+        (hdtv.efficiency.ExpEff, "Fit parameter with errors included"),
+    ],
+)
+def test_fit_message(fitpairs, cls, message):
+    f, ferr = setup_io(2)
+    with redirect_stdout(f, ferr):
+        cls().fit(fitpairs)
+    assert message in f.getvalue()
+
+
+def test_poly_linear_fit_xerrors(fitpairs):
+    eff = hdtv.efficiency.PolyEff(degree=3)
+    eff.fit(fitpairs)
+    chi2 = eff.TF1.GetChisquare()
+    pairs = Pairs()
+    for p in fitpairs:
+        pairs.add(ufloat(p[0], 2.0), p[1])
+    eff.fit(pairs)
+    assert eff.TF1.GetChisquare() < chi2
+    assert eff.error(1000.0) > 0
+
+
+def test_minuit_fit_covariance():
+    eff = hdtv.efficiency.ExpEff(norm=False)
+    eff.parameter = models["exp"][1]
+    E = np.linspace(80.0, 2500.0, 25)
+    pairs = Pairs()
+    for (e, value) in zip(E, eff.value(E)):
+        pairs.add(e, ufloat(value, 0.02 * value))
+    eff.fit(pairs)
+    cov = np.array(eff.fCov)
+    # Normalization is fixed
+    assert (cov[0] == 0).all() and (cov[:, 0] == 0).all()
+    assert (np.diag(cov)[1:] > 0).all()
+    assert np.allclose(cov, cov.T)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import numpy as np
+import pytest
+
+from hdtv.peaksearch import SearchPeaks, WidthModel
+
+
+def spectrum(positions, sigmas, heights, nbins=4096, bg=20.0, seed=42):
+    x = np.arange(nbins, dtype=float)
+    expected = np.full(nbins, bg) + 0.002 * x
+    for pos, sigma, height in zip(positions, sigmas, heights):
+        expected += height * np.exp(-0.5 * ((x - pos) / sigma) ** 2)
+    return np.random.default_rng(seed).poisson(expected).astype(float)
+
+
+def test_WidthModel():
+    width = WidthModel([4.0, 0.01, 1e-6])
+    assert width(0.0) == pytest.approx(2.0)
+    assert width([0.0, 1000.0]) == pytest.approx([2.0, np.sqrt(15.0)])
+    assert WidthModel.Constant(2.5)(1000.0) == pytest.approx(2.5)
+    with pytest.raises(ValueError):
+        WidthModel([])
+
+
+def test_WidthModel_FromPeaks():
+    width = WidthModel([4.0, 0.01, 1e-6])
+    energies = np.array([100.0, 500.0, 1000.0, 2000.0, 3000.0])
+    fwhms = width(energies) * 2.0 * np.sqrt(2.0 * np.log(2.0))
+    fitted = WidthModel.FromPeaks(energies, fwhms)
+    assert fitted.coeffs == pytest.approx(width.coeffs, rel=1e-6)
+
+
+@pytest.mark.parametrize("nthreads", [1, None])
+def test_SearchPeaks_variable_width(nthreads):
+    positions = [300.0, 1200.5, 2500.0, 3800.2]
+    width = WidthModel([4.0, 0.004])
+    sigmas = width(positions)
+    counts = spectrum(positions, sigmas, [500.0, 300.0, 200.0, 100.0])
+    found = SearchPeaks(
+        counts, width(np.arange(len(counts))), significance=5.0, nthreads=nthreads
+    )
+    assert len(found) == len(positions)
+    for peak, pos in zip(found, positions):
+        assert peak.pos == pytest.approx(pos, abs=0.5)
+        assert peak.significance > 5.0
+
+
+def test_SearchPeaks_threshold_and_range():
+    positions = [500.0, 1500.0, 2500.0]
+    counts = spectrum(positions, [3.0] * 3, [1000.0, 100.0, 1000.0])
+    found = SearchPeaks(counts, 3.0, threshold=0.5)
+    assert [round(p.pos) for p in found] == [500, 2500]
+    found = SearchPeaks(counts, 3.0, significance=5.0, start=1000, stop=2000)
+    assert [round(p.pos) for p in found] == [1500]
+
+
+def test_SearchPeaks_flat():
+    counts = spectrum([], [], [])
+    assert SearchPeaks(counts, 3.0, significance=5.0) == []
+
+
+def test_SearchPeaks_background():
+    positions = [1000.0, 1030.0]
+    counts = spectrum(positions, [3.0] * 2, [200.0, 200.0], bg=0.0)
+    x = np.arange(len(counts), dtype=float)
+    # Step in the continuum
+    background = np.where(x > 2000, 500.0, 50.0)
+    counts += np.random.default_rng(1).poisson(background)
+    found = SearchPeaks(counts, 3.0, significance=5.0, background=background)
+    assert [round(p.pos) for p in found] == [1000, 1030]
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import os
+import shutil
+
+import pytest
+
+from hdtv.util import monkey_patch_ui
+
+monkey_patch_ui()
+
+import hdtv.options
+
+from hdtv.histogram import GetBinContents
+from hdtv.specreader import SpecReader
+from hdtv.speccache import SpectrumCache
+
+testspectrum = os.path.join(os.path.curdir, "tests", "share", "osiris_bg.spc")
+
+
+@pytest.fixture(autouse=True)
+def enable_cache():
+    hdtv.options.Set("spec.cache.enable", "True")
+    yield
+    hdtv.options.Reset("spec.cache.enable")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    yield SpectrumCache(path=str(tmp_path / "cache"))
+
+
+def assert_same_hist(a, b):
+    assert a.GetNbinsX() == b.GetNbinsX()
+    assert a.GetXaxis().GetXmin() == b.GetXaxis().GetXmin()
+    assert a.GetXaxis().GetXmax() == b.GetXaxis().GetXmax()
+    assert (GetBinContents(a) == GetBinContents(b)).all()
+    for i in (1, a.GetNbinsX() // 2, a.GetNbinsX()):
+        assert a.GetBinError(i) == b.GetBinError(i)
+        assert a.GetBinCenter(i) == b.GetBinCenter(i)
+
+
+def test_roundtrip(cache):
+    hist = SpecReader.GetSpectrum(testspectrum)
+    assert cache.Get(testspectrum) is None
+    cache.Put(testspectrum, None, hist)
+    cached = cache.Get(testspectrum)
+    assert cached.GetName() == "osiris_bg.spc"
+    assert cache.GetNbins(testspectrum) == hist.GetNbinsX()
+    assert_same_hist(hist, cached)
+    # Different format spec, different entry
+    assert cache.Get(testspectrum, "col") is None
+
+
+def test_roundtrip_text(cache, tmp_path):
+    fname = str(tmp_path / "spec.txt")
+    with open(fname, "w") as f:
+        for x in range(10):
+            f.write("%f %d %f\n" % (x**1.5, 10 * x, 0.5 * x + 1))
+    hist = SpecReader.GetSpectrum(fname, "col:xye")
+    cache.Put(fname, "col:xye", hist)
+    assert_same_hist(hist, cache.Get(fname, "col:xye"))
+
+
+def test_invalidate(cache, tmp_path):
+    fname = str(tmp_path / "osiris_bg.spc")
+    shutil.copy(testspectrum, fname)
+    cache.Put(fname, None, SpecReader.GetSpectrum(fname))
+    assert cache.Get(fname) is not None
+    stat = os.stat(fname)
+    os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert cache.Get(fname) is None
+
+
+def test_evict(tmp_path):
+    hist = SpecReader.GetSpectrum(testspectrum)
+    entrysize = 8 * (hist.GetNbinsX() + 2) + 48
+    cache = SpectrumCache(path=str(tmp_path / "cache"), maxsize=int(2.5 * entrysize))
+    files = []
+    for i in range(4):
+        fname = str(tmp_path / ("spec%d.spc" % i))
+        shutil.copy(testspectrum, fname)
+        files.append(fname)
+    for fname in files[:2]:
+        cache.Put(fname, None, hist)
+    # Use first file, so that the second one is the least recently used
+    stat = os.stat(cache.Filename(files[1]))
+    os.utime(cache.Filename(files[1]), (stat.st_atime - 10, stat.st_mtime - 10))
+    assert cache.Get(files[0]) is not None
+    cache.Put(files[2], None, hist)
+    assert cache.Get(files[0]) is not None
+    assert cache.Get(files[1]) is None
+    assert cache.Get(files[2]) is not None
+    assert len(os.listdir(cache.path)) == 2
+    cache.Clear()
+    assert os.listdir(cache.path) == []
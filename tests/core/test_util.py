@@ -19,6 +19,8 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+import types
+
 import pytest
 
 import hdtv.util
@@ -47,3 +49,38 @@ def test_SplitCmdlines(cmdline, segs, last_suffix):
     res_segs, res_last_suffix = hdtv.util.SplitCmdlines(cmdline)
     assert segs == res_segs
     assert last_suffix == res_last_suffix
+
+
+@pytest.fixture
+def manager():
+    import hdtv.drawable
+
+    manager = hdtv.drawable.DrawableManager()
+    for major in [0, 1, 2, 5, 7]:
+        manager.Insert(types.SimpleNamespace(), hdtv.util.ID(major))
+    manager.Insert(types.SimpleNamespace(), hdtv.util.ID(1, 1000))
+    return manager
+
+
+@pytest.mark.parametrize(
+    "ids, expected",
+    [
+        ("1-5", ["1", "1.1000", "2", "5"]),
+        ("0,7", ["0", "7"]),
+        ("3", []),
+        ("2-last", ["2", "5", "7"]),
+        ("first-1", ["0", "1"]),
+        ("all", ["0", "1", "1.1000", "2", "5", "7"]),
+    ],
+)
+def test_ParseIds(manager, ids, expected):
+    assert [str(ID) for ID in hdtv.util.ID.ParseIds(ids, manager)] == expected
+
+
+def test_ParseIds_after_change(manager):
+    manager.Pop(hdtv.util.ID(2))
+    manager.Insert(types.SimpleNamespace(), hdtv.util.ID(3))
+    assert manager.GetFreeID() == hdtv.util.ID(2)
+    ids = hdtv.util.ID.ParseIds("2-6", manager)
+    assert [str(ID) for ID in ids] == ["3", "5"]
+    assert hdtv.util.ID.ParseIds("2", manager, only_existent=False) == [hdtv.util.ID(2)]
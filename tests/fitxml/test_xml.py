@@ -27,12 +27,16 @@ the calibration back and forth (see test_cal.py for that).
 
 from __future__ import print_function
 
+import io
+import shutil
 import os
+import xml.etree.ElementTree as ET
 
 import pytest
+from uncertainties import ufloat
 
 from tests.helpers.utils import setup_io, redirect_stdout
-from tests.helpers.fixtures import temp_file_compressed
+from tests.helpers.fixtures import temp_file, temp_file_compressed
 
 from hdtv.util import monkey_patch_ui
 
@@ -40,6 +44,7 @@ monkey_patch_ui()
 
 import __main__
 
+import hdtv.fitstore
 import hdtv.session
 
 try:
@@ -172,3 +177,151 @@ def test_fitxml_eepeak(temp_file_compressed):
     spectra.SetMarker("region", 1125)
     spectra.SetMarker("peak", 1120)
     fit_write_and_save(temp_file_compressed)
+
+
+def test_fitxml_writer_matches_tree(temp_file):
+    """
+    the incremental writer produces the same file as the complete tree
+    """
+    for (start, peak) in ((500, 511), (1450, 1460)):
+        spectra.SetMarker("region", start)
+        spectra.SetMarker("region", start + 20)
+        spectra.SetMarker("peak", peak)
+        spectra.ExecuteFit()
+        spectra.StoreFit()
+        spectra.ClearFit()
+    fitxml.WriteXML(spectra.Get("0").ID, temp_file)
+    with open(temp_file, "rb") as f:
+        streamed = f.read()
+
+    tree = io.BytesIO()
+    ET.ElementTree(fitxml.xml.CreateXml(spectra.Get("0").dict)).write(tree)
+    assert streamed == tree.getvalue()
+
+
+def test_fitxml_writer_empty(temp_file):
+    """
+    an empty fit list is written as an empty <hdtv> element and read back
+    """
+    fitxml.WriteXML(spectra.Get("0").ID, temp_file)
+    with open(temp_file, "rb") as f:
+        streamed = f.read()
+
+    tree = io.BytesIO()
+    ET.ElementTree(fitxml.xml.CreateXml(spectra.Get("0").dict)).write(tree)
+    assert streamed == tree.getvalue() == b'<hdtv version="1.5" />'
+
+    fitxml.ReadXML(spectra.Get("0").ID, temp_file)
+    assert len(spectra.Get("0").dict) == 0
+
+
+def store_fits():
+    fit_interface.SetFitterParameter("pos", "hold,free")
+    for (region, peaks, bg) in (
+        ((1750, 1780), (1765, 1770), (1700, 1710, 1800, 1810)),
+        ((500, 520), (511,), ()),
+    ):
+        for pos in region:
+            spectra.SetMarker("region", pos)
+        for pos in peaks:
+            spectra.SetMarker("peak", pos)
+        for pos in bg:
+            spectra.SetMarker("bg", pos)
+        spectra.ExecuteFit()
+        spectra.StoreFit()
+        spectra.ClearFit()
+        fit_interface.ResetFitterParameters()
+
+
+@pytest.mark.parametrize("fmt", ["npz", "parquet"])
+def test_fitstore_write_read(temp_file, fmt):
+    """
+    fits written to a fit store are restored as from xml
+    """
+    if fmt == "parquet" and hdtv.fitstore.pyarrow is None:
+        pytest.skip("pyarrow is not available")
+    store_fits()
+    fit = spectra.Get("0").dict[spectra.Get("0").ids[0]]
+    fit.peaks[0].extras["pos_lit"] = ufloat(1765.0, 0.5)
+    out_original = list_fit()
+
+    fitxml.Write(spectra.Get("0").ID, temp_file, fmt)
+    spectra.Get("0").Clear()
+    fitxml.Read(spectra.Get("0").ID, temp_file, fmt=fmt)
+    assert out_original == list_fit()
+    fit = spectra.Get("0").dict[spectra.Get("0").ids[0]]
+    pos_lit = fit.peaks[0].extras["pos_lit"]
+    assert (pos_lit.nominal_value, pos_lit.std_dev) == (1765.0, 0.5)
+
+
+def test_fitstore_query(temp_file):
+    store_fits()
+    fitxml.Write(spectra.Get("0").ID, temp_file, "npz")
+    peaks = fitxml.QueryPeaks(temp_file, ["pos", "vol", "tl"], fmt="npz")
+    assert len(peaks) == 3
+    assert [p["fit"] for p in peaks] == [0, 0, 1]
+    assert peaks[0]["spectrum"] == spectra.Get("0").name
+    assert peaks[0]["pos"].nominal_value == pytest.approx(1765, abs=2)
+    assert peaks[0]["tl"] is None
+
+    peaks = fitxml.QueryPeaks(temp_file, ["pos"], (1000.0, 2000.0), fmt="npz")
+    assert len(peaks) == 2
+    assert all(1000.0 <= p["pos"].nominal_value <= 2000.0 for p in peaks)
+
+
+def test_fitxml_restore_lazy(temp_file):
+    """
+    display functions and missing integrals are created on first use
+    """
+    store_fits()
+    spec = spectra.Get("0")
+    fitxml.WriteXML(spec.ID, temp_file)
+    original = spec.dict[spec.ids[0]]
+    with open(temp_file, "rb") as f:
+        fitElement = ET.parse(f).getroot().find("fit")
+
+    (fit, success) = fitxml.xml.Xml2Fit_v1(fitElement, calibration=spec.cal)
+    assert success
+    fit.integral = None
+    fit.Restore(spec)
+    assert fit._dispPeakFunc is None and fit._dispBgFunc is None
+    assert all(peak.displayObj is None for peak in fit.peaks)
+    assert fit._pendingIntegral is not None
+
+    for integral_type in ["tot", "bg", "sub"]:
+        for (name, value) in original.integral[integral_type]["uncal"].items():
+            restored = fit.integral[integral_type]["uncal"][name]
+            assert restored.nominal_value == pytest.approx(value.nominal_value)
+    assert fit.dispPeakFunc is not None and fit.dispBgFunc is not None
+    assert all(peak.displayObj is not None for peak in fit.peaks)
+
+
+@pytest.mark.parametrize("nprocs", [1, 2])
+def test_fitxml_read_list_refit(tmp_path, nprocs):
+    """
+    fit lists of several spectra are refitted in worker processes
+    """
+    originals = dict()
+    for (name, cal) in (("a.spc", None), ("b.spc", [1.0, 0.5])):
+        shutil.copy(testspectrum, tmp_path / name)
+        spec_interface.LoadSpectra(str(tmp_path / name))
+        sid = spectra.GetIDByName(name)
+        spectra.ActivateObject(sid)
+        if cal is not None:
+            spectra.ApplyCalibration([sid], cal)
+        spectra.SetMarker("region", spectra.dict[sid].cal.Ch2E(500))
+        spectra.SetMarker("region", spectra.dict[sid].cal.Ch2E(520))
+        spectra.SetMarker("peak", spectra.dict[sid].cal.Ch2E(511))
+        spectra.ExecuteFit()
+        spectra.StoreFit()
+        spectra.ClearFit()
+        originals[sid] = list_fit()
+        fitxml.WriteXML(sid, str(tmp_path / (name + ".xfl")))
+    fitxml.WriteList(str(tmp_path / "fitlists"))
+
+    for sid in originals:
+        spectra.dict[sid].Clear()
+    fitxml.ReadList(str(tmp_path / "fitlists"), refit=True, nprocs=nprocs)
+    for (sid, original) in originals.items():
+        spectra.ActivateObject(sid)
+        assert list_fit() == original
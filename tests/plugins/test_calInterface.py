@@ -24,7 +24,9 @@ import os
 import sys
 import filecmp
 
+import numpy as np
 import pytest
+from uncertainties import ufloat
 
 from tests.helpers.utils import redirect_stdout, hdtvcmd
 from tests.helpers.fixtures import temp_file
@@ -50,6 +52,7 @@ import hdtv.plugins.calInterface
 from hdtv.plugins.fitInterface import fit_interface
 import hdtv.plugins.peakfinder
 import hdtv.plugins.fitmap
+from hdtv.plugins import EnergyCalibration
 
 spectra = __main__.spectra
 
@@ -280,3 +283,215 @@ def test_cmd_cal_eff_fit():
 @pytest.mark.skip(reason="Hard to test")
 def test_cmd_cal_eff_plot():
     raise NotImplementedError
+
+
+def synthetic_peaks(offset, gain, nlines=150, npeaks=40, nspurious=8):
+    rng = np.random.default_rng(42)
+    lines = np.sort(rng.uniform(50, 3000, nlines))
+    true = rng.choice(nlines, npeaks, replace=False)
+    channels = np.concatenate(
+        [(lines[true] - offset) / gain, rng.uniform(100, 4000, nspurious)]
+    )
+    peaks = [ufloat(c, 0.1) for c in channels]
+    energies = [ufloat(e, 0.01) for e in lines]
+    return peaks, energies, {(i, j) for (i, j) in enumerate(true)}
+
+
+@pytest.mark.parametrize("method", ["gradient", "ransac"])
+def test_match_peaks_and_energies(method):
+    peaks, energies, truth = synthetic_peaks(0.0, 0.731)
+    matches = EnergyCalibration.MatchPeaksAndEnergies(peaks, energies, 0.0002, method)
+    found = {(peaks.index(p), energies.index(e)) for (p, e) in matches}
+    assert found == truth
+
+
+def test_match_peaks_and_energies_offset():
+    peaks, energies, truth = synthetic_peaks(25.0, 0.731)
+    matches = EnergyCalibration.MatchPeaksAndEnergies(peaks, energies, 0.0002, "ransac")
+    found = {(peaks.index(p), energies.index(e)) for (p, e) in matches}
+    assert found == truth
+
+
+def test_match_peaks_and_energies_outliers():
+    # Few of the peaks belong to the nuclide, so that a fixed small number
+    # of random peak pairs would likely miss all pairs of true peaks
+    peaks, energies, truth = synthetic_peaks(
+        25.0, 0.731, nlines=60, npeaks=8, nspurious=24
+    )
+    perm = np.random.default_rng(0).permutation(len(peaks))
+    peaks = [peaks[i] for i in perm]
+    matches = EnergyCalibration.MatchPeaksAndEnergies(
+        peaks, energies, 0.00003, "ransac"
+    )
+    found = {(int(perm[peaks.index(p)]), energies.index(e)) for (p, e) in matches}
+    assert truth <= found
+
+
+def test_ransac_iterations():
+    assert EnergyCalibration._RansacIterations(1.0) == 1
+    assert EnergyCalibration._RansacIterations(0.5, 0.99) == 17
+    assert EnergyCalibration._RansacIterations(0.0) == np.inf
+
+
+def write_eu152_spectrum(fname, offset, gain, rng):
+    """
+    Write a spectrum of Eu-152 with calibration E = offset + gain * ch
+    """
+    transitions = EnergyCalibration.SearchNuclide("Eu-152", "IAEA")["transitions"]
+    channels = np.arange(8192.0)
+    counts = np.full(len(channels), 20.0)
+    for t in transitions:
+        pos = (t["energy"].nominal_value - offset) / gain
+        area = 2e5 * t["intensity"].nominal_value
+        counts += (
+            area
+            / (2.0 * np.sqrt(2 * np.pi))
+            * np.exp(-0.5 * ((channels - pos) / 2.0) ** 2)
+        )
+    np.savetxt(fname, rng.poisson(counts), fmt="%d")
+
+
+@pytest.fixture
+def eu152_spectra(tmp_path):
+    """
+    Spectra of Eu-152 with different calibrations
+    """
+    rng = np.random.default_rng(1)
+    cals = [(0.0, 0.35), (3.0, 0.4), (-2.0, 0.33)]
+    spectra.Clear()
+    for (i, (offset, gain)) in enumerate(cals):
+        fname = str(tmp_path / ("eu152_%d.txt" % i))
+        write_eu152_spectrum(fname, offset, gain, rng)
+        spec_interface.LoadSpectra(fname + "'col")
+    yield cals
+
+
+def test_cmd_cal_pos_batch(eu152_spectra, temp_file):
+    f, ferr = hdtvcmd(
+        "calibration position batch -s all -t -o {} -F Eu-152".format(temp_file)
+    )
+    assert ferr == ""
+    for i in range(len(eu152_spectra)):
+        assert "Calibrated spectrum with id %d" % i in f
+    with open(temp_file) as calfile:
+        lines = calfile.read().splitlines()
+    assert len(lines) == len(eu152_spectra)
+    for (i, (offset, gain)) in enumerate(eu152_spectra):
+        spec = spectra.dict[hdtv.util.ID(i)]
+        coeffs = [float(c) for c in lines[i].split(":")[1].split()]
+        assert lines[i].startswith(spec.name + ":")
+        assert coeffs == pytest.approx([offset, gain], abs=0.02)
+        assert spec.cal.Ch2E(1000.0) == pytest.approx(offset + 1000.0 * gain, abs=0.2)
+
+
+def test_cmd_cal_pos_batch_same_name(tmp_path, temp_file):
+    """
+    Spectra with the same name (in different directories) are calibrated
+    separately, but not written to a calibration list
+    """
+    rng = np.random.default_rng(1)
+    cals = [(0.0, 0.35), (3.0, 0.4)]
+    spectra.Clear()
+    for (i, (offset, gain)) in enumerate(cals):
+        (tmp_path / ("run%d" % i)).mkdir()
+        fname = str(tmp_path / ("run%d" % i) / "eu152.txt")
+        write_eu152_spectrum(fname, offset, gain, rng)
+        spec_interface.LoadSpectra(fname + "'col")
+    f, ferr = hdtvcmd(
+        "calibration position batch -s all -o {} -F Eu-152".format(temp_file)
+    )
+    assert "spectra have the same name: eu152.txt (0, 1)" in ferr
+    assert not os.path.exists(temp_file)
+    for (i, (offset, gain)) in enumerate(cals):
+        spec = spectra.dict[hdtv.util.ID(i)]
+        assert spec.name == "eu152.txt"
+        assert spec.cal.Ch2E(1000.0) == pytest.approx(offset + 1000.0 * gain, abs=0.2)
+
+
+def test_calibrate_spectrum():
+    from hdtv.peaksearch import WidthModel
+
+    energies = [ufloat(e, 0.01) for e in (121.78, 344.28, 778.90, 964.08, 1408.01)]
+    channels = np.arange(4096) + 0.5
+    counts = np.full(len(channels), 10.0)
+    for e in energies:
+        pos = (e.nominal_value - 5.0) / 0.5
+        counts += 1000.0 * np.exp(-0.5 * ((channels - pos) / 1.5) ** 2)
+    result = EnergyCalibration.CalibrateSpectrum(
+        counts, 0.0, 1.0, energies, WidthModel.Constant(1.5), method="ransac"
+    )
+    assert len(result["channels"]) == len(energies)
+    assert result["coeffs"] == pytest.approx([5.0, 0.5], abs=0.01)
+    assert np.abs(result["residuals"]).max() < 0.05
+    assert result["ndf"] == len(energies) - 2
+
+
+@pytest.fixture
+def drifting_spectra(tmp_path):
+    """
+    Time slices of an Eu-152 measurement with drifting gain
+    """
+    rng = np.random.default_rng(2)
+    cals = [(1.0, 0.35 * (1.0 + 0.004 * i - 0.0015 * i**2)) for i in range(6)]
+    spectra.Clear()
+    for (i, (offset, gain)) in enumerate(cals):
+        fname = str(tmp_path / ("slice_%02d.txt" % i))
+        write_eu152_spectrum(fname, offset, gain, rng)
+        spec_interface.LoadSpectra(fname + "'col")
+    hdtvcmd("calibration position set -s 0 %f %f" % cals[0])
+    yield cals
+
+
+@pytest.mark.parametrize("follow", ["", "--follow"])
+def test_cmd_cal_pos_drift(drifting_spectra, follow, temp_file):
+    f, ferr = hdtvcmd(
+        "calibration position drift -r 0 {} -o {} -F".format(follow, temp_file)
+    )
+    assert ferr == ""
+    for (i, (offset, gain)) in enumerate(drifting_spectra):
+        assert "Calibrated spectrum with id %d" % i in f
+        cal = spectra.dict[hdtv.util.ID(i)].cal
+        for ch in (500.0, 4000.0):
+            assert cal.Ch2E(ch) == pytest.approx(offset + gain * ch, abs=0.1)
+    with open(temp_file) as calfile:
+        assert len(calfile.read().splitlines()) == len(drifting_spectra)
+
+
+def test_cmd_cal_pos_drift_same_name(tmp_path, temp_file):
+    """
+    Time slices kept per run with the same file name get their own
+    calibration, but are not written to a calibration list
+    """
+    rng = np.random.default_rng(2)
+    cals = [(1.0, 0.35), (1.0, 0.352), (1.0, 0.349)]
+    spectra.Clear()
+    for (i, (offset, gain)) in enumerate(cals):
+        (tmp_path / ("run%03d" % i)).mkdir()
+        fname = str(tmp_path / ("run%03d" % i) / "ge1.txt")
+        write_eu152_spectrum(fname, offset, gain, rng)
+        spec_interface.LoadSpectra(fname + "'col")
+    hdtvcmd("calibration position set -s 0 %f %f" % cals[0])
+    f, ferr = hdtvcmd("calibration position drift -r 0 -o {} -F".format(temp_file))
+    assert "spectra have the same name: ge1.txt (0, 1, 2)" in ferr
+    assert not os.path.exists(temp_file)
+    for (i, (offset, gain)) in enumerate(cals):
+        cal = spectra.dict[hdtv.util.ID(i)].cal
+        assert spectra.dict[hdtv.util.ID(i)].name == "ge1.txt"
+        for ch in (500.0, 4000.0):
+            assert cal.Ch2E(ch) == pytest.approx(offset + gain * ch, abs=0.1)
+
+
+def test_gain_ratio():
+    rng = np.random.default_rng(3)
+    bins = np.arange(8192.0)
+    reference = np.zeros(len(bins))
+    for pos in (300.0, 1200.0, 2500.0, 5000.0):
+        reference += 1000.0 * np.exp(-0.5 * ((bins - pos) / 2.0) ** 2)
+    for ratio in (0.97, 1.0, 1.013):
+        counts = np.zeros(len(bins))
+        for pos in (300.0, 1200.0, 2500.0, 5000.0):
+            counts += 1000.0 * np.exp(-0.5 * ((bins - pos * ratio) / 2.0) ** 2)
+        counts = rng.poisson(counts + 10.0)
+        assert EnergyCalibration.GainRatio(reference, counts) == pytest.approx(
+            ratio, abs=5e-4
+        )
@@ -19,15 +19,21 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+import os
 import re
 import sys
 
+import numpy as np
 import pytest
 
-from tests.helpers.utils import redirect_stdout, hdtvcmd
+from tests.helpers.utils import redirect_stdout, hdtvcmd, setup_io
 
 import hdtv.cmdline
 import hdtv.options
+import hdtv.database
+import hdtv.database.common
+import hdtv.database.compiled
+from hdtv.database import DDEPLibraries, IAEALibraries
 import hdtv.plugins.dblookup
 
 
@@ -105,6 +111,325 @@ def test_cmd_db_set(db):
     assert hdtv.options.Get("database.db") == db
 
 
+@pytest.mark.parametrize("db", ["promptgammas", "pgaalib_iki2000"])
+def test_db_find_indexed(db):
+    lib = hdtv.database.databases[db]()
+    for (args, check) in [
+        ({"energy": 511.0}, lambda g: abs(g.energy.nominal_value - 511.0) <= 1.0),
+        ({"z": 26}, lambda g: g.z == 26),
+        ({"symbol": "fe", "a": 56}, lambda g: g.symbol == "Fe" and g.a == 56),
+        (
+            {"symbol": "Cl", "energy": 1951.1},
+            lambda g: g.symbol == "Cl" and abs(g.energy.nominal_value - 1951.1) <= 1,
+        ),
+    ]:
+        results = lib.find(1.0, **args)
+        assert results
+        assert results == [g for g in lib if check(g)]
+
+
+@pytest.mark.parametrize("db", ["promptgammas", "pgaalib_iki2000"])
+def test_db_find_batch(db):
+    lib = hdtv.database.databases[db]()
+    energies = [0.0, 121.8, 511.0, 1293.6, 6018.5]
+    results = lib.find_batch(energies, 0.5, sort_key="energy")
+    assert len(results) == len(energies)
+    for (energy, found) in zip(energies, results):
+        assert found == lib.find(0.5, sort_key="energy", energy=energy)
+
+
+def test_db_lookup_energies():
+    f, ferr = setup_io(2)
+    with redirect_stdout(f, ferr):
+        hdtv.plugins.dblookup.database.LookupEnergies([0.0, 510.0])
+    assert "Database entries for energy 510.00" in f.getvalue()
+    assert "Found 0 results" in f.getvalue()
+    assert ferr.getvalue() == ""
+
+
 def count_results(query):
     f, ferr = hdtvcmd(query)
     return int(re.search(r"Found (\d+) results", f).groups()[0])
+
+
+@pytest.mark.parametrize("db", ["promptgammas", "pgaalib_iki2000"])
+def test_db_lazy_rows(db):
+    lib = hdtv.database.databases[db]()
+    lib.open()
+    assert len(lib._rows) <= 1
+    results = lib.find(0.5, energy=511.0)
+    assert results
+    assert len(lib._rows) <= len(results) + 1
+    assert lib[0] is lib[0]
+    assert len(lib[:3]) == 3
+
+
+def test_db_compiled(tmp_path):
+    lib = hdtv.database.PromptGammas()
+    table = hdtv.database.compiled.Parse(lib.csvfile, lib.columns)
+    assert table.dtype.names == ("a", "z", "energy", "energy_err") + (
+        "sigma",
+        "sigma_err",
+        "k0",
+        "k0_err",
+    )
+    lib.Compile(str(tmp_path))
+    fname = hdtv.database.compiled.Filename(
+        lib.csvfile, lib.columns, path=str(tmp_path)
+    )
+    compiled = np.load(fname, mmap_mode="r")
+    assert np.array_equal(compiled, table)
+
+
+def test_db_compiled_changed(tmp_path):
+    csvfile = str(tmp_path / "elements.dat")
+    with open(csvfile, "w") as f:
+        f.write("Z,Symbol,Name,Atomic Mass (u)\n1,H,Hydrogen,1.00794(7)\n")
+    elements = hdtv.database.common._Elements(csvfile)
+    assert elements(1).m.std_dev == pytest.approx(7e-5)
+    with open(csvfile, "a") as f:
+        f.write("2,He,Helium,n/a\n")
+    elements = hdtv.database.common._Elements(csvfile)
+    assert len(elements) == 2
+    assert elements(symbol="he").m is None
+
+
+def test_db_elements_list():
+    elements = hdtv.database.common._Elements()
+    assert isinstance(elements, list)
+    assert elements[0] is None
+    assert elements[1].symbol == "H"
+    assert elements[-1].Z == len(elements)
+    assert [element.Z for element in elements][:3] == [1, 2, 3]
+    assert elements(symbol="Fe") in elements
+    assert elements.index(elements[26]) == 25
+
+
+def test_db_compiled_stamp(tmp_path, monkeypatch):
+    monkeypatch.setattr(hdtv.database.compiled, "tabledir", str(tmp_path / "db"))
+    csvfile = str(tmp_path / "elements.dat")
+    with open(csvfile, "w") as f:
+        f.write("Z,Symbol,Name,Atomic Mass (u)\n1,H,Hydrogen,1.00794(7)\n")
+    columns = hdtv.database.common._Elements.columns
+    hashed = []
+    name = hdtv.database.compiled._Name
+    monkeypatch.setattr(
+        hdtv.database.compiled,
+        "_Name",
+        lambda *args: hashed.append(args) or name(*args),
+    )
+    hdtv.database.compiled.Load(csvfile, columns)
+    assert len(hashed) == 2
+    hdtv.database.compiled.Load(csvfile, columns)
+    assert len(hashed) == 2
+    with open(csvfile, "a") as f:
+        f.write("2,He,Helium,n/a\n")
+    assert len(hdtv.database.compiled.Load(csvfile, columns)) == 2
+
+
+def test_db_gammalib_default_gamma():
+    prompt = hdtv.database.PromptGammas()
+
+    class Lib(hdtv.database.common.GammaLib):
+        columns = prompt.columns
+        csvfile = prompt.csvfile
+        _has_header = True
+
+    lib = Lib()
+    lib.open()
+    prompt.open()
+    assert type(lib[0]) is hdtv.database.common.Gamma
+    assert lib[0].ID == prompt[0].ID
+    assert lib[0].sigma.nominal_value == prompt[0].sigma.nominal_value
+    assert lib[0].intensity is None
+
+
+def test_cmd_db_compile(tmp_path):
+    f, ferr = hdtvcmd("db compile -o {}".format(tmp_path))
+    assert "Compiled database tables" in f
+    assert ferr == ""
+    assert len(list(tmp_path.glob("*.npy"))) == 4
+
+
+LARA = (
+    "Nuclide ; Co-60\r\n"
+    "Half-life (s) ; 1.66349E+8 ; 0.00024E+8\r\n"
+    "Reference ; LNHB\r\n"
+    "------\r\n"
+    "Energy (keV) ; Ue (keV) ; Intensity (%) ; Ui (%) ; Type ; Origin\r\n"
+    "1173.228 ; 0.003 ; 99.85 ; 0.03 ; g ; Ni-60\r\n"
+    "1332.492 ; 0.004 ; 99.9826 ; 0.0006 ; g ; Ni-60\r\n"
+)
+
+
+@pytest.fixture
+def ddep(tmp_path, monkeypatch):
+    cache = DDEPLibraries.DDEPCache(str(tmp_path / "ddep.sqlite"))
+    monkeypatch.setattr(DDEPLibraries, "cache", cache)
+    laradir = tmp_path / "lara"
+    laradir.mkdir()
+    (laradir / "Co-60.lara.txt").write_text(LARA)
+    yield laradir
+    cache.Close()
+    hdtv.options.Reset("database.ddep.offline")
+    hdtv.options.Reset("database.ddep.ttl")
+    hdtv.options.Reset("database.ddep.retry")
+
+
+def fail_download(nuclide, timeout=30):
+    raise OSError("no network")
+
+
+def test_ddep_import_offline(ddep, monkeypatch):
+    monkeypatch.setattr(DDEPLibraries, "Download", fail_download)
+    assert DDEPLibraries.cache.Import([str(ddep)]) == ["Co-60"]
+    hdtv.options.Set("database.ddep.offline", "True")
+    data = DDEPLibraries.SearchNuclide("Co-60")
+    assert data["reference"] == "LNHB"
+    assert data["halflife"].nominal_value == pytest.approx(1.66349e8)
+    assert [t["energy"].nominal_value for t in data["transitions"]] == [
+        1173.228,
+        1332.492,
+    ]
+    with pytest.raises(hdtv.cmdline.HDTVCommandError):
+        DDEPLibraries.SearchNuclide("Cs-137")
+
+
+def test_ddep_import_old_file(ddep, monkeypatch):
+    downloads = list()
+
+    def download(nuclide, timeout=30):
+        downloads.append(nuclide)
+        return LARA
+
+    fname = ddep / "Co-60.lara.txt"
+    os.utime(fname, (0.0, 0.0))
+    DDEPLibraries.cache.Import([str(fname)])
+    monkeypatch.setattr(DDEPLibraries, "Download", download)
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "LNHB"
+    assert downloads == []
+
+
+def test_ddep_expired(ddep, monkeypatch):
+    downloads = list()
+
+    def download(nuclide, timeout=30):
+        downloads.append(nuclide)
+        return LARA.replace("LNHB", "new")
+
+    DDEPLibraries.cache.Put([("Co-60", LARA, 0.0)])
+    hdtv.options.Set("database.ddep.ttl", "0")
+    monkeypatch.setattr(DDEPLibraries, "Download", download)
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "LNHB"
+    assert downloads == []
+
+    # Expired entries are updated, or used as they are if the update fails
+    hdtv.options.Set("database.ddep.ttl", "1")
+    monkeypatch.setattr(DDEPLibraries, "Download", fail_download)
+    f, ferr = setup_io(2)
+    with redirect_stdout(f, ferr):
+        assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "LNHB"
+    assert "using cached data" in ferr.getvalue()
+
+    # After a failed update, the next one is only tried after
+    # database.ddep.retry hours, also in a new session
+    monkeypatch.setattr(DDEPLibraries, "Download", download)
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "LNHB"
+    DDEPLibraries.cache.Close()
+    monkeypatch.setattr(
+        DDEPLibraries, "cache", DDEPLibraries.DDEPCache(DDEPLibraries.cache.path)
+    )
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "LNHB"
+    assert downloads == []
+
+    hdtv.options.Set("database.ddep.retry", "0")
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "new"
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "new"
+    assert downloads == ["Co-60"]
+    DDEPLibraries.cache.Close()
+
+
+def test_ddep_parse_once(ddep, monkeypatch):
+    parsed = list()
+    parse = DDEPLibraries.ParseTable
+
+    def parse_table(data):
+        parsed.append(data)
+        return parse(data)
+
+    DDEPLibraries.cache.Import([str(ddep)])
+    monkeypatch.setattr(DDEPLibraries, "ParseTable", parse_table)
+    first = DDEPLibraries.SearchNuclide("Co-60")
+    second = DDEPLibraries.SearchNuclide("Co-60")
+    assert len(parsed) == 1
+    assert first["reference"] == second["reference"] == "LNHB"
+    # Fresh ufloats for every lookup
+    (e1, e2) = (first["transitions"][0]["energy"], second["transitions"][0]["energy"])
+    assert e1.nominal_value == e2.nominal_value == 1173.228
+    assert (e1 - e2).std_dev == pytest.approx(2**0.5 * e1.std_dev)
+
+    # Updated tables are parsed again
+    DDEPLibraries.cache.Put([("Co-60", LARA.replace("LNHB", "new"), None)])
+    assert DDEPLibraries.SearchNuclide("Co-60")["reference"] == "new"
+    assert len(parsed) == 2
+
+
+def test_ddep_prefetch(ddep, monkeypatch):
+    downloads = list()
+
+    def download(nuclide, timeout=30):
+        if nuclide == "Xx-1":
+            raise OSError("not found")
+        downloads.append(nuclide)
+        return LARA
+
+    monkeypatch.setattr(DDEPLibraries, "Download", download)
+    DDEPLibraries.cache.Import([str(ddep / "Co-60.lara.txt")])
+    errors = DDEPLibraries.cache.Prefetch(["Co-60", "Cs-137", "Ra-226", "Xx-1"], 4)
+    assert list(errors) == ["Xx-1"]
+    assert sorted(downloads) == ["Cs-137", "Ra-226D"]
+    assert [n for (n, _) in DDEPLibraries.cache.List()] == [
+        "Co-60",
+        "Cs-137",
+        "Ra-226D",
+    ]
+    DDEPLibraries.cache.Prefetch(["Co-60"], refresh=True)
+    assert sorted(downloads) == ["Co-60", "Cs-137", "Ra-226D"]
+
+
+def test_cmd_db_ddep(ddep):
+    f, ferr = hdtvcmd("db ddep import {}".format(ddep), "db ddep list")
+    assert ferr == ""
+    assert "Imported 1 nuclides" in f
+    assert "Co-60" in f
+    f, ferr = hdtvcmd("db ddep clear", "db ddep list")
+    assert ferr == ""
+    assert "0 nuclides in DDEP cache" in f
+
+
+def test_iaea_search_nuclide():
+    data = IAEALibraries.SearchNuclide("Co-60")
+    assert data["nuclide"] == "Co-60"
+    assert [round(t["energy"].nominal_value) for t in data["transitions"]] == [
+        1173,
+        1332,
+    ]
+    assert data["halflife"].std_dev > 0
+    # Results are independent copies
+    data["transitions"].clear()
+    assert IAEALibraries.SearchNuclide("Co-60")["transitions"]
+    with pytest.raises(hdtv.cmdline.HDTVCommandError):
+        IAEALibraries.SearchNuclide("Xx-1")
+
+
+def test_iaea_index():
+    index = IAEALibraries.BuildIndex(os.path.join(hdtv.datadir, "IAEA.json"))
+    assert index["Co-60"]["nuclide"] == "Co-60"
+    assert IAEALibraries.GetIndex() is IAEALibraries.GetIndex()
+
+
+def test_iaea_independent_lookups():
+    first = IAEALibraries.SearchNuclide("Co-60")["transitions"][0]["energy"]
+    second = IAEALibraries.SearchNuclide("Co-60")["transitions"][0]["energy"]
+    assert first.nominal_value == second.nominal_value
+    assert (first - second).std_dev == pytest.approx(2**0.5 * first.std_dev)
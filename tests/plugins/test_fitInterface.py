@@ -110,6 +110,70 @@ def test_cmd_fit_peakfind():
     assert "WARNING: Adding invalid fit" in ferr
 
 
+@pytest.mark.parametrize(
+    "args",
+    ["", "-S 5", "-w 6.25", "-w 4,0.003", "-s 2 -t 0.01 1000 2000"],
+)
+def test_cmd_fit_peakfind_native(args):
+    spec_interface.LoadSpectra(testspectrum)
+    f, ferr = hdtvcmd(f"fit peakfind -e native {args}")
+    assert ferr == ""
+    assert "Search Peaks in region" in f
+    assert "significance" in f
+    assert re.search(r"Found [1-9][0-9]* peaks", f)
+
+
+def test_cmd_fit_peakfind_engine_option():
+    spec_interface.LoadSpectra(testspectrum)
+    # The native engine is opt-in
+    assert hdtv.options.Get("fit.peakfind.engine") == "tspectrum"
+    hdtv.options.Set("fit.peakfind.engine", "native")
+    try:
+        f, ferr = hdtvcmd("fit peakfind -t 0.01")
+    finally:
+        hdtv.options.Reset("fit.peakfind.engine")
+    assert "width: " in f
+    assert "significance" in f
+
+
+def test_cmd_fit_peakfind_jobs():
+    assert hdtv.options.Get("fit.peakfind.jobs") == 1
+    spec_interface.LoadSpectra(testspectrum)
+    results = []
+    for jobs in [1, 4]:
+        f, ferr = hdtvcmd(f"fit peakfind -e native -a -t 0.01 -j {jobs}")
+        assert "Fitted" in f
+        spec = spectra.dict[spectra.activeID]
+        results.append(
+            [
+                (peak.pos.nominal_value, peak.vol.nominal_value)
+                for fit in spec.dict.values()
+                for peak in fit.peaks
+            ]
+        )
+        hdtvcmd("fit delete all")
+    assert results[0]
+    assert results[0] == results[1]
+
+
+def test_cmd_fit_peakfind_continuum():
+    spec_interface.LoadSpectra(testspectrum)
+    f, ferr = hdtvcmd("fit peakfind -e native -c -t 0.01")
+    assert ferr == ""
+    assert re.search(r"Found [1-9][0-9]* peaks", f)
+    assert spectra.dict[spectra.activeID].hist.continuum is not None
+
+
+def test_cmd_fit_peakfind_width_from_fits():
+    spec_interface.LoadSpectra(testspectrum)
+    f, ferr = hdtvcmd("fit peakfind -e native -W")
+    assert "No fitted peaks" in ferr
+    hdtvcmd("fit peakfind -e native -a -t 0.05 1000 1500")
+    f, ferr = hdtvcmd("fit peakfind -e native -W -t 0.05")
+    assert "sigma(E)^2" in f
+    assert re.search(r"Found [1-9][0-9]* peaks", f)
+
+
 @pytest.mark.filterwarnings("ignore::RuntimeWarning")
 @pytest.mark.parametrize("peak", ["theuerkauf", "ee"])
 @pytest.mark.parametrize("bg", ["polynomial", "exponential", "interpolation"])
@@ -170,6 +234,27 @@ def test_cmd_fit_copy():
     assert workFit.fitter == newFit.fitter
 
 
+@pytest.mark.parametrize("integrate", ["True", "False"])
+def test_cmd_fit_snip_background(integrate):
+    spec_interface.LoadSpectra(testspectrum)
+    f, ferr = hdtvcmd(
+        "fit function background activate snip",
+        f"fit parameter integrate {integrate}",
+        "fit marker peak set 580",
+        "fit marker peak set 610",
+        "fit marker region set 570",
+        "fit marker region set 615",
+        "fit execute",
+    )
+    assert ferr == ""
+    assert "2 peaks in WorkFit" in f
+    fit = spectra.workFit
+    assert fit.fitter.bgFitter is spectra.dict[spectra.activeID].hist.continuum
+    assert fit.integral["bg"] is not None
+    f, ferr = hdtvcmd("fit store", "fit integral execute 0")
+    assert ferr == ""
+
+
 def test_interpolation_incomplete():
     spec_interface.LoadSpectra(testspectrum)
     assert len(spec_interface.spectra.dict) == 1
@@ -21,6 +21,7 @@
 
 import os
 
+import numpy as np
 import pytest
 
 from tests.helpers.utils import redirect_stdout, hdtvcmd
@@ -102,3 +103,50 @@ def test_cmd_fit_position_map_overwrite():
     assert ferr == ""
     assert "Mapped 0 energies to peaks" in f
     assert count_peak_positions() == 0
+
+
+def brute_force_nearest(positions, errors, energies, tolerance):
+    matches = list()
+    for (i, (pos, err)) in enumerate(zip(positions, errors)):
+        z = [abs(e - pos) / err for e in energies]
+        j = min(range(len(energies)), key=lambda j: z[j])
+        if z[j] < tolerance:
+            matches.append((i, j))
+    return matches
+
+
+def test_match_positions_nearest():
+    rng = np.random.default_rng(7)
+    energies = rng.uniform(0.0, 3000.0, 500)
+    positions = rng.uniform(0.0, 3000.0, 200)
+    errors = rng.uniform(0.1, 2.0, 200)
+    assert hdtv.plugins.fitmap.MatchPositions(
+        positions, errors, energies, 3.0
+    ) == brute_force_nearest(positions, errors, energies, 3.0)
+
+
+@pytest.mark.parametrize("method", ["greedy", "optimal"])
+def test_match_positions_one_to_one(method):
+    # Peaks 0 and 1 are both nearest to 100.0
+    positions = [100.2, 100.6, 300.0]
+    errors = [0.5, 0.5, 0.5]
+    energies = [300.1, 101.5, 100.0, 500.0]
+    assert hdtv.plugins.fitmap.MatchPositions(positions, errors, energies, 3.0) == [
+        (0, 2),
+        (1, 2),
+        (2, 0),
+    ]
+    matches = hdtv.plugins.fitmap.MatchPositions(
+        positions, errors, energies, 3.0, method
+    )
+    assert matches == [(0, 2), (1, 1), (2, 0)]
+
+
+def test_match_positions_optimal():
+    # Greedy takes the best pair (1, 0) first and leaves peak 0 unmatched
+    positions = [100.0, 101.0]
+    errors = [1.0, 1.0]
+    energies = [101.1, 102.5]
+    match = hdtv.plugins.fitmap.MatchPositions
+    assert match(positions, errors, energies, 2.0, "greedy") == [(1, 0)]
+    assert match(positions, errors, energies, 2.0, "optimal") == [(0, 0), (1, 1)]
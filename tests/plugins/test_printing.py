@@ -49,6 +49,8 @@ import hdtv.plugins.printing
 @pytest.fixture(autouse=True)
 def prepare():
     hdtv.options.Set("ui.out.level", "3")
+    yield
+    hdtv.options.Reset("ui.out.level")
 
 
 def test_cmd_printing():
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2019  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import os
+import shutil
+
+import pytest
+
+from tests.helpers.utils import setup_io, redirect_stdout, hdtvcmd
+
+from hdtv.util import monkey_patch_ui
+
+monkey_patch_ui()
+
+import hdtv.cal
+import hdtv.cmdline
+import hdtv.options
+import hdtv.session
+import hdtv.snapshot
+
+import __main__
+
+try:
+    if not hasattr(__main__, "spectra"):
+        __main__.spectra = hdtv.session.Session()
+except RuntimeError:
+    pass
+
+from hdtv.plugins.specInterface import spec_interface
+from hdtv.plugins.fitInterface import fit_interface
+import hdtv.plugins.sessionInterface
+
+spectra = __main__.spectra
+
+testspectrum = os.path.join(os.path.curdir, "tests", "share", "osiris_bg.spc")
+
+
+@pytest.fixture(autouse=True)
+def prepare():
+    fit_interface.ResetFitterParameters()
+    hdtv.options.Set("table", "classic")
+    hdtv.options.Set("uncertainties", "short")
+    spectra.Clear()
+    yield
+    spectra.Clear()
+    hdtv.options.Reset("fit.display.decomp")
+
+
+def list_fits():
+    f, ferr = setup_io(2)
+    with redirect_stdout(f, ferr):
+        fit_interface.ListFits()
+        fit_interface.ListIntegrals()
+    return f.getvalue().strip()
+
+
+def fit(sid, peaks, ID=None):
+    spectra.ActivateObject(sid)
+    for peak in peaks:
+        spectra.SetMarker("region", peak - 10)
+        spectra.SetMarker("region", peak + 10)
+        spectra.SetMarker("peak", peak)
+        spectra.ExecuteFit()
+        spectra.StoreFit(ID)
+        spectra.ClearFit()
+
+
+def test_cmd_session_save_load(tmp_path):
+    shutil.copy(testspectrum, tmp_path / "a.spc")
+    shutil.copy(testspectrum, tmp_path / "b.spc")
+    spec_interface.LoadSpectra(str(tmp_path / "a.spc"))
+    spec_interface.LoadSpectra(str(tmp_path / "b.spc"), ID=hdtv.util.ID(5))
+    spectra.ApplyCalibration("5", [1.0, 0.5])
+    fit("0", [511.0, 1460.0])
+    fit("5", [256.0])
+    fit("5", [730.0], ID="3")
+    hdtv.options.Set("fit.display.decomp", "True")
+
+    original = dict()
+    for sid in spectra.ids:
+        spectra.ActivateObject(sid)
+        original[sid] = list_fits()
+    spectra.ActivateObject("0")
+    spectra.HideObjects(hdtv.util.ID(5))
+
+    f, ferr = hdtvcmd("session save %s" % (tmp_path / "session"))
+    assert ferr == ""
+    fname = tmp_path / "session.hdtvs"
+    assert os.path.exists(fname)
+
+    # The spectra are not needed to restore the session
+    os.remove(tmp_path / "a.spc")
+    os.remove(tmp_path / "b.spc")
+    spectra.Clear()
+    hdtv.options.Reset("fit.display.decomp")
+    f, ferr = hdtvcmd("session load %s" % fname)
+    assert ferr == ""
+    assert "Restored 2 spectra, 0 matrices and 4 fits" in f
+
+    assert hdtv.options.Get("fit.display.decomp") is True
+    assert spectra.activeID == hdtv.util.ID(0)
+    assert spectra.visible == {hdtv.util.ID(0)}
+    assert spectra.GetIDByName("b.spc") == hdtv.util.ID(5)
+    assert hdtv.cal.GetCoeffs(spectra.caldict["b.spc"]) == [1.0, 0.5]
+    assert sorted(spectra.dict[hdtv.util.ID(5)].ids) == [
+        hdtv.util.ID(0),
+        hdtv.util.ID(3),
+    ]
+    for (sid, listing) in original.items():
+        spectra.ActivateObject(sid)
+        assert list_fits() == listing
+
+
+def test_snapshot_lazy_spectrum(tmp_path):
+    # The last spectrum is activated, and thus read
+    spec_interface.LoadSpectra([testspectrum, testspectrum], lazy=True)
+    assert not spectra.dict[hdtv.util.ID(0)].loaded
+    fname = str(tmp_path / "session.hdtvs")
+    hdtv.snapshot.Save(spectra, fname)
+    spectra.Clear()
+    hdtv.snapshot.Load(spectra, fname)
+    spec = spectra.dict[hdtv.util.ID(0)]
+    assert not spec.loaded
+    assert spec.name == "osiris_bg.spc"
+    assert spectra.dict[hdtv.util.ID(1)].loaded
+
+
+def test_snapshot_newer_version(tmp_path):
+    spec_interface.LoadSpectra(testspectrum)
+    fname = str(tmp_path / "session.hdtvs")
+    hdtv.snapshot.Save(spectra, fname)
+    with open(fname, "r+b") as f:
+        f.seek(8)
+        f.write(b"\xff")
+    with pytest.raises(hdtv.cmdline.HDTVCommandError):
+        hdtv.snapshot.Load(spectra, fname)
+    assert len(spectra) == 1
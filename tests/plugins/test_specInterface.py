@@ -31,6 +31,7 @@ import pytest
 from tests.helpers.utils import redirect_stdout, hdtvcmd
 from tests.helpers.fixtures import temp_file
 
+from hdtv.peaksearch import WidthModel
 from hdtv.util import monkey_patch_ui
 
 monkey_patch_ui()
@@ -114,6 +115,38 @@ def test_cmd_spectrum_get_multi(specfiles):
     assert len(s.spectra.dict) == len(specfiles)
 
 
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_cmd_spectrum_get_jobs(jobs):
+    query = " ".join([testspectrum] * 8 + ["tests/share/osiris_bg.cal"])
+    f, ferr = hdtvcmd("spectrum get -j {} {}".format(jobs, query))
+    assert ferr == ""
+    assert len(s.spectra.dict) == 9
+    assert f.endswith("Loaded tests/share/osiris_bg.cal into 8")
+    hists = [s.spectra.dict[ID].hist.hist for ID in s.spectra.ids[:8]]
+    for hist in hists[1:]:
+        assert hist.GetNbinsX() == hists[0].GetNbinsX()
+        assert hist.Integral() == hists[0].Integral()
+
+
+def test_cmd_spectrum_get_lazy():
+    f, ferr = hdtvcmd("spectrum get -l {} {}".format(testspectrum, testspectrum))
+    assert "WARNING" not in ferr
+    assert len(s.spectra.dict) == 2
+    spec = s.spectra.dict[s.spectra.ids[0]]
+    assert not spec.loaded
+    assert spec.name == "osiris_bg.spc"
+    assert spec.nbins == 8192
+    f, ferr = hdtvcmd("spectrum info {}".format(s.spectra.ids[0]))
+    assert "not read yet" in f
+    assert not spec.loaded
+    assert spec.hist.hist.GetNbinsX() == spec.nbins
+    assert spec.loaded
+    assert spec.hist.hist.GetName() == "osiris_bg.spc"
+    f, ferr = hdtvcmd("spectrum add 2 all")
+    assert "ERROR" not in ferr
+    assert s.spectra.dict[s.spectra.ids[1]].loaded
+
+
 @pytest.mark.parametrize("numspecs", [1, 10])
 def test_cmd_spectrum_list(numspecs):
     assert len(s.spectra.dict) == 0
@@ -283,6 +316,48 @@ def test_cmd_spectrum_rebin(ngroup):
         assert get_spec(0).hist.hist.GetNbinsX() == 8192 // ngroup
 
 
+@pytest.mark.parametrize("args", ["", "-s 3", "-w 4,0.003 -n 5"])
+def test_cmd_spectrum_background(args):
+    hdtvcmd("spectrum get {}".format(testspectrum))
+    f, ferr = hdtvcmd("spectrum background {} 0".format(args))
+    assert ferr == ""
+    assert "Estimated continuum of spectrum 0" in f
+    assert "Inserted continuum of spectrum 0 as spectrum 1" in f
+    assert len(s.spectra.dict) == 2
+    continuum = get_spec(0).hist.continuum
+    assert continuum is not None
+    spec, bg = get_spec(0).hist.hist, get_spec(1).hist.hist
+    assert bg.GetNbinsX() == spec.GetNbinsX()
+    for b in range(1, spec.GetNbinsX() + 1, 97):
+        assert 0 <= bg.GetBinContent(b) <= spec.GetBinContent(b) + 1e-6
+        assert continuum.Eval(spec.GetBinCenter(b)) == pytest.approx(
+            bg.GetBinContent(b)
+        )
+
+
+def test_cmd_spectrum_background_no_insert():
+    hdtvcmd("spectrum get {}".format(testspectrum))
+    f, ferr = hdtvcmd("spectrum background -q")
+    assert ferr == ""
+    assert len(s.spectra.dict) == 1
+    assert get_spec(0).hist.continuum is not None
+    hdtvcmd("spectrum multiply 0 2")
+    assert get_spec(0).hist.continuum is None
+
+
+def test_continuum_cache():
+    hdtvcmd("spectrum get {}".format(testspectrum), "spectrum background -q -s 3")
+    hist = get_spec(0).hist
+    continuum = hist.continuum
+    assert hist.GetContinuum() is continuum
+    assert hist.GetContinuum(WidthModel.Constant(3.0)) is continuum
+    assert hist.GetContinuum(WidthModel.Constant(2.0)) is not continuum
+    continuum = hist.continuum
+    get_spec(0).cal = [0.0, 0.5]
+    assert hist.continuum is None
+    assert hist.GetContinuum() is not continuum
+
+
 @pytest.mark.parametrize("binsize", [1, 0.5, 1.1])
 def test_cmd_spectrum_calbin_binsize(binsize):
     assert len(s.spectra.dict) == 0